@@ -11,20 +11,83 @@ Student: John Fuentes
 # Import statements
 from marshmallow.exceptions import ValidationError
 from sqlalchemy.exc import IntegrityError
-from flask import render_template_string
-from init import app
-from blueprints.cli_bp import db_commands
+from flask import Flask, render_template_string
+from init import load_config, init_extensions
+from encoding import APIJSONProvider, APIRequest
+from profiling import init_profiling
+from compression import init_compression
+from ingredient_index import init_ingredient_index
+from similarity import init_similarity
+from suggest_index import init_suggest_index
+from recipe_stats import init_recipe_stats
+from blueprints.cli_bp import db_commands, user_commands
 from blueprints.users_bp import users_bp
 from blueprints.categories_bp import categories_bp
 from blueprints.recipes_bp import recipes_bp
+from blueprints.metrics_bp import metrics_bp
+from blueprints.admin_bp import admin_bp
+from blueprints.stats_bp import stats_bp
 
-# Register the blueprints with the Flask application
-app.register_blueprint(db_commands)
-app.register_blueprint(users_bp)
-app.register_blueprint(categories_bp)
-app.register_blueprint(recipes_bp)
+def create_app():
+    """
+    Application factory that creates and configures the Flask application.
+
+    Building the application in a function (rather than at import) lets gunicorn preload it
+    once in the master process and share its memory with the forked workers; see
+    gunicorn.conf.py for the fork-safe engine disposal and warmup of each worker.
+
+    Returns:
+        Flask: The configured Flask application.
+    """
+    # Initialize Flask application by creating an instance of Flask class
+    app = Flask(__name__)
+
+    # Encode responses as JSON or MessagePack and accept MessagePack request bodies
+    app.json = APIJSONProvider(app)
+    app.request_class = APIRequest
+
+    # Load the configuration and bind the extensions to the application
+    load_config(app)
+    init_extensions(app)
+
+    # Register the blueprints with the Flask application
+    app.register_blueprint(db_commands)
+    app.register_blueprint(user_commands)
+    app.register_blueprint(users_bp)
+    app.register_blueprint(categories_bp)
+    app.register_blueprint(recipes_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(stats_bp)
+
+    # Keep the ingredient index of the "what can I cook" search up to date
+    init_ingredient_index(app)
+
+    # Keep the MinHash signatures of the similar recipe recommendations up to date
+    init_similarity(app)
+
+    # Keep the prefix index of the search box completions up to date
+    init_suggest_index(app)
+
+    # Keep the counters of the /stats endpoint up to date
+    init_recipe_stats(app)
+
+    # Register the index route and the error handlers
+    app.add_url_rule('/', view_func=index)
+    app.register_error_handler(404, not_found)
+    app.register_error_handler(405, method_not_allowed)
+    app.register_error_handler(KeyError, missing_key)
+    app.register_error_handler(ValidationError, invalid_request)
+    app.register_error_handler(IntegrityError, handle_integrity_error)
+
+    # Profile requests on demand (X-Profile header from an admin) or at the configured sampling rate
+    init_profiling(app)
+
+    # Compress responses with the best encoding the client accepts (registered last to run first)
+    init_compression(app)
+
+    return app
 
-@app.route('/')
 def index():
     """
     Renders the index page of the Flask Recipe API.
@@ -43,7 +106,6 @@ def index():
     '''
     return render_template_string(html_content)
 
-@app.errorhandler(404)
 def not_found(_):
     """
     This function is called when a 404 error is raised.
@@ -58,7 +120,6 @@ def not_found(_):
     """
     return {'error': 'Not Found'}, 404
 
-@app.errorhandler(405)
 def method_not_allowed(_):
     """
     This function is called when a 405 error is raised.
@@ -72,7 +133,6 @@ def method_not_allowed(_):
     """
     return {'error': 'Method Not Allowed'}, 405
 
-@app.errorhandler(KeyError)
 def missing_key(err):
     """
     This function handles KeyError exceptions by returning a JSON response
@@ -87,7 +147,6 @@ def missing_key(err):
     """
     return {"error": f"Missing field: {str(err)}"}, 400
 
-@app.errorhandler(ValidationError)
 def invalid_request(err):
     """
     This function handles ValidationError exceptions by returning a JSON response
@@ -117,7 +176,6 @@ def invalid_request(err):
 #     """
 #     return {'error': 'The provided title already exists. Please choose a different title.'}, 400
 
-@app.errorhandler(IntegrityError)
 def handle_integrity_error(err):
     """
     Error handler for IntegrityError exceptions.
@@ -141,6 +199,3 @@ def handle_integrity_error(err):
     else:
         # Return a generic error message for other IntegrityError cases
         return {'error': 'Database integrity error', 'message': str(err.orig)}, 400
-
-# Print all routes with endpoints that are registered in the app
-print(app.url_map)
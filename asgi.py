@@ -0,0 +1,284 @@
+"""
+This module provides an optional ASGI serving mode for the read-heavy public endpoints.
+
+The public recipe and category reads run on async SQLAlchemy (asyncpg for PostgreSQL,
+aiosqlite for SQLite), so a single process can hold thousands of slow clients open while
+waiting on the database instead of tying up a sync worker per client. They share the models
+in models/, the response shapes of RecipeSchema and CategorySchema, the ordering and the ETags
+with the Flask routes, so a client can switch between the two modes without refetching.
+Every other path is passed to the Flask application, which runs in a thread pool.
+
+Run it with uvicorn (see requirements-asgi.txt):
+    uvicorn --factory asgi:create_asgi_app --host 0.0.0.0 --port 8000
+"""
+
+# Import statements
+import time
+from contextlib import asynccontextmanager
+from os import environ
+from a2wsgi import WSGIMiddleware
+from anyio import to_thread
+from sqlalchemy import select, func
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag
+from app import create_app
+from init import warmup
+from db_routing import STICKY_COOKIE
+from metrics import inc, observe
+from encoding import MSGPACK_MIMETYPE, preferred_format, packb
+from cache import body_etag
+from compression import AVAILABLE_ENCODINGS, LEVEL_SETTINGS, negotiate, compress, set_encoded_headers
+from models.recipe import Recipe, RecipeSchema, recipe_load_options
+from models.category import Category, CategorySchema
+
+# Async drivers used for each database backend
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+
+def async_database_uri(uri):
+    """
+    Convert a database URI to use the async driver of its backend,
+    e.g. postgresql://... to postgresql+asyncpg://...
+
+    Args:
+        uri (str): The database URI used by the Flask application.
+
+    Returns:
+        str: The database URI for the async engine.
+    """
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver is configured for the '{backend}' database backend.")
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}').render_as_string(hide_password=False)
+
+
+def create_async_database_engine(uri, config):
+    """
+    Create an async engine with the pool settings of the Flask application's engines.
+
+    Args:
+        uri (str): The database URI used by the Flask application.
+        config (dict): The Flask application configuration.
+
+    Returns:
+        AsyncEngine: The async SQLAlchemy engine.
+    """
+    options = dict(config['SQLALCHEMY_ENGINE_OPTIONS'])
+
+    # asyncpg takes server settings instead of libpq's "options" connection argument
+    connect_args = options.pop('connect_args', {})
+    if 'options' in connect_args:
+        timeout = connect_args['options'].split('statement_timeout=', 1)[1]
+        options['connect_args'] = {'server_settings': {'statement_timeout': timeout}}
+
+    # aiosqlite opens a connection per session (NullPool), which has no pool to size
+    if make_url(uri).get_backend_name() == 'sqlite':
+        for key in ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle'):
+            options.pop(key, None)
+
+    return create_async_engine(async_database_uri(uri), **options)
+
+
+class AsyncReadAPI:
+    """
+    The async handlers of the public read endpoints.
+
+    Attributes:
+        json (JSONProvider): The Flask application's JSON provider, so responses are encoded identically.
+        sessions (async_sessionmaker): Creates sessions on the primary database.
+        replica_sessions (async_sessionmaker): Creates sessions on the read replica (None if not configured).
+    """
+    def __init__(self, flask_app):
+        self.json = flask_app.json
+        self.config = config = flask_app.config
+
+        # Objects are only read and serialized, so they don't need to expire after a commit
+        self.engines = [create_async_database_engine(config['SQLALCHEMY_DATABASE_URI'], config)]
+        self.sessions = async_sessionmaker(self.engines[0], expire_on_commit=False)
+
+        # Read from the replica when one is configured, like the Flask read routes
+        self.replica_sessions = None
+        replica_uri = config.get('SQLALCHEMY_BINDS', {}).get('replica')
+        if replica_uri:
+            self.engines.append(create_async_database_engine(replica_uri, config))
+            self.replica_sessions = async_sessionmaker(self.engines[1], expire_on_commit=False)
+
+    def session(self, request):
+        """
+        Open a session on the replica, or on the primary if there is no replica or the
+        client wrote recently (see the sticky cookie in db_routing.py).
+
+        Args:
+            request (Request): The incoming request.
+
+        Returns:
+            AsyncSession: A new async session.
+        """
+        try:
+            pinned_until = float(request.cookies.get(STICKY_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        if self.replica_sessions is None or pinned_until > time.time():
+            return self.sessions()
+        return self.replica_sessions()
+
+    def respond(self, request, data, status_code=200, cached=False):
+        """
+        Encode data as a JSON or MessagePack response, matching the encoding, compression and
+        ETags of the Flask application.
+
+        Args:
+            request (Request): The incoming request, for the Accept, Accept-Encoding and If-None-Match headers.
+            data (dict or list): The data to encode.
+            status_code (int): The HTTP status code.
+            cached (bool): Whether the Flask route is cached (see cache.py), and so answers with
+                an ETag and 304 Not Modified when the client already has the response.
+
+        Returns:
+            Response: The JSON or MessagePack response.
+        """
+        if preferred_format(parse_accept_header(request.headers.get('accept'), MIMEAccept)) == 'msgpack':
+            body, media_type = packb(data, self.json.default), MSGPACK_MIMETYPE
+        else:
+            body, media_type = (self.json.dumps(data, separators=(',', ':')) + '\n').encode(), 'application/json'
+        headers = {'Vary': 'Accept, Accept-Encoding'}
+
+        config = self.config
+        if cached and status_code == 200 and config['RESPONSE_CACHE_TTL']:
+            etag = body_etag(body)
+            headers['ETag'] = quote_etag(etag)
+            if parse_etags(request.headers.get('if-none-match')).contains_weak(etag):
+                return Response(status_code=304, headers=headers)
+
+        encoding = None
+        if config['COMPRESS_ENABLED'] and len(body) >= config['COMPRESS_MIN_SIZE']:
+            allowed = tuple(encoding for encoding in config['COMPRESS_ENCODINGS'] if encoding in AVAILABLE_ENCODINGS)
+            encoding = negotiate(parse_accept_header(request.headers.get('accept-encoding')), allowed)
+            if encoding:
+                body = compress(body, encoding, config[LEVEL_SETTINGS[encoding]])
+        response = Response(body, status_code=status_code, headers=headers, media_type=media_type)
+        if encoding:
+            set_encoded_headers(response, encoding)
+        return response
+
+    async def all_public_recipes(self, request):
+        """
+        Route to fetch all public recipes from the database.
+
+        Returns:
+            Response: A JSON list of all public recipes.
+        """
+        async with self.session(request) as session:
+            result = await session.scalars(
+                select(Recipe).options(*recipe_load_options()).filter_by(is_public=True).order_by(Recipe.recipe_id)
+            )
+            recipes = result.all()
+        return self.respond(request, RecipeSchema(many=True).dump(recipes), cached=True)
+
+    async def random_recipe(self, request):
+        """
+        Retrieve a random public recipe, selected by the database.
+
+        Returns:
+            Response: A JSON representation of a random public recipe.
+        """
+        async with self.session(request) as session:
+            recipe = await session.scalar(
+                select(Recipe).options(*recipe_load_options()).filter_by(is_public=True).order_by(func.random()).limit(1)
+            )
+        if recipe is None:
+            return self.respond(request, {"message": "No public recipes found"}, 404)
+        return self.respond(request, RecipeSchema().dump(recipe))
+
+    async def all_categories(self, request):
+        """
+        Route to fetch all categories from the database.
+
+        Returns:
+            Response: A JSON list of all categories.
+        """
+        async with self.session(request) as session:
+            categories = (await session.scalars(select(Category).order_by(Category.category_id))).all()
+        if not categories:
+            return self.respond(request, {"error": "No categories found."}, 404)
+        return self.respond(request, CategorySchema(many=True).dump(categories), cached=True)
+
+    async def one_category(self, request):
+        """
+        Retrieve a category record by its ID.
+
+        Returns:
+            Response: A JSON representation of the category.
+        """
+        async with self.session(request) as session:
+            category = await session.get(Category, request.path_params['category_id'])
+        if category is None:
+            return self.respond(request, {'error': 'Not Found'}, 404)
+        return self.respond(request, CategorySchema().dump(category), cached=True)
+
+    async def dispose(self):
+        """
+        Close the connections of the async engines.
+        """
+        for engine in self.engines:
+            await engine.dispose()
+
+
+def timed(blueprint, rule, handler):
+    """
+    Wrap an async handler to record the same request metrics as the Flask routes.
+
+    Args:
+        blueprint (str): The name of the Flask blueprint serving the same route.
+        rule (str): The route rule in Flask notation, used as the route label.
+        handler (callable): The async request handler.
+
+    Returns:
+        callable: The wrapped handler.
+    """
+    async def endpoint(request):
+        labels = (('blueprint', blueprint), ('route', rule), ('method', request.method))
+        started = time.perf_counter()
+        inc('http_requests_in_flight')
+        try:
+            response = await handler(request)
+        finally:
+            inc('http_requests_in_flight', value=-1)
+        inc('http_requests_total', labels + (('status', str(response.status_code)),))
+        observe('http_request_duration_seconds', labels, time.perf_counter() - started)
+        return response
+    return endpoint
+
+
+def create_asgi_app():
+    """
+    Application factory of the ASGI mode: the async read routes in front of the Flask application.
+
+    Returns:
+        Starlette: The ASGI application.
+    """
+    flask_app = create_app()
+    api = AsyncReadAPI(flask_app)
+
+    @asynccontextmanager
+    async def lifespan(_):
+        # Run the Flask warmup hooks and fill its pool without blocking the event loop
+        await to_thread.run_sync(warmup, flask_app)
+        yield
+        await api.dispose()
+
+    routes = [
+        Route('/recipes/public', timed('recipes', '/recipes/public', api.all_public_recipes), methods=['GET']),
+        Route('/recipes/public/random', timed('recipes', '/recipes/public/random', api.random_recipe), methods=['GET']),
+        Route('/categories/', timed('categories', '/categories/', api.all_categories), methods=['GET']),
+        Route('/categories/{category_id:int}', timed('categories', '/categories/<int:category_id>', api.one_category), methods=['GET']),
+        # All other routes, including writes and authenticated reads, are served by Flask in a thread pool
+        Mount('/', app=WSGIMiddleware(flask_app, workers=int(environ.get("ASGI_WSGI_THREADS", 10)))),
+    ]
+    return Starlette(routes=routes, lifespan=lifespan)
@@ -1,12 +1,37 @@
 """
-This module defines a route decorator to ensure that only admin users can access certain routes.
+This module defines the route decorator requiring a JWT, and the checks that only admin users
+or the author of a recipe can access certain routes.
 """
 
 # Import statements
-from flask import abort, jsonify, make_response
-from flask_jwt_extended import get_jwt_identity
+from functools import wraps
+from flask import abort, current_app, jsonify, make_response
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
 from init import db
 from models.user import User
+from tracing import span
+
+def jwt_required(optional=False, **options):
+    """
+    Route decorator requiring a valid JWT in the request, like flask_jwt_extended.jwt_required,
+    that also records the verification as a span of the request trace.
+
+    Args:
+        optional (bool): Whether a request without a JWT is allowed.
+        **options: The other arguments of flask_jwt_extended.verify_jwt_in_request
+            (fresh, refresh, locations, verify_type, skip_revocation_check).
+
+    Returns:
+        callable: The decorator.
+    """
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            with span('jwt.verify'):
+                verify_jwt_in_request(optional=optional, **options)
+            return current_app.ensure_sync(fn)(*args, **kwargs)
+        return decorator
+    return wrapper
 
 # Ensure that the JWT user is the author of the given recipe
 def authorize_owner(recipe):
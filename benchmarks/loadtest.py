@@ -0,0 +1,416 @@
+"""
+Concurrent HTTP load-test harness for the Flask Recipe API.
+
+This script boots the application under a real gunicorn server (or targets an
+already running server with --url), replays a weighted mix of realistic requests
+and reports throughput, latency percentiles and error rates per endpoint.
+
+Examples:
+    python benchmarks/loadtest.py --workers 4 --concurrency 32 --duration 30
+    python benchmarks/loadtest.py --worker-class gthread --threads 8 --rate 200
+    python benchmarks/loadtest.py --url http://localhost:8000 --mix public=1,filter=1
+
+The database must already be populated with `flask db create`, because the write
+and login scenarios use the seeded user accounts.
+"""
+
+# Import statements
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib import request as urllib_request
+from urllib.error import HTTPError, URLError
+
+# Root directory of the project, used as the working directory of gunicorn
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seeded (non-admin) accounts created by `flask db create`
+SEED_USERS = [
+    ('user_1_@example.com', 'password_user1'),
+    ('user_2_@example.com', 'password_user2'),
+]
+
+# Default weights of each scenario in the replayed traffic mix
+DEFAULT_MIX = {
+    'public': 35,
+    'public_random': 10,
+    'categories': 10,
+    'filter': 25,
+    'login': 5,
+    'write': 15,
+}
+
+# Title fragments used by the filter scenario
+FILTER_TITLES = ['spag', 'taco', 'menudo', 'arroz', 'chiles', 'zzz']
+
+
+class Stats:
+    """
+    Thread-safe collector of per-endpoint latency samples and outcomes.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, name, latency, status):
+        """
+        Record the outcome of a single request.
+
+        Args:
+            name (str): The endpoint label of the request.
+            latency (float): The latency of the request in seconds.
+            status (int): The HTTP status code, or 0 if the request failed at the transport level.
+        """
+        with self.lock:
+            self.samples.setdefault(name, []).append((latency, status))
+
+    def report(self, elapsed):
+        """
+        Summarise the recorded samples.
+
+        Args:
+            elapsed (float): The length of the measurement window in seconds.
+
+        Returns:
+            dict: A mapping of endpoint label to throughput, latency percentiles and error rates.
+        """
+        summary = {}
+        with self.lock:
+            items = sorted(self.samples.items())
+        for name, samples in items:
+            latencies = sorted(latency for latency, _ in samples)
+            errors = sum(1 for _, status in samples if status == 0 or status >= 500)
+            non_2xx = sum(1 for _, status in samples if not 200 <= status < 300)
+            summary[name] = {
+                'requests': len(samples),
+                'throughput_rps': len(samples) / elapsed if elapsed else 0.0,
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p90_ms': percentile(latencies, 90) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+                'error_rate': errors / len(samples),
+                'non_2xx_rate': non_2xx / len(samples),
+            }
+        return summary
+
+
+def percentile(sorted_values, pct):
+    """
+    Compute a percentile of an already sorted list using the nearest-rank method.
+
+    Args:
+        sorted_values (list): The sorted sample values.
+        pct (float): The percentile to compute, between 0 and 100.
+
+    Returns:
+        float: The percentile value, or 0.0 if there are no samples.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Client:
+    """
+    Minimal HTTP client that issues JSON requests against the API under test.
+    """
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.tokens = {}
+        self.tokens_lock = threading.Lock()
+
+    def call(self, method, path, body=None, token=None):
+        """
+        Send a request and return its status code and decoded JSON body.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The request path, including any query string.
+            body (dict): An optional JSON request body.
+            token (str): An optional JWT sent as a bearer token.
+
+        Returns:
+            tuple: The HTTP status code (0 on transport errors) and the decoded body (or None).
+        """
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib_request.Request(self.base_url + path, data=data, method=method)
+        if data is not None:
+            req.add_header('Content-Type', 'application/json')
+        if token:
+            req.add_header('Authorization', f'Bearer {token}')
+        try:
+            with urllib_request.urlopen(req, timeout=self.timeout) as resp:
+                return resp.status, _decode(resp.read())
+        except HTTPError as err:
+            return err.code, _decode(err.read())
+        except (URLError, OSError):
+            return 0, None
+
+    def token_for(self, email, password):
+        """
+        Return a cached JWT for the given account, logging in on first use.
+
+        Args:
+            email (str): The email address of the account.
+            password (str): The password of the account.
+
+        Returns:
+            str: The JWT, or None if the login failed.
+        """
+        with self.tokens_lock:
+            token = self.tokens.get(email)
+        if token:
+            return token
+        status, body = self.call('POST', '/users/login', {'email': email, 'password': password})
+        if status == 200 and body:
+            token = body.get('token')
+            with self.tokens_lock:
+                self.tokens[email] = token
+        return token
+
+
+def _decode(raw):
+    """
+    Decode a JSON response body, returning None if it is not valid JSON.
+    """
+    try:
+        return json.loads(raw) if raw else None
+    except ValueError:
+        return None
+
+
+def run_scenario(client, stats, name, started):
+    """
+    Execute one scenario from the traffic mix and record its requests.
+
+    Args:
+        client (Client): The HTTP client.
+        stats (Stats): The stats collector.
+        name (str): The scenario name (a key of DEFAULT_MIX).
+        started (float): The scheduled start time of the scenario, used so that
+            queueing delay in open-loop mode is included in the measured latency.
+    """
+    def timed(label, method, path, body=None, token=None, since=None):
+        begin = since if since is not None else time.perf_counter()
+        status, payload = client.call(method, path, body, token)
+        stats.record(label, time.perf_counter() - begin, status)
+        return status, payload
+
+    if name == 'public':
+        timed('GET /recipes/public', 'GET', '/recipes/public', since=started)
+    elif name == 'public_random':
+        timed('GET /recipes/public/random', 'GET', '/recipes/public/random', since=started)
+    elif name == 'categories':
+        timed('GET /categories/', 'GET', '/categories/', since=started)
+    elif name == 'filter':
+        title = random.choice(FILTER_TITLES)
+        timed('GET /recipes/public/filter', 'GET', f'/recipes/public/filter?title={title}', since=started)
+    elif name == 'login':
+        email, password = random.choice(SEED_USERS)
+        timed('POST /users/login', 'POST', '/users/login',
+              {'email': email, 'password': password}, since=started)
+    elif name == 'write':
+        token = client.token_for(*random.choice(SEED_USERS))
+        recipe = {
+            'title': f'loadtest-{uuid.uuid4().hex}',
+            'description': 'Created by the load-test harness.',
+            'is_public': False,
+            'preparation_time': random.randint(5, 120),
+            'category': {'cuisine_name': 'Italian'},
+            'ingredients': [{'name': 'Salt', 'quantity': '1 tsp'}, {'name': 'Water'}],
+            'instructions': [{'step_number': 1, 'task': 'Mix.'}, {'step_number': 2, 'task': 'Serve.'}],
+        }
+        status, payload = timed('POST /recipes/', 'POST', '/recipes/', recipe, token, since=started)
+        # Clean up the created recipe so that repeated runs don't grow the database
+        if status == 201 and payload:
+            timed('DELETE /recipes/<id>', 'DELETE', f"/recipes/{payload['recipe_id']}", token=token)
+
+
+def parse_mix(text):
+    """
+    Parse a traffic mix specification such as "public=50,filter=30,write=20".
+
+    Args:
+        text (str): The mix specification, or None for the default mix.
+
+    Returns:
+        dict: A mapping of scenario name to relative weight.
+    """
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown scenario '{name}'. Choose from: {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def free_port():
+    """
+    Ask the operating system for an unused local TCP port.
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(args):
+    """
+    Boot the application under gunicorn and wait until it answers requests.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        tuple: The gunicorn process and the base URL of the server.
+    """
+    port = args.port or free_port()
+    cmd = [
+        sys.executable, '-m', 'gunicorn', args.app,
+        '--bind', f'127.0.0.1:{port}',
+        '--workers', str(args.workers),
+        '--worker-class', args.worker_class,
+        '--threads', str(args.threads),
+        '--log-level', 'warning',
+    ]
+    cmd.extend(args.gunicorn_arg or [])
+    print('Starting:', ' '.join(cmd))
+    proc = subprocess.Popen(cmd, cwd=PROJECT_ROOT)
+
+    base_url = f'http://127.0.0.1:{port}'
+    client = Client(base_url, timeout=2)
+    deadline = time.monotonic() + args.boot_timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f'gunicorn exited with status {proc.returncode}')
+        if client.call('GET', '/')[0] == 200:
+            return proc, base_url
+        time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit('gunicorn did not become ready in time')
+
+
+def closed_loop(client, stats, mix, concurrency, deadline):
+    """
+    Run the mix with a fixed number of concurrent clients, each issuing its next
+    request as soon as the previous one completes.
+    """
+    names, weights = list(mix), list(mix.values())
+
+    def worker():
+        while time.perf_counter() < deadline:
+            run_scenario(client, stats, random.choices(names, weights)[0], time.perf_counter())
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def open_loop(client, stats, mix, concurrency, rate, deadline):
+    """
+    Run the mix with Poisson arrivals at a fixed rate, independent of how fast the
+    server responds. Latency is measured from the scheduled arrival time, so time
+    spent waiting for a free client thread is included (no coordinated omission).
+    """
+    names, weights = list(mix), list(mix.values())
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        next_arrival = time.perf_counter()
+        while next_arrival < deadline:
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(run_scenario, client, stats, random.choices(names, weights)[0], next_arrival)
+            next_arrival += random.expovariate(rate)
+
+
+def print_report(summary, elapsed):
+    """
+    Print the per-endpoint summary as a table.
+    """
+    header = f"{'endpoint':<30}{'reqs':>8}{'rps':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}{'err %':>8}{'!2xx %':>8}"
+    print(header)
+    print('-' * len(header))
+    total = 0
+    for name, row in summary.items():
+        total += row['requests']
+        print(f"{name:<30}{row['requests']:>8}{row['throughput_rps']:>9.1f}{row['p50_ms']:>9.1f}"
+              f"{row['p90_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}"
+              f"{row['error_rate'] * 100:>8.2f}{row['non_2xx_rate'] * 100:>8.2f}")
+    print('-' * len(header))
+    print(f'{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s overall)')
+
+
+def main():
+    """
+    Entry point of the load-test harness.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Target an already running server instead of booting gunicorn')
+    parser.add_argument('--app', default='app:create_app()', help='gunicorn application spec (default: app:create_app())')
+    parser.add_argument('--port', type=int, help='Port for the gunicorn server (default: a free port)')
+    parser.add_argument('--workers', type=int, default=2, help='Number of gunicorn workers')
+    parser.add_argument('--worker-class', default='sync', help='gunicorn worker class (sync, gthread, ...)')
+    parser.add_argument('--threads', type=int, default=1, help='Threads per gunicorn worker')
+    parser.add_argument('--gunicorn-arg', action='append', help='Extra argument passed to gunicorn (repeatable)')
+    parser.add_argument('--boot-timeout', type=float, default=30, help='Seconds to wait for gunicorn to start')
+    parser.add_argument('--concurrency', type=int, default=16, help='Number of concurrent client threads')
+    parser.add_argument('--rate', type=float, help='Open-loop arrival rate in scenarios/s (default: closed loop)')
+    parser.add_argument('--duration', type=float, default=20, help='Measurement duration in seconds')
+    parser.add_argument('--warmup', type=float, default=3, help='Warm-up duration in seconds (not reported)')
+    parser.add_argument('--mix', help=f"Traffic mix, e.g. 'public=50,write=10' (scenarios: {', '.join(DEFAULT_MIX)})")
+    parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+    parser.add_argument('--json', dest='json_path', help='Also write the summary to this JSON file')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    proc = None
+    if args.url:
+        base_url = args.url
+    else:
+        proc, base_url = start_gunicorn(args)
+
+    try:
+        client = Client(base_url, args.timeout)
+
+        # Warm up the server (connection pools, imports, caches) without recording results
+        if args.warmup > 0:
+            closed_loop(client, Stats(), mix, args.concurrency, time.perf_counter() + args.warmup)
+
+        stats = Stats()
+        started = time.perf_counter()
+        deadline = started + args.duration
+        if args.rate:
+            open_loop(client, stats, mix, args.concurrency, args.rate, deadline)
+        else:
+            closed_loop(client, stats, mix, args.concurrency, deadline)
+        elapsed = time.perf_counter() - started
+
+        summary = stats.report(elapsed)
+        print_report(summary, elapsed)
+        if args.json_path:
+            with open(args.json_path, 'w', encoding='utf-8') as file:
+                json.dump({'config': vars(args), 'elapsed_s': elapsed, 'endpoints': summary}, file, indent=2)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Payload size and encode/decode time of JSON vs. MessagePack responses of the Flask Recipe API.
+
+The recipes in the database are serialized with RecipeSchema, as the list endpoints do, and
+repeated (with distinct IDs and titles) until the payload holds the requested number of
+recipes. Each format is then encoded the way the API encodes responses (see encoding.py) and
+decoded the way a Python client would, reporting the raw and gzip-compressed sizes and the
+median encode and decode times.
+
+Example:
+    python benchmarks/msgpack_vs_json.py --recipes 5000 --repeats 20
+"""
+
+# Import statements
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from statistics import median
+
+# Make the application modules importable when the script is run from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import msgpack  # pylint: disable=wrong-import-position
+from app import create_app  # pylint: disable=wrong-import-position
+from encoding import packb  # pylint: disable=wrong-import-position
+from models.recipe import Recipe, RecipeSchema  # pylint: disable=wrong-import-position
+
+
+def build_payload(app, count):
+    """
+    Serialize the recipes of the database and repeat them up to the requested count.
+
+    Args:
+        app (Flask): The Flask application.
+        count (int): The number of recipes in the payload.
+
+    Returns:
+        list: The serialized recipes.
+    """
+    with app.app_context():
+        recipes = RecipeSchema(many=True).dump(Recipe.query.all())
+    if not recipes:
+        raise SystemExit('The database has no recipes; run `flask db create` first.')
+
+    payload = []
+    for index in range(count):
+        recipe = dict(recipes[index % len(recipes)])
+        recipe['recipe_id'] = index + 1
+        recipe['title'] = f"{recipe['title']} #{index + 1}"
+        payload.append(recipe)
+    return payload
+
+
+def timed(function, repeats):
+    """
+    Run a function several times and return its median duration in milliseconds and its last result.
+    """
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return median(timings), result
+
+
+def main():
+    """
+    Entry point of the JSON vs. MessagePack benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recipes', type=int, default=2000, help='Number of recipes in the payload')
+    parser.add_argument('--repeats', type=int, default=10, help='Number of timed runs of each operation')
+    args = parser.parse_args()
+
+    app = create_app()
+    payload = build_payload(app, args.recipes)
+
+    # Encode and decode each format as the API and its Python clients do
+    formats = {
+        'json': (
+            lambda: (app.json.dumps(payload, separators=(',', ':')) + '\n').encode(),
+            json.loads,
+        ),
+        'msgpack': (
+            lambda: packb(payload, app.json.default),
+            lambda body: msgpack.unpackb(body, raw=False),
+        ),
+    }
+
+    print(f'{args.recipes} recipes, median of {args.repeats} runs\n')
+    header = f"{'format':<10}{'bytes':>12}{'gzip bytes':>12}{'encode ms':>12}{'decode ms':>12}"
+    print(header)
+    print('-' * len(header))
+    for name, (encode, decode) in formats.items():
+        encode_ms, body = timed(encode, args.repeats)
+        decode_ms, decoded = timed(lambda: decode(body), args.repeats)
+        assert decoded == payload, f'{name} did not round-trip the payload'
+        print(f'{name:<10}{len(body):>12}{len(gzip.compress(body, 6)):>12}{encode_ms:>12.2f}{decode_ms:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
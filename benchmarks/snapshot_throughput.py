@@ -0,0 +1,163 @@
+"""
+Throughput of `flask db import` and `flask db export` on a synthetic dataset.
+
+A snapshot of the requested number of recipes (with their users, categories, ingredients and
+instructions) is generated directly in the snapshot format, then imported into the database
+configured by DB_URI (REPLACING ALL ITS DATA) and exported again, reporting the rows per
+second of each step and the size of the snapshot files.
+
+Example:
+    DB_URI=postgresql://localhost/recipes_bench python benchmarks/snapshot_throughput.py --recipes 1000000
+"""
+
+# Import statements
+import argparse
+import gzip
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date
+
+# Make the application modules importable when the script is run from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import msgpack  # pylint: disable=wrong-import-position
+from app import create_app  # pylint: disable=wrong-import-position
+from init import db  # pylint: disable=wrong-import-position
+from snapshot import SNAPSHOT_FORMAT, SNAPSHOT_VERSION, export_snapshot, import_snapshot, throughput  # pylint: disable=wrong-import-position
+
+# Shape of the synthetic dataset
+RECIPES_PER_USER = 20
+CATEGORIES = 25
+INGREDIENT_NAMES = 2000
+INGREDIENTS_PER_RECIPE = 6
+STEPS_PER_RECIPE = 5
+
+# A bcrypt hash, so that the users rows have a realistic size
+PASSWORD_HASH = '$2b$12$4m8b3o9kUJz0i9yq1lO9UeU5nq5m0T1c4bFf8o0n3JkH2Z0yq1aQe'
+
+
+def synthetic_tables(recipes):
+    """
+    Generate the rows of every table, as (table name, row dict generator) pairs in dependency order.
+    """
+    users = max(1, recipes // RECIPES_PER_USER)
+    today = date.today().toordinal()
+
+    def recipe_owner(recipe_id):
+        return (recipe_id - 1) % users + 1, (recipe_id - 1) % CATEGORIES + 1, recipe_id % 5 != 0
+
+    # The counters of users and categories must match their recipes
+    totals, public = Counter(), Counter()
+    for recipe_id in range(1, recipes + 1):
+        user_id, category_id, is_public = recipe_owner(recipe_id)
+        totals[('user', user_id)] += 1
+        totals[('category', category_id)] += 1
+        public[('user', user_id)] += is_public
+        public[('category', category_id)] += is_public
+
+    def recipe_rows():
+        for recipe_id in range(1, recipes + 1):
+            user_id, category_id, is_public = recipe_owner(recipe_id)
+            yield {
+                'recipe_id': recipe_id, 'title': f'Recipe {recipe_id}', 'description': f'Synthetic recipe number {recipe_id}.',
+                'is_public': is_public, 'preparation_time': 5 + recipe_id % 120,
+                'date_created': today - recipe_id % 365, 'user_id': user_id, 'category_id': category_id,
+            }
+
+    def ingredient_rows():
+        for recipe_id in range(1, recipes + 1):
+            for position in range(INGREDIENTS_PER_RECIPE):
+                name_id = (recipe_id * 7 + position * 131) % INGREDIENT_NAMES + 1
+                yield {
+                    'ingredient_id': (recipe_id - 1) * INGREDIENTS_PER_RECIPE + position + 1, 'name': f'ingredient {name_id}',
+                    'quantity': f'{position + 1} cups', 'recipe_id': recipe_id, 'ingredient_name_id': name_id,
+                }
+
+    def instruction_rows():
+        for recipe_id in range(1, recipes + 1):
+            for step in range(1, STEPS_PER_RECIPE + 1):
+                yield {
+                    'instruction_id': (recipe_id - 1) * STEPS_PER_RECIPE + step, 'step_number': step,
+                    'task': f'Step {step} of recipe {recipe_id}.', 'recipe_id': recipe_id,
+                }
+
+    return {
+        'users': lambda: ({
+            'user_id': user_id, 'email': f'user{user_id}@example.com', 'password': PASSWORD_HASH, 'name': f'User {user_id}',
+            'is_admin': user_id == 1, 'recipe_count': totals[('user', user_id)], 'public_recipe_count': public[('user', user_id)],
+        } for user_id in range(1, users + 1)),
+        'categories': lambda: ({
+            'category_id': category_id, 'cuisine_name': f'Cuisine {category_id}',
+            'recipe_count': totals[('category', category_id)], 'public_recipe_count': public[('category', category_id)],
+        } for category_id in range(1, CATEGORIES + 1)),
+        'ingredient_names': lambda: ({'ingredient_name_id': name_id, 'name': f'ingredient {name_id}'} for name_id in range(1, INGREDIENT_NAMES + 1)),
+        'recipes': recipe_rows,
+        'ingredients': ingredient_rows,
+        'instructions': instruction_rows,
+    }
+
+
+def write_snapshot(path, recipes, chunk_size):
+    """
+    Write a synthetic snapshot file with the given number of recipes.
+    """
+    generators = synthetic_tables(recipes)
+    tables = [table for table in db.metadata.sorted_tables if table.name in generators]
+    packer = msgpack.Packer(use_bin_type=True)
+    with gzip.open(path, 'wb', compresslevel=1) as file:
+        file.write(packer.pack({'format': SNAPSHOT_FORMAT, 'version': SNAPSHOT_VERSION, 'created': date.today().isoformat(), 'tables': [table.name for table in tables]}))
+        for table in tables:
+            columns = [column.name for column in table.columns]
+            file.write(packer.pack({'table': table.name, 'columns': columns}))
+            total, chunk = 0, []
+            for row in generators[table.name]():
+                chunk.append(row)
+                if len(chunk) == chunk_size:
+                    file.write(packer.pack({'rows': len(chunk), 'data': [[row.get(column) for row in chunk] for column in columns]}))
+                    total += len(chunk)
+                    chunk = []
+            if chunk:
+                file.write(packer.pack({'rows': len(chunk), 'data': [[row.get(column) for row in chunk] for column in columns]}))
+                total += len(chunk)
+            file.write(packer.pack({'end': table.name, 'rows': total}))
+
+
+def main():
+    """
+    Entry point of the snapshot throughput benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recipes', type=int, default=1000000, help='Number of recipes in the dataset')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Number of rows per chunk')
+    parser.add_argument('--level', type=int, default=6, help='Gzip compression level of the export')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context(), tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'synthetic.snapshot')
+        exported = os.path.join(directory, 'exported.snapshot')
+
+        started = time.perf_counter()
+        write_snapshot(source, args.recipes, args.chunk_size)
+        print(f'Generated {args.recipes} recipes in {time.perf_counter() - started:.1f}s ({os.path.getsize(source)} bytes)\n')
+
+        header = f"{'step':<10}{'rows':>12}{'seconds':>10}{'rows/s':>12}{'MB':>10}"
+        print(header)
+        print('-' * len(header))
+
+        started = time.perf_counter()
+        counts = import_snapshot(source, replace=True)
+        total, elapsed, rate = throughput(counts, started)
+        print(f"{'import':<10}{total:>12}{elapsed:>10.1f}{rate:>12.0f}{os.path.getsize(source) / 1e6:>10.1f}")
+
+        started = time.perf_counter()
+        counts = export_snapshot(exported, chunk_size=args.chunk_size, level=args.level)
+        total, elapsed, rate = throughput(counts, started)
+        print(f"{'export':<10}{total:>12}{elapsed:>10.1f}{rate:>12.0f}{os.path.getsize(exported) / 1e6:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Startup-time and memory benchmark for the gunicorn deployment of the Flask Recipe API.
+
+For each mode (workers loading the app themselves vs. the app preloaded in the master and
+shared copy-on-write), this script boots gunicorn, measures the time until the first request
+is answered, sends a few requests to every worker, and reports per-worker memory from
+/proc/<pid>/smaps_rollup (Linux only):
+
+    RSS  - resident memory, counting shared pages in full for every worker
+    PSS  - proportional memory, dividing shared pages between the processes sharing them
+    USS  - memory private to the worker, i.e. what each additional worker really costs
+
+It also measures the cold start of the application factory itself in a fresh interpreter.
+
+Example:
+    python benchmarks/startup.py --workers 4
+"""
+
+# Import statements
+import argparse
+import os
+import subprocess
+import sys
+import time
+from statistics import median
+from urllib import request as urllib_request
+from urllib.error import URLError
+
+# Root directory of the project, used as the working directory of gunicorn
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def memory_kb(pid):
+    """
+    Read the RSS, PSS and USS of a process in kilobytes.
+
+    Args:
+        pid (int): The process ID.
+
+    Returns:
+        dict: The rss, pss and uss of the process.
+    """
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup', encoding='utf-8') as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1])
+    return {
+        'rss': values.get('Rss', 0),
+        'pss': values.get('Pss', 0),
+        'uss': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0),
+    }
+
+
+def children(pid):
+    """
+    Return the IDs of the direct child processes of a process.
+    """
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', encoding='utf-8') as file:
+                # The parent PID is the second field after the parenthesised command name
+                ppid = int(file.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            pids.append(int(entry))
+    return pids
+
+
+def cold_start(repeats):
+    """
+    Measure the time to import the application and call create_app() in a fresh interpreter.
+
+    Returns:
+        float: The median cold-start time in milliseconds.
+    """
+    code = 'import time; t = time.perf_counter(); import app; app.create_app(); print((time.perf_counter() - t) * 1000)'
+    timings = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', code], cwd=PROJECT_ROOT, check=True,
+                                capture_output=True, text=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return median(timings)
+
+
+def boot(preload, workers, port, requests_per_worker):
+    """
+    Boot gunicorn, wait for the first answered request and measure worker memory.
+
+    Returns:
+        dict: The time to first response and the memory of the master and each worker.
+    """
+    env = dict(os.environ, GUNICORN_PRELOAD='true' if preload else 'false')
+    cmd = [sys.executable, '-m', 'gunicorn', 'app:create_app()', '--bind', f'127.0.0.1:{port}',
+           '--workers', str(workers), '--log-level', 'warning']
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=PROJECT_ROOT, env=env)
+    url = f'http://127.0.0.1:{port}'
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise SystemExit(f'gunicorn exited with status {proc.returncode}')
+            try:
+                urllib_request.urlopen(f'{url}/', timeout=1).read()
+                break
+            except (URLError, OSError):
+                time.sleep(0.05)
+        first_response_ms = (time.perf_counter() - started) * 1000
+
+        # Wait until every worker has booted, then exercise them so their memory reflects serving
+        deadline = time.monotonic() + 30
+        while len(children(proc.pid)) < workers and time.monotonic() < deadline:
+            time.sleep(0.1)
+        for _ in range(requests_per_worker * workers):
+            for path in ('/categories/', '/recipes/public'):
+                try:
+                    urllib_request.urlopen(url + path, timeout=10).read()
+                except (URLError, OSError):
+                    pass
+        time.sleep(0.5)
+
+        return {
+            'first_response_ms': first_response_ms,
+            'master': memory_kb(proc.pid),
+            'workers': [memory_kb(pid) for pid in children(proc.pid)],
+        }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main():
+    """
+    Entry point of the startup benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='Number of gunicorn workers')
+    parser.add_argument('--port', type=int, default=8765, help='Port for the gunicorn server')
+    parser.add_argument('--repeats', type=int, default=5, help='Number of cold-start measurements')
+    parser.add_argument('--requests', type=int, default=20, help='Requests sent per worker before measuring memory')
+    args = parser.parse_args()
+
+    print(f'create_app() cold start (median of {args.repeats}): {cold_start(args.repeats):.1f} ms\n')
+
+    header = f"{'mode':<12}{'first resp ms':>15}{'worker RSS MB':>15}{'worker PSS MB':>15}{'worker USS MB':>15}{'total PSS MB':>14}"
+    print(header)
+    print('-' * len(header))
+    for preload in (False, True):
+        result = boot(preload, args.workers, args.port, args.requests)
+        workers = result['workers'] or [{'rss': 0, 'pss': 0, 'uss': 0}]
+        mean = {key: sum(worker[key] for worker in workers) / len(workers) / 1024 for key in ('rss', 'pss', 'uss')}
+        total_pss = (result['master']['pss'] + sum(worker['pss'] for worker in workers)) / 1024
+        print(f"{'preload' if preload else 'no preload':<12}{result['first_response_ms']:>15.0f}"
+              f"{mean['rss']:>15.1f}{mean['pss']:>15.1f}{mean['uss']:>15.1f}{total_pss:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+This module is a blueprint for admin-only routes to retrieve saved request profiles.
+"""
+
+from flask import Blueprint, send_file
+from auth import current_user_is_admin, jwt_required
+from profiling import list_profiles, profile_path
+
+# Define a blueprint for admin routes
+admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+@admin_bp.before_request
+@jwt_required()  # Ensure that every admin route is authenticated using JWT
+def require_admin():
+    """
+    Ensure that only admin users can access the routes of this blueprint.
+
+    Returns:
+        tuple: A 403 Forbidden error if the current user is not an admin, otherwise None.
+    """
+    if not current_user_is_admin():
+        return {"error": "Only admin can access this resource"}, 403
+
+@admin_bp.route("/profiles")
+def all_profiles():
+    """
+    Route to list the saved request profiles, newest first.
+
+    Returns:
+        list of dict: The summary of each saved profile.
+    """
+    return list_profiles()
+
+@admin_bp.route("/profiles/<profile_id>")
+def one_profile(profile_id):
+    """
+    Retrieve the summary of a saved profile, including the time spent in each phase
+    and the functions with the highest cumulative time.
+
+    Args:
+        profile_id (str): The ID of the profile, as returned in the X-Profile-Id header.
+
+    Returns:
+        dict: A JSON representation of the profile summary.
+    """
+    path = profile_path(profile_id, 'json')
+    if not path:
+        return {"error": "Profile not found."}, 404
+    return send_file(path, mimetype='application/json')
+
+@admin_bp.route("/profiles/<profile_id>/download")
+def download_profile(profile_id):
+    """
+    Download the raw cProfile data of a saved profile, for use with pstats or snakeviz.
+
+    Args:
+        profile_id (str): The ID of the profile.
+
+    Returns:
+        Response: The .prof file as an attachment.
+    """
+    path = profile_path(profile_id, 'prof')
+    if not path:
+        return {"error": "Profile not found."}, 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True)
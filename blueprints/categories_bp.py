@@ -5,11 +5,13 @@ This module is a blueprint for routes to manage category records.
 from flask import Blueprint
 from init import db
 from models.category import Category, CategorySchema
+from cache import cached_response
 
 # Define a blueprint for category-related routes
 categories_bp = Blueprint('categories', __name__, url_prefix='/categories')
 
 @categories_bp.route("/")
+@cached_response(('categories',))
 def all_categories():
     """
     Route to fetch all categories from the database.
@@ -18,7 +20,7 @@ def all_categories():
         list: A JSON representation of all category records.
     """
     # Query the database for all category records
-    categories = Category.query.all()
+    categories = Category.query.order_by(Category.category_id).all()
 
     # Check if categories are found
     if not categories:
@@ -28,6 +30,7 @@ def all_categories():
     return CategorySchema(many=True).dump(categories)
 
 @categories_bp.route("/<int:category_id>")
+@cached_response(('categories',))
 def one_category(category_id):
     """
     Retrieve a category record by its ID.
@@ -3,19 +3,37 @@ This module defines Flask CLI commands for database management.
 """
 
 # Import statements
+import csv
+import json
+import os
+import time
 from datetime import date
-from flask import Blueprint
+import click
+from flask import Blueprint, current_app
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
 from init import db, bcrypt
+from slow_queries import read_slow_queries
+from provisioning import import_users
+from snapshot import export_snapshot, import_snapshot, throughput
+from similarity import build_index as build_similarity_index
 from models.user import User
 from models.category import Category
 from models.recipe import Recipe
-from models.ingredient import Ingredient
+from models.ingredient import Ingredient, normalize_ingredient_name
+from models.ingredient_name import IngredientName, ingredient_name_ids
 from models.instruction import Instruction
 # from models.saved_recipe import SavedRecipe
 
 # Define a Blueprint for CLI commands
 db_commands = Blueprint('db', __name__)
 
+# Define a Blueprint for the user management commands (flask users ...)
+user_commands = Blueprint('user_commands', __name__, cli_group='users')
+
+# Boolean values accepted in the is_admin column of imported CSV files
+CSV_BOOLEANS = {'1': True, 'true': True, 'yes': True, '0': False, 'false': False, 'no': False}
+
 @db_commands.cli.command('create')
 def db_create():
     """
@@ -259,3 +277,223 @@ def db_create():
     db.session.commit()
 
 
+
+@db_commands.cli.command('backfill-ingredient-names')
+@click.option('--batch-size', default=1000, show_default=True, help='Number of ingredients updated per transaction.')
+def db_backfill_ingredient_names(batch_size):
+    """
+    Custom Flask CLI command to add the ingredient name dictionary to an existing database.
+
+    Creates the ingredient_names table and the ingredients.ingredient_name_id column if they
+    are missing, then points every ingredient to its normalized name, in batches.
+    """
+    # Create the dictionary table and the reference column of existing databases
+    IngredientName.__table__.create(db.engine, checkfirst=True)
+    columns = {column['name'] for column in inspect(db.engine).get_columns('ingredients')}
+    if 'ingredient_name_id' not in columns:
+        db.session.execute(text(
+            'ALTER TABLE ingredients ADD COLUMN ingredient_name_id INTEGER '
+            'REFERENCES ingredient_names (ingredient_name_id)'
+        ))
+        db.session.execute(text('CREATE INDEX ix_ingredients_ingredient_name_id ON ingredients (ingredient_name_id)'))
+        db.session.commit()
+        print('Added ingredients.ingredient_name_id')
+
+    # Update the ingredients without a dictionary reference, one batch per transaction
+    updated = 0
+    while True:
+        stmt = (
+            db.select(Ingredient.ingredient_id, Ingredient.name)
+            .where(Ingredient.ingredient_name_id.is_(None), Ingredient.name.is_not(None), Ingredient.name != '')
+            .order_by(Ingredient.ingredient_id)
+            .limit(batch_size)
+        )
+        rows = db.session.execute(stmt).all()
+        if not rows:
+            break
+
+        ids = ingredient_name_ids(db.session, {normalize_ingredient_name(name) for _, name in rows})
+        db.session.execute(db.update(Ingredient), [
+            {'ingredient_id': ingredient_id, 'ingredient_name_id': ids[normalize_ingredient_name(name)]}
+            for ingredient_id, name in rows
+        ])
+        db.session.commit()
+        updated += len(rows)
+        print(f'Updated {updated} ingredients')
+
+    count = db.session.scalar(db.select(db.func.count()).select_from(IngredientName))
+    print(f'Backfill complete: {updated} ingredients updated, {count} distinct ingredient names')
+
+@db_commands.cli.command('recount')
+def db_recount():
+    """
+    Custom Flask CLI command to recompute the recipe counters of users and categories.
+
+    Adds the recipe_count and public_recipe_count columns to existing databases if they are
+    missing, then sets every counter from the recipes table, repairing counters that drifted
+    (e.g. after recipes were written outside the application).
+    """
+    for model, key, foreign_key in ((User, User.user_id, Recipe.user_id), (Category, Category.category_id, Recipe.category_id)):
+        table = model.__table__
+        columns = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+        for column in ('recipe_count', 'public_recipe_count'):
+            if column not in columns:
+                db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0'))
+                print(f'Added {table.name}.{column}')
+
+        # Count the recipes of every row with correlated subqueries, in a single UPDATE per table
+        recipe_count = db.select(db.func.count()).where(foreign_key == key).scalar_subquery()
+        public_count = db.select(db.func.count()).where(foreign_key == key, Recipe.is_public.is_(True)).scalar_subquery()
+        result = db.session.execute(
+            db.update(table).values(recipe_count=recipe_count, public_recipe_count=public_count)
+        )
+        print(f'Recounted the recipes of {result.rowcount} {table.name}')
+    db.session.commit()
+
+@db_commands.cli.command('create-indexes')
+def db_create_indexes():
+    """
+    Custom Flask CLI command to create the indexes declared by the models that an existing
+    database is missing, e.g. the case-insensitive search indexes of the users table.
+    """
+    # Expression indexes can't be reflected on every database, so let it skip existing ones
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        for index in table.indexes:
+            db.session.execute(CreateIndex(index, if_not_exists=True))
+            print(f'Ensured {index.name}')
+    db.session.commit()
+
+@db_commands.cli.command('export')
+@click.argument('path', type=click.Path(dir_okay=False))
+@click.option('--chunk-size', default=10000, show_default=True, help='Number of rows per chunk.')
+@click.option('--level', default=6, show_default=True, type=click.IntRange(1, 9), help='Gzip compression level.')
+def db_export(path, chunk_size, level):
+    """
+    Custom Flask CLI command to back up every table of the database to a snapshot file.
+
+    The tables are streamed in chunks of rows, stored by column and compressed, from a single
+    consistent read transaction; see snapshot.py for the file format.
+    """
+    started = time.perf_counter()
+    counts = export_snapshot(path, chunk_size=chunk_size, level=level, progress=lambda table, rows: print(f'Exported {rows} rows of {table}'))
+    total, elapsed, rate = throughput(counts, started)
+    print(f'Exported {total} rows to {path} ({os.path.getsize(path)} bytes) in {elapsed:.1f}s, {rate:.0f} rows/s')
+
+@db_commands.cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--replace', is_flag=True, help='Drop and recreate all the tables first (all existing data is lost).')
+def db_import(path, replace):
+    """
+    Custom Flask CLI command to restore a snapshot file written by `flask db export`.
+
+    The rows keep their IDs; the tables must be empty unless --replace is given.
+    """
+    started = time.perf_counter()
+    try:
+        counts = import_snapshot(path, replace=replace, progress=lambda table, rows: print(f'Imported {rows} rows of {table}'))
+    except ValueError as err:
+        db.session.rollback()
+        raise click.ClickException(str(err)) from err
+    total, elapsed, rate = throughput(counts, started)
+    print(f'Imported {total} rows from {path} in {elapsed:.1f}s, {rate:.0f} rows/s')
+
+@db_commands.cli.command('similarity-index')
+def db_similarity_index():
+    """
+    Custom Flask CLI command to rebuild the signature file of the similar recipe recommendations.
+    """
+    build_similarity_index(force=True)
+    print(f"Built similarity index in {current_app.config['SIMILARITY_FILE']}")
+
+@db_commands.cli.command('slow-queries')
+@click.option('--log', 'log_path', default=None, help='Path of the slow query log (defaults to SLOW_QUERY_LOG).')
+@click.option('--limit', default=20, show_default=True, help='Number of statement shapes to show.')
+def db_slow_queries(log_path, limit):
+    """
+    Custom Flask CLI command to report slow statements grouped by normalized shape.
+
+    Statements that differ only in their literal or parameter values are grouped together,
+    and the groups are ordered by the total time spent executing them.
+    """
+    # Read the slow query log, including its rotated backups
+    entries = read_slow_queries(log_path or current_app.config['SLOW_QUERY_LOG'])
+    if not entries:
+        print('No slow queries recorded')
+        return
+
+    # Group the entries by statement shape
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault(entry['shape'], {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'routes': set(), 'plan': None})
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+        if entry.get('route'):
+            group['routes'].add(entry['route'])
+        if entry.get('plan'):
+            group['plan'] = entry['plan']
+
+    # Print the groups that cost the most time first
+    ranked = sorted(groups.items(), key=lambda item: item[1]['total_ms'], reverse=True)
+    for shape, group in ranked[:limit]:
+        print(f"{group['count']} executions, total {group['total_ms']:.1f} ms, "
+              f"mean {group['total_ms'] / group['count']:.1f} ms, max {group['max_ms']:.1f} ms")
+        print(f"  Routes: {', '.join(sorted(group['routes'])) or '-'}")
+        print(f'  Statement: {shape}')
+        for line in group['plan'] or []:
+            print(f'    {line}')
+        print()
+
+def read_user_records(path, file_format):
+    """
+    Read the user records of a CSV file (with a header row of email, password, name and
+    optionally is_admin) or a JSON Lines file (one user object per line).
+
+    Args:
+        path (str): The path of the file.
+        file_format (str): 'csv' or 'jsonl'.
+
+    Returns:
+        list of dict: The user records.
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        if file_format == 'jsonl':
+            return [json.loads(line) for line in file if line.strip()]
+
+        records = []
+        for row in csv.DictReader(file):
+            # CSV values are strings; is_admin is a boolean flag, empty for regular users
+            is_admin = (row.pop('is_admin', None) or '').strip().lower()
+            if is_admin:
+                # Unrecognized flags are kept as they are and rejected by the validation
+                row['is_admin'] = CSV_BOOLEANS.get(is_admin, is_admin)
+            records.append(row)
+        return records
+
+@user_commands.cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']), default=None, help='File format (defaults to the file extension).')
+@click.option('--batch-size', default=500, show_default=True, help='Number of users inserted per transaction.')
+@click.option('--workers', default=None, type=int, help='Number of processes hashing passwords (defaults to the number of cores).')
+def users_import(path, file_format, batch_size, workers):
+    """
+    Custom Flask CLI command to create many users from a CSV or JSON Lines file.
+
+    The users are validated like POST /users/register, their passwords are hashed in parallel
+    on all cores and they are inserted in batches. Users whose email already exists are
+    skipped and reported as duplicates.
+    """
+    file_format = file_format or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    records = read_user_records(path, file_format)
+    print(f'Read {len(records)} users from {path}')
+
+    report = import_users(records, batch_size=batch_size, workers=workers, progress=lambda done: print(f'Processed {done} users'))
+
+    for entry in report['invalid']:
+        print(f"Invalid user #{entry['index'] + 1} ({entry['email']}): {entry['errors']}")
+    for email in report['duplicates']:
+        print(f'Duplicate email: {email}')
+    print(f"Import complete: {report['created']} users created, {len(report['duplicates'])} duplicates, {len(report['invalid'])} invalid")
@@ -0,0 +1,21 @@
+"""
+This module is a blueprint for the Prometheus-compatible metrics endpoint.
+"""
+
+from flask import Blueprint
+from metrics import collect, render
+
+# Define a blueprint for the metrics route
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route("/metrics")
+def get_metrics():
+    """
+    Route to expose runtime metrics in the Prometheus text format.
+
+    When METRICS_DIR is configured, the metrics of all gunicorn workers are aggregated.
+
+    Returns:
+        tuple: The metrics as plain text, an HTTP status code and the content type header.
+    """
+    return render(collect()), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
@@ -2,24 +2,63 @@
 This module is a blueprint for routes to manage recipe records.
 """
 
+from collections import Counter
 from datetime import date
 import random
-from flask import Blueprint, request, abort
-from flask_jwt_extended import jwt_required, get_jwt_identity
+import re
+from flask import Blueprint, request, abort, current_app
+from flask_jwt_extended import get_jwt_identity
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm.exc import NoResultFound
 from init import db
-from models.recipe import Recipe, RecipeSchema
-from models.ingredient import Ingredient
-from models.instruction import Instruction
+from models.recipe import Recipe, RecipeSchema, recipe_load_options, count_recipe, apply_recipe_counts
+from models.ingredient import Ingredient, normalize_ingredient_name
+from models.ingredient_name import IngredientName
+from models.instruction import Instruction, InstructionSchema
 from models.category import Category
 from models.user import User
-from auth import authorize_owner, current_user_is_admin
+from auth import authorize_owner, current_user_is_admin, jwt_required
+from cache import cached_response
+from ingredient_index import search as search_ingredient_index
+from similarity import similar
+from suggest_index import suggest
+from recipe_stats import GROUPED_COLUMNS, record_previous_values
+from events import mark_changed
 
 # Define a blueprint for recipe-related routes
 recipes_bp = Blueprint('recipes', __name__, url_prefix='/recipes')
 
+# Tables that serialized recipes are built from, used to invalidate cached responses
+RECIPE_TABLES = ('recipes', 'users', 'categories', 'ingredients', 'instructions')
+
+# Facets that /public/filter can count over the matching recipes
+FILTER_FACETS = ('cuisine', 'prep_time_bucket')
+
+# Upper bounds (in minutes) and labels of the preparation time buckets
+PREP_TIME_BUCKETS = ((15, '0-15'), (30, '16-30'), (60, '31-60'), (120, '61-120'))
+
+# Suffix of the titles of forked recipes: " (fork)" for the first fork, then " (fork 2)", " (fork 3)", ...
+FORK_SUFFIX = re.compile(r' \(fork(?: (\d+))?\)$')
+
+# Number of generated titles tried when other forks of the same recipe take them concurrently
+FORK_TITLE_ATTEMPTS = 3
+
+def prep_time_bucket(preparation_time):
+    """
+    Build the SQL expression that labels a preparation time with its bucket.
+
+    Args:
+        preparation_time (ColumnElement): The preparation time column.
+
+    Returns:
+        Case: The bucket label, '120+' above the last bucket or 'unknown' if not set.
+    """
+    whens = [(preparation_time.is_(None), 'unknown')]
+    whens += [(preparation_time <= upper, label) for upper, label in PREP_TIME_BUCKETS]
+    return db.case(*whens, else_='120+')
+
 @recipes_bp.route("/public")
+@cached_response(RECIPE_TABLES)
 def all_public_recipes():
     """
     Route to fetch all public recipes from the database.
@@ -27,8 +66,8 @@ def all_public_recipes():
     Returns:
         list of dict: A JSON representation of all user records.
     """
-    # Query all recipes where is_public is True
-    recipes = Recipe.query.filter_by(is_public=True).all()
+    # Query all recipes where is_public is True, with their relationships loaded in one query each
+    recipes = Recipe.query.filter_by(is_public=True).order_by(Recipe.recipe_id).options(*recipe_load_options()).all()
 
     # Return the serialized recipes
     return RecipeSchema(many=True).dump(recipes)
@@ -49,7 +88,7 @@ def get_all_recipes():
         return {"message": "Unauthorized, admin access required"}, 403
 
     # Fetch all recipes from the database
-    all_recipes = Recipe.query.all()
+    all_recipes = Recipe.query.options(*recipe_load_options()).all()
 
     # Return the serialized recipes
     return RecipeSchema(many=True).dump(all_recipes)
@@ -69,8 +108,8 @@ def one_recipe(recipe_id):
     # Get the current user's ID from the JWT payload
     current_user_id = get_jwt_identity()
 
-    # Fetch the recipe with the specified ID, or return a 404 error if not found
-    recipe = db.get_or_404(Recipe, recipe_id)
+    # Fetch the recipe with the specified ID and its relationships, or return a 404 error if not found
+    recipe = db.get_or_404(Recipe, recipe_id, options=recipe_load_options())
 
     # Check if the current user is either an admin or the author of the recipe
     if current_user_id != recipe.user_id and not current_user_is_admin():
@@ -79,6 +118,115 @@ def one_recipe(recipe_id):
     # Return the serialized recipe
     return RecipeSchema().dump(recipe)
 
+@recipes_bp.route("/<int:recipe_id>/similar")
+@jwt_required(optional=True)
+def similar_recipes(recipe_id):
+    """
+    Retrieve the public recipes with the most similar ingredients and cuisine to a recipe.
+    Similar recipes of a private recipe are only available to its author or an admin.
+
+    Args:
+        recipe_id (int): The ID of the recipe to compare.
+
+    Query Parameters:
+        - n: Maximum number of recipes returned, 1 to 50 (integer, optional, default 10)
+
+    Returns:
+        list: The similar recipes with their estimated similarity (0 to 1), most similar first.
+    """
+    # Validate the number of recipes requested
+    try:
+        count = int(request.args.get('n', 10))
+    except ValueError:
+        return {"error": "Invalid n. Must be a valid integer."}, 400
+    if not 1 <= count <= 50:
+        return {"error": "n must be between 1 and 50."}, 400
+
+    # Fetch the recipe with the specified ID, or return a 404 error if not found
+    recipe = db.get_or_404(Recipe, recipe_id)
+
+    # Check if the recipe is public, or the current user is either its author or an admin
+    if not recipe.is_public:
+        current_user_id = get_jwt_identity()
+        if current_user_id is None or (current_user_id != recipe.user_id and not current_user_is_admin()):
+            return {"error": "You are not authorized to access this resource"}, 403
+
+    # Rank the public recipes by the similarity of their MinHash signatures
+    results = similar(recipe_id, count)
+    if not results:
+        return {"error": "No similar recipes found."}, 404
+
+    # Load the similar recipes with one eager-loaded query and serialize them in rank order
+    stmt = db.select(Recipe).where(Recipe.recipe_id.in_([candidate for candidate, _ in results])).options(*recipe_load_options())
+    recipes = {recipe.recipe_id: recipe for recipe in db.session.scalars(stmt)}
+    results = [(candidate, score) for candidate, score in results if candidate in recipes]
+    dumped = RecipeSchema(many=True).dump([recipes[candidate] for candidate, _ in results])
+
+    return [{"recipe": recipe, "similarity": round(score, 4)} for recipe, (_, score) in zip(dumped, results)]
+
+@recipes_bp.route("/batch", methods=["GET", "POST"])
+@jwt_required()
+def batch_recipes():
+    """
+    Retrieve many recipes by their IDs in one request, e.g. GET /recipes/batch?ids=1,2,3 or
+    POST /recipes/batch with {"ids": [1, 2, 3]} for long lists. A recipe is returned if it is
+    public, or if the current user is its author or an admin.
+
+    Returns:
+        dict: The serialized recipes keyed by ID, and an error for each ID that could not be returned.
+    """
+    # Read the IDs from the query string, or from the request body of a POST request
+    if request.method == "POST":
+        body = request.json
+        raw_ids = body.get('ids') if isinstance(body, dict) else None
+    else:
+        raw_ids = request.args.get('ids', '').split(',') if request.args.get('ids') else None
+    if not raw_ids or not isinstance(raw_ids, list):
+        return {"error": "Provide the recipe IDs as ?ids=1,2,3 or as a JSON list in the 'ids' field."}, 400
+
+    # JSON IDs must be integers (not 1.5, "1" or true); only the query string is parsed
+    if request.method == "POST":
+        if any(not isinstance(recipe_id, int) or isinstance(recipe_id, bool) for recipe_id in raw_ids):
+            return {"error": "Invalid recipe ID(s). IDs must be integers."}, 400
+    else:
+        try:
+            raw_ids = [int(recipe_id) for recipe_id in raw_ids]
+        except ValueError:
+            return {"error": "Invalid recipe ID(s). IDs must be integers."}, 400
+    # Keep the first occurrence of each ID, in the order requested
+    recipe_ids = list(dict.fromkeys(raw_ids))
+
+    max_ids = current_app.config['BATCH_MAX_IDS']
+    if len(recipe_ids) > max_ids:
+        return {"error": f"Too many recipe IDs. At most {max_ids} can be requested at once."}, 400
+
+    # Load all requested recipes and their relationships with one query per table
+    stmt = db.select(Recipe).where(Recipe.recipe_id.in_(recipe_ids)).options(*recipe_load_options())
+    found = {recipe.recipe_id: recipe for recipe in db.session.scalars(stmt)}
+
+    current_user_id = get_jwt_identity()
+    is_admin = None
+    recipes, errors = {}, {}
+    for recipe_id in recipe_ids:
+        recipe = found.get(recipe_id)
+        if recipe is None:
+            errors[str(recipe_id)] = {"error": "Recipe not found.", "status": 404}
+            continue
+
+        # Check if the recipe is public or the current user is its author, and otherwise
+        # whether the user is an admin (looked up once for the whole batch)
+        if not recipe.is_public and recipe.user_id != current_user_id:
+            if is_admin is None:
+                is_admin = bool(current_user_is_admin())
+            if not is_admin:
+                errors[str(recipe_id)] = {"error": "You are not authorized to access this resource", "status": 403}
+                continue
+        recipes[str(recipe_id)] = recipe
+
+    # Serialize the recipes in one call of the schema
+    dumped = RecipeSchema(many=True).dump(recipes.values())
+    return {"recipes": dict(zip(recipes.keys(), dumped)), "errors": errors}
+
 @recipes_bp.route("/user")
 @jwt_required()
 def get_user_recipes():
@@ -92,27 +240,37 @@ def get_user_recipes():
     current_user_id = get_jwt_identity()
 
     # Query all recipes associated with the current user
-    recipes = Recipe.query.filter_by(user_id=current_user_id).all()
+    recipes = Recipe.query.filter_by(user_id=current_user_id).options(*recipe_load_options()).all()
 
     # Return the serialized recipe
     return RecipeSchema(many=True).dump(recipes), 200
 
 @recipes_bp.route('/public/filter')
+@cached_response(RECIPE_TABLES)
 def filter_recipes():
     """
-    Endpoint to filter public recipes based on title, preparation time, ingredient name, and cuisine name.
+    Endpoint to filter public recipes based on title, preparation time, ingredient name, cuisine name
+    and creation date, optionally with paginated results and facet counts.
 
     Query Parameters:
         - title: Title or name of the recipe (string)
         - prep_time: Exact preparation time in minutes (integer)
+        - prep_time_min, prep_time_max: Range of preparation time in minutes, inclusive (integer)
         - ingredient_name: Name of the ingredient (string)
         - cuisine_name: Name of the cuisine category (string)
+        - created_after, created_before: Range of creation dates, inclusive (YYYY-MM-DD)
+        - facets: Comma-separated facets to count over all matching recipes: cuisine, prep_time_bucket
+        - page, per_page: Page number (from 1) and page size (1 to 100, default 20)
 
     Returns:
         list: A JSON representation of filtered recipes or an error if no match is found for any parameter.
+            When facets, page or per_page is given, a dict with the page of recipes, the total
+            number of matching recipes and the facet counts; an empty result is then returned
+            with status 200 ("recipes": [], "total": 0) rather than 404, like an empty page.
     """
     # Define valid parameters
-    valid_params = {'title', 'prep_time', 'ingredient_name', 'cuisine_name'}
+    valid_params = {'title', 'prep_time', 'prep_time_min', 'prep_time_max', 'ingredient_name', 'cuisine_name',
+                    'created_after', 'created_before', 'facets', 'page', 'per_page'}
     
     # Retrieve query parameters
     query_params = request.args.to_dict()
@@ -124,36 +282,185 @@ def filter_recipes():
 
     # Extract valid query parameters
     title = query_params.get('title')
-    prep_time = query_params.get('prep_time')
     ingredient_name = query_params.get('ingredient_name')
     cuisine_name = query_params.get('cuisine_name')
 
-    # Base query for public recipes
-    query = Recipe.query.filter_by(is_public=True)
+    # Parse the numeric and date parameters
+    try:
+        prep_time, prep_time_min, prep_time_max, page, per_page = (
+            int(query_params[param]) if query_params.get(param) else None
+            for param in ('prep_time', 'prep_time_min', 'prep_time_max', 'page', 'per_page')
+        )
+    except ValueError:
+        return {"error": "Invalid preparation time or page. Must be a valid integer."}, 400
+    try:
+        created_after, created_before = (
+            date.fromisoformat(query_params[param]) if query_params.get(param) else None
+            for param in ('created_after', 'created_before')
+        )
+    except ValueError:
+        return {"error": "Invalid date. Must be in the format YYYY-MM-DD."}, 400
+
+    facets = [facet.strip() for facet in query_params.get('facets', '').split(',') if facet.strip()]
+    invalid_facets = [facet for facet in facets if facet not in FILTER_FACETS]
+    if invalid_facets:
+        return {"error": f"Invalid facet(s): {', '.join(invalid_facets)}. Valid facets: {', '.join(FILTER_FACETS)}"}, 400
+
+    # Conditions on public recipes, shared by the results and the facet counts
+    conditions = [Recipe.is_public.is_(True)]
 
     # Apply filters based on valid query parameters
     if title:
-        query = query.filter(Recipe.title.ilike(f"%{title}%"))
-    if prep_time:
-        try:
-            prep_time = int(prep_time)
-            query = query.filter(Recipe.preparation_time == prep_time)
-        except ValueError:
-            return {"error": "Invalid preparation time. Must be a valid integer."}, 400
+        conditions.append(Recipe.title.ilike(f"%{title}%"))
+    if prep_time is not None:
+        conditions.append(Recipe.preparation_time == prep_time)
+    if prep_time_min is not None:
+        conditions.append(Recipe.preparation_time >= prep_time_min)
+    if prep_time_max is not None:
+        conditions.append(Recipe.preparation_time <= prep_time_max)
+    if created_after:
+        conditions.append(Recipe.date_created >= created_after)
+    if created_before:
+        conditions.append(Recipe.date_created <= created_before)
     if ingredient_name:
-        query = query.join(Recipe.ingredients).filter(Ingredient.name.ilike(f"%{ingredient_name}%"))
+        # Match the name against the (small) ingredient name dictionary, then select the recipes
+        # through the indexed integer IDs instead of scanning the names of every ingredient row.
+        # Ingredients not backfilled yet (flask db backfill-ingredient-names) are matched by name.
+        normalized = normalize_ingredient_name(ingredient_name)
+        name_ids = db.select(IngredientName.ingredient_name_id).where(
+            IngredientName.name.contains(normalized, autoescape=True)
+        )
+        conditions.append(Recipe.recipe_id.in_(
+            db.select(Ingredient.recipe_id).where(db.or_(
+                Ingredient.ingredient_name_id.in_(name_ids),
+                db.and_(Ingredient.ingredient_name_id.is_(None), Ingredient.name.icontains(normalized, autoescape=True))
+            ))
+        ))
     if cuisine_name:
-        query = query.join(Recipe.category).filter(Category.cuisine_name.ilike(f"%{cuisine_name}%"))
+        conditions.append(Recipe.category_id.in_(
+            db.select(Category.category_id).where(Category.cuisine_name.ilike(f"%{cuisine_name}%"))
+        ))
+
+    stmt = db.select(Recipe).where(*conditions).order_by(Recipe.recipe_id).options(*recipe_load_options())
+
+    # Without facets or pagination, return the list of all matching recipes
+    if not facets and page is None and per_page is None:
+        filtered_recipes = db.session.scalars(stmt).all()
+
+        # Check if any recipes were found
+        if not filtered_recipes:
+            return {"error": "No recipes found matching the specified criteria."}, 404
+
+        # Serialize the filtered recipes
+        return RecipeSchema(many=True).dump(filtered_recipes)
+
+    page = 1 if page is None else page
+    per_page = 20 if per_page is None else per_page
+    if page < 1 or not 1 <= per_page <= 100:
+        return {"error": "page must be at least 1 and per_page between 1 and 100."}, 400
+
+    # Count the matching recipes per cuisine and preparation time bucket in a single grouped
+    # query, then fold the groups into the total and the requested facets
+    bucket = prep_time_bucket(Recipe.preparation_time)
+    facet_stmt = (
+        db.select(Category.cuisine_name, bucket, db.func.count())
+        .select_from(Recipe)
+        .outerjoin(Category, Recipe.category_id == Category.category_id)
+        .where(*conditions)
+        .group_by(Category.cuisine_name, bucket)
+    )
+    total = 0
+    counts = {'cuisine': {}, 'prep_time_bucket': {}}
+    for cuisine, prep_bucket, count in db.session.execute(facet_stmt):
+        total += count
+        cuisine = cuisine or 'Uncategorized'
+        counts['cuisine'][cuisine] = counts['cuisine'].get(cuisine, 0) + count
+        counts['prep_time_bucket'][prep_bucket] = counts['prep_time_bucket'].get(prep_bucket, 0) + count
+
+    # Fetch the requested page of recipes, skipping the query when the page is past the end
+    recipes = []
+    if (page - 1) * per_page < total:
+        recipes = db.session.scalars(stmt.limit(per_page).offset((page - 1) * per_page)).all()
+
+    return {
+        "recipes": RecipeSchema(many=True).dump(recipes),
+        "total": total,
+        "page": page,
+        "per_page": per_page,
+        "facets": {facet: counts[facet] for facet in facets},
+    }
+
+@recipes_bp.route('/public/by-ingredients', methods=["POST"])
+def recipes_by_ingredients():
+    """
+    Endpoint to find the public recipes that can be cooked with the ingredients at hand,
+    ranked by the fraction of each recipe's ingredients that are available.
 
-    # Execute the query to fetch filtered recipes
-    filtered_recipes = query.all()
+    Request Body:
+        - ingredients: Names of the available ingredients (list of strings)
+        - min_coverage: Minimum fraction of a recipe's ingredients that must be available, 0 to 1 (optional, default 0)
+        - limit: Maximum number of recipes returned, 1 to 100 (optional, default 20)
 
-    # Check if any recipes were found
-    if not filtered_recipes:
-        return {"error": "No recipes found matching the specified criteria."}, 404
+    Returns:
+        list: The matching recipes with their coverage and their matched and missing ingredients.
+    """
+    body = request.json
+    if not isinstance(body, dict):
+        return {"error": "The request body must be a JSON object."}, 400
+
+    # Validate the ingredients list and the options
+    pantry = body.get('ingredients')
+    if not pantry or not isinstance(pantry, list) or not all(isinstance(name, str) for name in pantry):
+        return {"error": "Provide the available ingredients as a list of names in the 'ingredients' field."}, 400
+    try:
+        min_coverage = float(body.get('min_coverage', 0))
+        limit = int(body.get('limit', 20))
+    except (TypeError, ValueError):
+        return {"error": "Invalid min_coverage or limit. They must be numbers."}, 400
+    if not 0 <= min_coverage <= 1 or not 1 <= limit <= 100:
+        return {"error": "min_coverage must be between 0 and 1 and limit between 1 and 100."}, 400
+
+    # Rank the recipes with the in-memory ingredient index
+    results = search_ingredient_index(pantry, min_coverage=min_coverage, limit=limit)
+    if not results:
+        return {"error": "No recipes found matching the specified ingredients."}, 404
+
+    # Load the ranked recipes with one eager-loaded query and serialize them in rank order
+    stmt = db.select(Recipe).where(Recipe.recipe_id.in_([result['recipe_id'] for result in results])).options(*recipe_load_options())
+    recipes = {recipe.recipe_id: recipe for recipe in db.session.scalars(stmt)}
+    results = [result for result in results if result['recipe_id'] in recipes]
+    dumped = RecipeSchema(many=True).dump([recipes[result['recipe_id']] for result in results])
+
+    return [
+        {"recipe": recipe, "coverage": result['coverage'], "matched": result['matched'], "missing": result['missing']}
+        for recipe, result in zip(dumped, results)
+    ]
+
+@recipes_bp.route('/public/suggest')
+def suggest_completions():
+    """
+    Endpoint to complete what the user typed in the search box with the titles, ingredients
+    and cuisines of the public recipes, from an in-memory prefix index.
 
-    # Serialize the filtered recipes
-    return RecipeSchema(many=True).dump(filtered_recipes)
+    Query Parameters:
+        - prefix: The text typed so far (string)
+        - limit: Maximum number of completions, 1 to 25 (integer, optional, default 10)
+
+    Returns:
+        list: The completions with their type and number of public recipes, most used first.
+            The list is empty when nothing matches.
+    """
+    prefix = request.args.get('prefix', '')
+    if not prefix.strip():
+        return {"error": "Provide the text to complete in the 'prefix' query parameter."}, 400
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return {"error": "Invalid limit. Must be a valid integer."}, 400
+    if not 1 <= limit <= 25:
+        return {"error": "limit must be between 1 and 25."}, 400
+
+    return suggest(prefix, limit)
 
 @recipes_bp.route('/user/<int:user_id>/category/<int:category_id>')
 @jwt_required()
@@ -182,7 +489,7 @@ def recipes_by_user_and_category(user_id, category_id):
         return {"error": "Category not found"}, 404
 
     # Retrieve recipes by category and user ID
-    recipes = Recipe.query.filter_by(category_id=category_id, user_id=user_id).all()
+    recipes = Recipe.query.filter_by(category_id=category_id, user_id=user_id).options(*recipe_load_options()).all()
 
     # Serialize the recipe record to JSON format
     return RecipeSchema(many=True).dump(recipes)
@@ -198,20 +505,20 @@ def recipes_by_user_and_random():
     """
     current_user_id = get_jwt_identity()
 
-    # Query private recipes of the current user
-    private_recipes = Recipe.query.filter_by(user_id=current_user_id).all()
+    # Query the IDs of the private recipes of the current user
+    private_recipe_ids = db.session.scalars(db.select(Recipe.recipe_id).where(Recipe.user_id == current_user_id)).all()
 
-    # Query public recipes
-    public_recipes = Recipe.query.filter_by(is_public=True).all()
+    # Query the IDs of the public recipes
+    public_recipe_ids = db.session.scalars(db.select(Recipe.recipe_id).where(Recipe.is_public.is_(True))).all()
 
     # Combine private and public recipes
-    all_recipes = private_recipes + public_recipes
+    all_recipe_ids = private_recipe_ids + public_recipe_ids
 
-    if not all_recipes:
+    if not all_recipe_ids:
         abort(404, description="No recipes found.")
 
-    # Select a random recipe from all_recipes
-    random_recipe_by_user = random.choice(all_recipes)
+    # Select a random recipe, and load only that one with its relationships
+    random_recipe_by_user = db.session.get(Recipe, random.choice(all_recipe_ids), options=recipe_load_options())
 
     # Serialize the selected recipe
     return RecipeSchema().dump(random_recipe_by_user)
@@ -225,7 +532,7 @@ def random_recipe():
         dict: A JSON representation of a random public recipe record.
     """
     # Fetch all public recipe IDs from the database
-    public_recipe_ids = [recipe.recipe_id for recipe in Recipe.query.filter_by(is_public=True).all()]
+    public_recipe_ids = db.session.scalars(db.select(Recipe.recipe_id).where(Recipe.is_public.is_(True))).all()
 
     if not public_recipe_ids:
         # Handle case where there are no public recipes in the database
@@ -234,8 +541,8 @@ def random_recipe():
     # Choose a random public recipe ID
     random_recipe_id = random.choice(public_recipe_ids)
 
-    # Fetch the recipe with the random public ID
-    recipe = Recipe.query.get(random_recipe_id)
+    # Fetch the recipe with the random public ID and its relationships
+    recipe = db.session.get(Recipe, random_recipe_id, options=recipe_load_options())
 
     # Serialize the recipe record to JSON format
     return RecipeSchema().dump(recipe)
@@ -337,6 +644,275 @@ def create_recipe():
         # Return a generic error message indicating a database error with a 500 Internal Server Error status code
         return {"error": "An error occurred while creating the recipe."}, 500
 
+def fork_title(title):
+    """
+    Generate an unused title for a fork of a recipe. Forks of a fork are numbered from the
+    title of the original recipe, e.g. "Adobo (fork 3)" rather than "Adobo (fork 2) (fork)".
+
+    Args:
+        title (str): The title of the recipe forked.
+
+    Returns:
+        str: "<title> (fork)", or "<title> (fork N)" with the next number if it is taken.
+    """
+    # Leave room for the suffix within the length of the title column
+    base = FORK_SUFFIX.sub('', title)[:Recipe.title.type.length - len(' (fork 99999)')]
+
+    # Find the highest number among the existing forks with one query on the title prefix
+    stmt = db.select(Recipe.title).where(db.or_(
+        Recipe.title == f"{base} (fork)",
+        Recipe.title.startswith(f"{base} (fork ", autoescape=True)
+    ))
+    highest = 0
+    for taken in db.session.scalars(stmt):
+        match = FORK_SUFFIX.fullmatch(taken[len(base):])
+        if match:
+            highest = max(highest, int(match.group(1) or 1))
+
+    return f"{base} (fork)" if highest == 0 else f"{base} (fork {highest + 1})"
+
+def copy_recipe(recipe_id, title, user_id, is_public):
+    """
+    Copy a recipe, its ingredients and its instructions inside the database with
+    INSERT ... SELECT statements, in the current transaction.
+
+    Args:
+        recipe_id (int): The ID of the recipe to copy.
+        title (str): The title of the copy.
+        user_id (int): The ID of the author of the copy.
+        is_public (bool): Whether the copy is public.
+
+    Returns:
+        int: The ID of the copy, or None if the recipe doesn't exist.
+    """
+    new_id = db.session.scalar(
+        db.insert(Recipe).from_select(
+            ['title', 'description', 'is_public', 'preparation_time', 'date_created', 'user_id', 'category_id'],
+            db.select(
+                db.literal(title), Recipe.description, db.literal(is_public), Recipe.preparation_time,
+                db.literal(date.today()), db.literal(user_id), Recipe.category_id
+            ).where(Recipe.recipe_id == recipe_id)
+        ).returning(Recipe.recipe_id)
+    )
+    if new_id is None:
+        return None
+
+    # Copy the ingredients with their normalized names, and the instructions, in their original order
+    db.session.execute(db.insert(Ingredient).from_select(
+        ['name', 'quantity', 'ingredient_name_id', 'recipe_id'],
+        db.select(Ingredient.name, Ingredient.quantity, Ingredient.ingredient_name_id, db.literal(new_id))
+        .where(Ingredient.recipe_id == recipe_id)
+        .order_by(Ingredient.ingredient_id)
+    ))
+    db.session.execute(db.insert(Instruction).from_select(
+        ['step_number', 'task', 'recipe_id'],
+        db.select(Instruction.step_number, Instruction.task, db.literal(new_id))
+        .where(Instruction.recipe_id == recipe_id)
+        .order_by(Instruction.instruction_id)
+    ))
+    return new_id
+
+@recipes_bp.route("/<int:recipe_id>/fork", methods=["POST"])
+@jwt_required()
+def fork_recipe(recipe_id):
+    """
+    Endpoint to copy a recipe, with its ingredients and instructions, to the current user's
+    recipes so that they can tweak it. The copy is made inside the database in one transaction,
+    so the recipe is never sent to the client and back. Public recipes can be forked by any
+    user, private recipes only by their author or an admin.
+
+    The request body is optional and may contain the title of the copy (by default the title
+    of the recipe followed by "(fork)", numbered if taken) and its is_public flag (by default
+    False, so the copy stays private until it is published).
+
+    Args:
+        recipe_id (int): The ID of the recipe to fork.
+
+    Returns:
+        tuple: The serialized copy and HTTP status code 201.
+    """
+    # Load only the columns needed to authorize the fork and count the copy
+    source = db.session.execute(
+        db.select(Recipe.title, Recipe.user_id, Recipe.category_id, Recipe.is_public).where(Recipe.recipe_id == recipe_id)
+    ).one_or_none()
+    if source is None:
+        return {"error": "Recipe not found."}, 404
+
+    # Check if the recipe is public, or the current user is either its author or an admin
+    current_user_id = get_jwt_identity()
+    if not source.is_public and current_user_id != source.user_id and not current_user_is_admin():
+        return {"error": "You are not authorized to access this resource"}, 403
+
+    fork_info = RecipeSchema(only=['title', 'is_public']).load(request.get_json(silent=True) or {}, unknown='exclude')
+    title = fork_info.get('title')
+    is_public = fork_info.get('is_public', False)
+    if title is not None and (not isinstance(title, str) or not title.strip()):
+        return {"error": "title must be a non-empty string."}, 400
+    if not isinstance(is_public, bool):
+        return {"error": "is_public must be a boolean."}, 400
+
+    for attempt in range(FORK_TITLE_ATTEMPTS):
+        try:
+            new_id = copy_recipe(recipe_id, title or fork_title(source.title), current_user_id, is_public)
+            if new_id is None:
+                # The recipe was deleted since it was loaded
+                db.session.rollback()
+                return {"error": "Recipe not found."}, 404
+
+            # Count the copy for its author and category, and tell the caches and indexes about
+            # it, since the flush events don't see the INSERT ... SELECT statements
+            deltas = Counter()
+            count_recipe(deltas, current_user_id, source.category_id, is_public, 1)
+            apply_recipe_counts(db.session, deltas)
+            record_previous_values(db.session, {new_id: None})
+            mark_changed(db.session, ('recipes', 'ingredients', 'instructions'), (new_id,))
+            db.session.commit()
+            break
+
+        except IntegrityError:
+            db.session.rollback()
+            # A title given by the user is taken; a generated one may have been taken by a
+            # concurrent fork, so generate the next one
+            if title or attempt == FORK_TITLE_ATTEMPTS - 1:
+                return {"error": "Recipe title already exists. Please choose a different title."}, 400
+
+        except SQLAlchemyError:
+            db.session.rollback()
+            return {"error": "An error occurred while forking the recipe."}, 500
+
+    # Load the copy with one eager-loaded query and serialize it
+    recipe = db.session.scalars(db.select(Recipe).where(Recipe.recipe_id == new_id).options(*recipe_load_options())).one()
+    return RecipeSchema().dump(recipe), 201
+
+@recipes_bp.route("/bulk", methods=["PATCH"])
+@jwt_required()
+def bulk_update_recipes():
+    """
+    Endpoint to make a recipe public or private, or move it to another category, for many
+    recipes at once. The recipes are selected by their IDs ({"ids": [1, 2, 3]}) or by a filter
+    ({"filter": {"cuisine_name": ..., "is_public": ..., "user_id": ...}}), and the changes are
+    given in the "set" field ({"set": {"is_public": false, "category": {"cuisine_name": ...}}}).
+
+    The recipes are authorized with one query (the user must be their author or an admin) and
+    changed with one UPDATE statement, without loading them with their ingredients and
+    instructions. Recipes selected by IDs are changed only if all of them can be; a filter
+    only selects the recipes of the current user, unless the user is an admin.
+
+    Returns:
+        dict: The number of recipes matched and updated, and the IDs of the recipes updated.
+    """
+    body = request.json
+    if not isinstance(body, dict):
+        return {"error": "Provide the recipes to change as 'ids' or 'filter', and the changes as 'set'."}, 400
+
+    # Validate the changes
+    changes = body.get('set')
+    if not isinstance(changes, dict) or not changes.keys() & {'is_public', 'category'}:
+        return {"error": "Provide is_public and/or category in the 'set' field."}, 400
+    values = {}
+    if 'is_public' in changes:
+        if not isinstance(changes['is_public'], bool):
+            return {"error": "is_public must be a boolean."}, 400
+        values['is_public'] = changes['is_public']
+    cuisine_name = None
+    if 'category' in changes:
+        category_data = changes['category']
+        cuisine_name = category_data.get('cuisine_name') if isinstance(category_data, dict) else None
+        if not isinstance(cuisine_name, str) or not cuisine_name.strip():
+            return {"error": "category must contain a cuisine_name."}, 400
+
+    current_user_id = get_jwt_identity()
+    is_admin = bool(current_user_is_admin())
+    max_recipes = current_app.config['BULK_RECIPES_MAX']
+
+    # Select the recipes with the values needed to authorize the change and update the
+    # counters and statistics, locking them until the update is committed
+    columns = [getattr(Recipe, column) for column in GROUPED_COLUMNS]
+    stmt = db.select(Recipe.recipe_id, *columns).with_for_update(of=Recipe)
+    if 'ids' in body:
+        raw_ids = body['ids']
+        if not isinstance(raw_ids, list) or any(not isinstance(recipe_id, int) or isinstance(recipe_id, bool) for recipe_id in raw_ids):
+            return {"error": "Invalid recipe ID(s). Provide the IDs as a JSON list of integers."}, 400
+        recipe_ids = list(dict.fromkeys(raw_ids))
+        if not recipe_ids:
+            return {"error": "Provide at least one recipe ID."}, 400
+        if len(recipe_ids) > max_recipes:
+            return {"error": f"Too many recipe IDs. At most {max_recipes} recipes can be changed at once."}, 400
+        stmt = stmt.where(Recipe.recipe_id.in_(recipe_ids))
+    elif isinstance(body.get('filter'), dict):
+        criteria = body['filter']
+        unknown = criteria.keys() - {'cuisine_name', 'is_public', 'user_id'}
+        if unknown:
+            return {"error": f"Invalid filter(s): {', '.join(sorted(unknown))}"}, 400
+        if 'cuisine_name' in criteria:
+            stmt = stmt.join(Recipe.category).where(Category.cuisine_name == criteria['cuisine_name'])
+        if 'is_public' in criteria:
+            if not isinstance(criteria['is_public'], bool):
+                return {"error": "is_public must be a boolean."}, 400
+            stmt = stmt.where(Recipe.is_public == criteria['is_public'])
+        if 'user_id' in criteria and (not isinstance(criteria['user_id'], int) or isinstance(criteria['user_id'], bool)):
+            return {"error": "user_id must be an integer."}, 400
+        # Users other than the admin can only change their own recipes
+        user_id = criteria.get('user_id') if is_admin else current_user_id
+        if user_id is not None:
+            stmt = stmt.where(Recipe.user_id == user_id)
+        recipe_ids = None
+        stmt = stmt.order_by(Recipe.recipe_id).limit(max_recipes + 1)
+    else:
+        return {"error": "Provide the recipes to change as 'ids' or 'filter'."}, 400
+
+    previous = {row[0]: dict(zip(GROUPED_COLUMNS, row[1:])) for row in db.session.execute(stmt)}
+    if recipe_ids is None and len(previous) > max_recipes:
+        db.session.rollback()
+        return {"error": f"The filter matches more than {max_recipes} recipes. Narrow it down."}, 400
+
+    # Recipes selected by IDs must all exist and belong to the current user (unless an admin)
+    if recipe_ids is not None:
+        missing = [recipe_id for recipe_id in recipe_ids if recipe_id not in previous]
+        if missing:
+            db.session.rollback()
+            return {"error": "Recipe(s) not found.", "recipe_ids": missing}, 404
+        forbidden = [recipe_id for recipe_id in recipe_ids if not is_admin and previous[recipe_id]['user_id'] != current_user_id]
+        if forbidden:
+            db.session.rollback()
+            return {"error": "You must be the author of the recipes to change them.", "recipe_ids": forbidden}, 403
+
+    try:
+        # Find or create the category
+        if cuisine_name:
+            category = Category.query.filter_by(cuisine_name=cuisine_name).first()
+            if not category:
+                category = Category(cuisine_name=cuisine_name)
+                db.session.add(category)
+                db.session.flush()
+            values['category_id'] = category.category_id
+
+        # Leave out the recipes that already have the new values
+        changed = {
+            recipe_id: old for recipe_id, old in previous.items()
+            if any(old[column] != value for column, value in values.items())
+        }
+        if changed:
+            db.session.execute(db.update(Recipe).where(Recipe.recipe_id.in_(changed)).values(values))
+
+            # Move the recipes between the counters of their categories and visibilities, and
+            # tell the caches, indexes and statistics about the statement
+            deltas = Counter()
+            for old in changed.values():
+                new = {**old, **values}
+                count_recipe(deltas, old['user_id'], old['category_id'], old['is_public'], -1)
+                count_recipe(deltas, new['user_id'], new['category_id'], new['is_public'], 1)
+            apply_recipe_counts(db.session, deltas)
+            record_previous_values(db.session, {recipe_id: tuple(old.values()) for recipe_id, old in changed.items()})
+            mark_changed(db.session, ('recipes',), changed)
+        db.session.commit()
+
+    except SQLAlchemyError:
+        db.session.rollback()
+        return {"error": "An error occurred while updating the recipes."}, 500
+
+    return {"matched": len(previous), "updated": len(changed), "recipe_ids": sorted(changed)}
+
 @recipes_bp.route("/<int:recipe_id>", methods=["PUT", "PATCH"])
 @jwt_required()
 def update_recipe(recipe_id):
@@ -453,6 +1029,68 @@ def update_recipe(recipe_id):
     # Return the serialized updated recipe data
     return RecipeSchema().dump(recipe)
 
+@recipes_bp.route("/<int:recipe_id>/instructions/reorder", methods=["POST"])
+@jwt_required()
+def reorder_instructions(recipe_id):
+    """
+    Endpoint to reorder the steps of a recipe. The request body lists the IDs of all the
+    recipe's instructions in their new order ({"order": [3, 1, 2]}), and the instructions are
+    renumbered from 1 in that order with one UPDATE statement, mapping each instruction ID to
+    its step number with a CASE expression, without loading the instructions or the recipe.
+
+    Args:
+        recipe_id (int): The ID of the recipe whose instructions are reordered.
+
+    Returns:
+        list of dict: The serialized instructions of the recipe, in their new order.
+    """
+    # Fetch the author of the recipe, or return a 404 error if not found
+    recipe = db.session.execute(db.select(Recipe.user_id).where(Recipe.recipe_id == recipe_id)).one_or_none()
+    if recipe is None:
+        return {"error": "Recipe not found."}, 404
+
+    # Call the function that check if the JWT user is the author of the given recipe
+    authorize_owner(recipe)
+
+    body = request.json
+    order = body.get('order') if isinstance(body, dict) else None
+    if not order or not isinstance(order, list):
+        return {"error": "Provide the instruction IDs in their new order as a list in the 'order' field."}, 400
+    try:
+        instruction_ids = [int(instruction_id) for instruction_id in order]
+    except (TypeError, ValueError):
+        return {"error": "Invalid instruction ID(s). IDs must be integers."}, 400
+    if len(set(instruction_ids)) != len(instruction_ids):
+        return {"error": "Each instruction must be listed once."}, 400
+
+    # Check with one aggregate query that the IDs are exactly the instructions of the recipe
+    total, listed = db.session.execute(
+        db.select(db.func.count(), db.func.count(db.case((Instruction.instruction_id.in_(instruction_ids), 1))))
+        .where(Instruction.recipe_id == recipe_id)
+    ).one()
+    if listed != len(instruction_ids) or total != len(instruction_ids):
+        return {"error": f"The order must list each of the {total} instructions of the recipe once."}, 400
+
+    try:
+        # Renumber the steps in one statement: CASE instruction_id WHEN 3 THEN 1 WHEN 1 THEN 2 ... END
+        steps = {instruction_id: step for step, instruction_id in enumerate(instruction_ids, start=1)}
+        db.session.execute(
+            db.update(Instruction)
+            .where(Instruction.recipe_id == recipe_id, Instruction.instruction_id.in_(instruction_ids))
+            .values(step_number=db.case(steps, value=Instruction.instruction_id))
+            .execution_options(synchronize_session=False)
+        )
+        mark_changed(db.session, ('instructions',), (recipe_id,))
+        db.session.commit()
+
+    except SQLAlchemyError:
+        db.session.rollback()
+        return {"error": "An error occurred while reordering the instructions."}, 500
+
+    # Return the instructions in their new order
+    stmt = db.select(Instruction).where(Instruction.recipe_id == recipe_id).order_by(Instruction.step_number, Instruction.instruction_id)
+    return InstructionSchema(many=True).dump(db.session.scalars(stmt))
+
 @recipes_bp.route("/<int:recipe_id>", methods=["DELETE"])
 @jwt_required()
 def delete_recipe(recipe_id):
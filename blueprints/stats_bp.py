@@ -0,0 +1,53 @@
+"""
+This module is a blueprint for the admin-only recipe statistics used by the analytics dashboard.
+"""
+
+from flask import Blueprint, request
+from auth import current_user_is_admin, jwt_required
+from cache import cached_response
+from recipe_stats import summary
+
+# Define a blueprint for statistics routes
+stats_bp = Blueprint('stats', __name__, url_prefix='/stats')
+
+# Tables the statistics are built from, used to invalidate cached responses
+STATS_TABLES = ('recipes', 'categories', 'users')
+
+@stats_bp.before_request
+@jwt_required()  # Ensure that every statistics route is authenticated using JWT
+def require_admin():
+    """
+    Ensure that only admin users can access the routes of this blueprint.
+
+    Returns:
+        tuple: A 403 Forbidden error if the current user is not an admin, otherwise None.
+    """
+    if not current_user_is_admin():
+        return {"error": "Only admin can access this resource"}, 403
+
+@stats_bp.route("/")
+# The response only depends on the query string, since only admins get past require_admin
+@cached_response(STATS_TABLES)
+def recipe_stats():
+    """
+    Route to retrieve the recipe statistics: the number of recipes per category, per author and
+    per visibility, the average and percentiles of the preparation times, and the number of
+    recipes created each day.
+
+    Query Parameters:
+        - top: Number of authors with the most recipes listed, 1 to 100 (integer, optional, default 20)
+        - days: Number of days, up to today, of the creation rate, 1 to 366 (integer, optional, default 30)
+
+    Returns:
+        dict: The recipe statistics.
+    """
+    # Validate the number of authors and days requested
+    try:
+        top_users = int(request.args.get('top', 20))
+        days = int(request.args.get('days', 30))
+    except ValueError:
+        return {"error": "Invalid top or days. They must be valid integers."}, 400
+    if not 1 <= top_users <= 100 or not 1 <= days <= 366:
+        return {"error": "top must be between 1 and 100 and days between 1 and 366."}, 400
+
+    return summary(top_users, days)
@@ -2,16 +2,19 @@
 This module is a blueprint for routes to manage user records.
 """
 
+from concurrent.futures.process import BrokenProcessPool
 from datetime import timedelta
-from flask import request
+from flask import request, current_app
 from flask import Blueprint
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, get_jwt_identity
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm.exc import NoResultFound
 from init import db, bcrypt
-from auth import current_user_is_admin
+from auth import current_user_is_admin, jwt_required
 from models.user import User, UserSchema
 from models.recipe import Recipe
+from tracing import span
+from provisioning import discard_hashing_pool, hashing_pool, import_users
 
 # Define a blueprint for user-related routes
 users_bp = Blueprint('users', __name__, url_prefix='/users')
@@ -40,8 +43,12 @@ def login():
     # Execute the query and fetch the scalar result (single row), if any.
     user = db.session.scalar(stmt)
 
+    # Check the password (a deliberately slow bcrypt comparison) if the user exists
+    with span('bcrypt.check_password_hash'):
+        password_is_valid = bool(user) and bcrypt.check_password_hash(user.password, params['password'])
+
     # Check if the user exists and if the password is correct
-    if user and bcrypt.check_password_hash(user.password, params['password']):
+    if password_is_valid:
         # Generate a JWT with a 3-hour expiration time
         token = create_access_token(identity=user.user_id, expires_delta=timedelta(hours=3))
         # Return the JWT
@@ -54,23 +61,56 @@ def login():
 @jwt_required()  # Ensure that the request is authenticated using JWT
 def get_all_users():
     """
-    Route to fetch all users from the database. Accessible only by admin users.
+    Route to fetch the users from the database, one page at a time. Accessible only by admin users.
+
+    Users are listed by ID and paginated with a cursor: each page returns the cursor of the
+    next one, so deep pages cost the same as the first (no OFFSET scan).
+
+    Query Parameters:
+        - email: Case-insensitive prefix of the email address (string, optional)
+        - name: Case-insensitive prefix of the name (string, optional)
+        - counts: Include the number of recipes and public recipes of each user (true/false, optional, default false)
+        - limit: Number of users per page, 1 to 100 (integer, optional, default 50)
+        - cursor: The next_cursor returned with the previous page (string, optional)
 
     Returns:
-        list of dict: A JSON representation of all user records.
+        dict: The users of the page (excluding passwords) and the cursor of the next page,
+            or None on the last page.
     """
     # Check if the current user is an admin
     if not current_user_is_admin():
         # If not an admin, return a 403 Forbidden error
         return {"error": "Only admin can access this resource"}, 403
 
-    # Create a select statement to fetch all users
+    # Validate the page size and the cursor
+    try:
+        limit = int(request.args.get('limit', 50))
+        after = int(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        return {"error": "Invalid limit or cursor."}, 400
+    if not 1 <= limit <= 100:
+        return {"error": "limit must be between 1 and 100."}, 400
+    include_counts = request.args.get('counts', 'false').lower() in ('1', 'true', 'yes')
+
+    # Filter by case-insensitive prefixes, matched against the lower(email) and lower(name) indexes
     stmt = db.select(User)
-    # Execute the query and fetch all user records
-    users = db.session.scalars(stmt).all()
-
-    # Return the serialized user data (excluding the password)
-    return UserSchema(many=True, exclude=['password']).dump(users)
+    for field in ('email', 'name'):
+        prefix = request.args.get(field)
+        if prefix:
+            stmt = stmt.where(db.func.lower(getattr(User, field)).startswith(prefix.lower(), autoescape=True))
+    if after is not None:
+        stmt = stmt.where(User.user_id > after)
+
+    # Fetch one extra user to know whether there is a next page
+    users = db.session.scalars(stmt.order_by(User.user_id).limit(limit + 1)).all()
+    next_cursor = str(users[limit - 1].user_id) if len(users) > limit else None
+
+    # Return the serialized user data (excluding the password, and the counts unless requested)
+    exclude = ['password'] if include_counts else ['password', 'recipe_count', 'public_recipe_count']
+    return {
+        "users": UserSchema(many=True, exclude=exclude).dump(users[:limit]),
+        "next_cursor": next_cursor,
+    }
 
 @users_bp.route("/<int:user_id>")
 @jwt_required()  # Ensure that the request is authenticated using JWT
@@ -120,10 +160,14 @@ def register_user():
     try:
         # Load and validate the incoming user data against the UserSchema
         user_info = UserSchema(only=['email', 'password', 'name', 'is_admin']).load(request.json, unknown='exclude')
+        # Hash the password (a deliberately slow bcrypt operation)
+        with span('bcrypt.generate_password_hash'):
+            password_hash = bcrypt.generate_password_hash(user_info['password']).decode('utf-8')
+
         # Create a new User instance with the provided data
         user = User(
             email=user_info['email'],
-            password=bcrypt.generate_password_hash(user_info['password']).decode('utf-8'),
+            password=password_hash,
             name=user_info['name'],
             is_admin=user_info.get('is_admin', False)
         )
@@ -147,6 +191,54 @@ def register_user():
         # Return a 500 Internal Server Error with a generic error message
         return {"error": "An error occurred while creating the user."}, 500
 
+@users_bp.route("/bulk", methods=["POST"])
+@jwt_required()
+def bulk_register_users():
+    """
+    This endpoint creates many users in one request, for onboarding an organisation.
+    Accessible only by admin users.
+
+    Each user is validated like POST /users/register. The passwords are hashed in the pool of
+    processes shared by the requests of this worker, and the users inserted in batches; users
+    whose email already exists are skipped and reported as duplicates. Larger imports go
+    through `flask users import`.
+
+    Request Body:
+        - users: The users to create, each with email, password, name and optionally is_admin (list)
+
+    Returns:
+        tuple: The number of users created, the duplicate emails and the invalid users (with
+            their index in the list and their validation errors), and an HTTP status code:
+            201 if any user was created, otherwise 200.
+    """
+    # Check if the current user is an admin
+    if not current_user_is_admin():
+        # If not an admin, return a 403 Forbidden error
+        return {"error": "Only admin can register users"}, 403
+
+    body = request.json
+    records = body.get('users') if isinstance(body, dict) else None
+    if not records or not isinstance(records, list):
+        return {"error": "Provide the users to create as a list in the 'users' field."}, 400
+    max_users = current_app.config['BULK_USERS_MAX']
+    if len(records) > max_users:
+        return {"error": f"At most {max_users} users can be created per request."}, 400
+
+    try:
+        workers = current_app.config['BULK_USERS_WORKERS']
+        report = import_users(records, workers=workers, executor=hashing_pool(workers))
+    except BrokenProcessPool:
+        # A hashing process died; start a new pool for the next request
+        discard_hashing_pool()
+        db.session.rollback()
+        return {"error": "An error occurred while creating the users."}, 500
+    except SQLAlchemyError:
+        # Rollback the batch being inserted; the batches already committed are kept
+        db.session.rollback()
+        return {"error": "An error occurred while creating the users."}, 500
+
+    return report, 201 if report['created'] else 200
+
 @users_bp.route("/<int:user_id>", methods=["PUT", "PATCH"])
 @jwt_required()  # Ensure that the request is authenticated using JWT
 def update_user(user_id):
@@ -179,7 +271,8 @@ def update_user(user_id):
         # Update the user fields if new values are provided, otherwise keep the existing values
         user.email = user_info.get('email', user.email)
         if 'password' in user_info:
-            user.password = bcrypt.generate_password_hash(user_info['password']).decode('utf-8')
+            with span('bcrypt.generate_password_hash'):
+                user.password = bcrypt.generate_password_hash(user_info['password']).decode('utf-8')
         user.name = user_info.get('name', user.name)
         
         # Only allow admins to update the is_admin field
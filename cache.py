@@ -0,0 +1,191 @@
+"""
+This module caches the responses of public GET routes in each worker process.
+
+Cached responses carry an ETag, so clients can revalidate them with If-None-Match, and keep
+their compressed variants (one per content coding), so a cache hit is neither re-rendered nor
+recompressed. Entries expire after RESPONSE_CACHE_TTL seconds and are invalidated as soon as
+a committed transaction writes to one of the tables they were built from (see events.py).
+When RESPONSE_CACHE_VERSION_FILE is set, a write in any worker also invalidates the caches of
+the other workers sharing that file.
+"""
+
+# Import statements
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, current_app, make_response
+from compression import response_encoding, compress, set_encoded_headers, compression_level
+from encoding import response_format
+from events import data_changed
+from metrics import record_cache, inc
+
+# Name of the cache in the cache hit metrics
+CACHE_NAME = 'responses'
+
+# Cached responses by request path, query string and response format: key -> entry
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+# Incremented on every invalidation, so that a response rendered from data that changed
+# while it was being built isn't stored
+_generation = {'value': 0}
+
+# Modification time of the shared version file when this worker last synchronised with it
+_version = {'mtime_ns': None}
+
+
+def body_etag(body):
+    """
+    Return the ETag of a response body, a hash of its uncompressed bytes.
+
+    Args:
+        body (bytes): The uncompressed response body.
+
+    Returns:
+        str: The ETag, unquoted.
+    """
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def _invalidate_all():
+    """
+    Drop every cached response of this worker.
+    """
+    with _lock:
+        _entries.clear()
+        _generation['value'] += 1
+
+
+def _check_version_file():
+    """
+    Drop the cached responses if another worker wrote since the last check.
+    """
+    path = current_app.config['RESPONSE_CACHE_VERSION_FILE']
+    if not path:
+        return
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime_ns = 0
+    if mtime_ns != _version['mtime_ns']:
+        _invalidate_all()
+        _version['mtime_ns'] = mtime_ns
+
+
+def _invalidate(app, tables, recipe_ids=frozenset(), **_):
+    """
+    Drop the cached responses built from any of the changed tables, and tell the other
+    workers through the shared version file.
+
+    Args:
+        app (Flask): The application that committed the changes (None outside an application context).
+        tables (frozenset): The names of the tables written.
+        recipe_ids (frozenset): The IDs of the recipes affected (unused; entries are invalidated per table).
+    """
+    with _lock:
+        for key in [key for key, entry in _entries.items() if entry['tables'] & tables]:
+            del _entries[key]
+        _generation['value'] += 1
+
+    path = app.config.get('RESPONSE_CACHE_VERSION_FILE') if app else None
+    if path:
+        with open(path, 'a', encoding='utf-8'):
+            os.utime(path)
+        # Our own entries are already up to date, so don't clear them again on the next lookup
+        _version['mtime_ns'] = os.stat(path).st_mtime_ns
+
+
+def _respond(entry, status=None):
+    """
+    Build a response from a cache entry, with the compressed variant the client accepts.
+    """
+    response = current_app.response_class(entry['body'], status=status or entry['status'], mimetype=entry['mimetype'])
+    response.set_etag(entry['etag'])
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+
+    encoding = response_encoding(response)
+    if encoding and len(entry['body']) >= current_app.config['COMPRESS_MIN_SIZE']:
+        variant = entry['variants'].get(encoding)
+        if variant is None:
+            variant = entry['variants'][encoding] = compress(entry['body'], encoding, compression_level(encoding))
+        response.set_data(variant)
+        set_encoded_headers(response, encoding)
+    return response
+
+
+def cached_response(tables):
+    """
+    Decorator caching the successful responses of a public GET route.
+
+    The route must not depend on the user making the request, only on its path and query string.
+
+    Args:
+        tables (tuple): The names of the tables the response is built from.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            ttl = current_app.config['RESPONSE_CACHE_TTL']
+            if not ttl or request.method != 'GET':
+                return view(*args, **kwargs)
+
+            _check_version_file()
+            key = (request.path, tuple(sorted(request.args.items(multi=True))), response_format())
+            now = time.monotonic()
+            with _lock:
+                entry = _entries.get(key)
+                if entry is not None and entry['expires'] > now:
+                    _entries.move_to_end(key)
+                else:
+                    entry = None
+            record_cache(CACHE_NAME, entry is not None)
+            if entry is not None:
+                return _respond(entry)
+
+            generation = _generation['value']
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+
+            body = response.get_data()
+            entry = {
+                'body': body,
+                'status': response.status_code,
+                'mimetype': response.mimetype,
+                'etag': body_etag(body),
+                'variants': {},
+                'tables': frozenset(tables),
+                'expires': now + ttl,
+            }
+            with _lock:
+                if generation != _generation['value']:
+                    return _respond(entry, response.status_code)
+                _entries[key] = entry
+                while len(_entries) > current_app.config['RESPONSE_CACHE_MAX_ENTRIES']:
+                    _entries.popitem(last=False)
+                    inc('cache_evictions_total', (('cache', CACHE_NAME),))
+            return _respond(entry, response.status_code)
+        return wrapper
+    return decorator
+
+
+def init_response_cache(app):
+    """
+    Configure the response cache and subscribe it to data changes.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    app.config.setdefault('RESPONSE_CACHE_TTL', 60)
+    app.config.setdefault('RESPONSE_CACHE_MAX_ENTRIES', 256)
+    app.config.setdefault('RESPONSE_CACHE_VERSION_FILE', None)
+    data_changed.connect(_invalidate)
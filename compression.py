@@ -0,0 +1,209 @@
+"""
+This module compresses responses with the best encoding accepted by the client: zstd, brotli
+or gzip. Brotli and zstd are used when the optional brotli and zstandard packages are
+installed. Responses smaller than COMPRESS_MIN_SIZE are sent as is, and streamed responses
+are compressed chunk by chunk so that each chunk still reaches the client as it is produced.
+"""
+
+# Import statements
+import zlib
+from flask import request, current_app
+from werkzeug.datastructures import ETags
+from werkzeug.http import unquote_etag
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+# Encodings available in this process, in order of server preference
+AVAILABLE_ENCODINGS = tuple(
+    encoding for encoding, available in (('zstd', zstandard), ('br', brotli), ('gzip', True)) if available
+)
+
+# Configuration key of the compression level of each encoding
+LEVEL_SETTINGS = {'gzip': 'COMPRESS_GZIP_LEVEL', 'br': 'COMPRESS_BROTLI_LEVEL', 'zstd': 'COMPRESS_ZSTD_LEVEL'}
+
+# Content types worth compressing (images and archives are already compressed)
+COMPRESSIBLE_TYPES = ('application/json', 'application/msgpack', 'text/')
+
+
+def negotiate(accept_encodings, allowed):
+    """
+    Choose the encoding for a response from the client's Accept-Encoding header.
+
+    The encoding with the highest quality value wins; between encodings of equal quality
+    the server's order of preference is used.
+
+    Args:
+        accept_encodings (Accept): The parsed Accept-Encoding header of the request.
+        allowed (tuple): The encodings enabled on the server, in order of preference.
+
+    Returns:
+        str: The chosen encoding, or None to send the response uncompressed.
+    """
+    best, best_quality = None, 0
+    for encoding in allowed:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compression_level(encoding):
+    """
+    Return the configured compression level of an encoding.
+    """
+    return current_app.config[LEVEL_SETTINGS[encoding]]
+
+
+def compress(data, encoding, level):
+    """
+    Compress a complete body.
+
+    Args:
+        data (bytes): The body to compress.
+        encoding (str): The content coding: gzip, br or zstd.
+        level (int): The compression level of the encoding.
+
+    Returns:
+        bytes: The compressed body.
+    """
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def compress_stream(chunks, encoding, level):
+    """
+    Compress a streamed body, flushing the compressor after each chunk so that clients
+    receive every chunk as soon as the application produces it.
+
+    Args:
+        chunks (iterable): The chunks of the body.
+        encoding (str): The content coding: gzip, br or zstd.
+        level (int): The compression level of the encoding.
+
+    Yields:
+        bytes: The compressed chunks.
+    """
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        process, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+    elif encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        process, flush = compressor.compress, lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        finish = compressor.flush
+
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            output = process(chunk) + flush()
+            if output:
+                yield output
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def response_encoding(response):
+    """
+    Choose the encoding for a response, or None if it shouldn't be compressed.
+
+    Args:
+        response (Response): The response being returned to the client.
+
+    Returns:
+        str: The chosen encoding, or None.
+    """
+    if (
+        not current_app.config['COMPRESS_ENABLED']
+        or request.method == 'HEAD'
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or 'no-transform' in response.headers.get('Cache-Control', '')
+        or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)
+    ):
+        return None
+    allowed = tuple(encoding for encoding in current_app.config['COMPRESS_ENCODINGS'] if encoding in AVAILABLE_ENCODINGS)
+    return negotiate(request.accept_encodings, allowed)
+
+
+def set_encoded_headers(response, encoding):
+    """
+    Mark a response as compressed: set Content-Encoding and weaken its ETag, which is only
+    equal to the ETag of the uncompressed representation in the weak comparison.
+
+    Args:
+        response (Response): The compressed response (a Flask or a Starlette response).
+        encoding (str): The content coding of the body.
+    """
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = unquote_etag(response.headers.get('ETag'))
+    if etag and not weak:
+        response.headers['ETag'] = ETags(weak_etags=[etag]).to_header()
+
+
+def _compress_response(response):
+    """
+    Compress the response body with the negotiated encoding.
+
+    Args:
+        response (Response): The response being returned to the client.
+
+    Returns:
+        Response: The response, compressed when the client accepts it and it is large enough.
+    """
+    if not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    encoding = response_encoding(response)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding, compression_level(encoding))
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress(data, encoding, compression_level(encoding)))
+
+    set_encoded_headers(response, encoding)
+    return response
+
+
+def init_compression(app):
+    """
+    Register the response compression stage with the application.
+
+    The hook is registered after the others so that it runs first among the after_request
+    hooks, and the request timings of the metrics, traces and profiles include compression.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    app.config.setdefault('COMPRESS_ENABLED', True)
+    app.config.setdefault('COMPRESS_ENCODINGS', AVAILABLE_ENCODINGS)
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BROTLI_LEVEL', 4)
+    app.config.setdefault('COMPRESS_ZSTD_LEVEL', 3)
+    app.after_request(_compress_response)
@@ -0,0 +1,251 @@
+"""
+This module configures the database engines and routes read-only requests to a replica.
+
+GET/HEAD requests handled by the read blueprints run their queries against the "replica" bind
+(configured with DB_REPLICA_URI). Everything else, including any flush, uses the primary.
+After a user writes, their reads stay on the primary for DB_REPLICA_STICKY_SECONDS so that
+they always see their own changes, and the primary is used whenever the replica is unreachable.
+
+The write is remembered with a cookie (for browsers) and per user ID of the JWT (for API clients
+that don't keep cookies). The user IDs are held by each process, unless DB_REPLICA_STICKY_DIR
+names a directory shared by the workers, where the time until which a user reads from the
+primary is kept as the modification time of a file named after the user ID. Workers on other
+hosts don't share that directory, so a token client whose requests are balanced across hosts
+may not see its own writes for up to the replication lag.
+"""
+
+# Import statements
+import logging
+import os
+import threading
+import time
+from flask import g, request, has_request_context, current_app
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import ArgumentError, SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+# Blueprints whose GET handlers may read from the replica
+READ_BLUEPRINTS = {'recipes', 'categories', 'users'}
+
+# Bind key of the read replica in SQLALCHEMY_BINDS
+REPLICA_BIND = 'replica'
+
+# Cookie that keeps a client's reads on the primary after its own writes (shared by all workers)
+STICKY_COOKIE = 'db_read_primary_until'
+
+# Users that wrote recently, mapped to the time until which their reads use the primary
+_recent_writers = {}
+
+# Health of the replica: the time it was last checked and whether it was reachable
+_replica_state = {'checked_at': 0.0, 'available': False}
+_replica_lock = threading.Lock()
+
+
+def engine_options(uri, pool_size, max_overflow, pool_recycle, pool_timeout, pool_pre_ping, statement_timeout_ms):
+    """
+    Build the SQLAlchemy engine options shared by the primary and the replica.
+
+    Args:
+        uri (str): The database URI of the primary.
+        pool_size (int): The number of connections kept open in the pool.
+        max_overflow (int): The number of extra connections allowed beyond the pool size.
+        pool_recycle (int): Seconds after which a connection is replaced (-1 to disable).
+        pool_timeout (int): Seconds to wait for a connection before giving up.
+        pool_pre_ping (bool): Whether to test connections for liveness on checkout.
+        statement_timeout_ms (int): The maximum duration of a statement on PostgreSQL (None for no limit).
+
+    Returns:
+        dict: The value for SQLALCHEMY_ENGINE_OPTIONS.
+    """
+    options = {'pool_pre_ping': pool_pre_ping, 'pool_recycle': pool_recycle}
+
+    try:
+        url = make_url(uri) if uri else None
+    except ArgumentError:
+        url = None
+
+    # In-memory SQLite databases use a single static connection, which has no pool to size
+    in_memory = url is not None and url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+    if url is not None and not in_memory:
+        options.update(pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout)
+
+    if url is not None and url.get_backend_name() == 'postgresql' and statement_timeout_ms:
+        options['connect_args'] = {'options': f'-c statement_timeout={int(statement_timeout_ms)}'}
+
+    return options
+
+
+def _replica_available(db):
+    """
+    Check whether the replica is reachable, re-checking at most every DB_REPLICA_CHECK_SECONDS.
+    """
+    interval = current_app.config['DB_REPLICA_CHECK_SECONDS']
+    now = time.monotonic()
+    if now - _replica_state['checked_at'] < interval:
+        return _replica_state['available']
+
+    with _replica_lock:
+        if now - _replica_state['checked_at'] >= interval:
+            try:
+                with db.engines[REPLICA_BIND].connect():
+                    available = True
+            except SQLAlchemyError:
+                logger.warning('Read replica is unreachable, reading from the primary')
+                available = False
+            _replica_state.update(checked_at=now, available=available)
+    return _replica_state['available']
+
+
+def mark_replica_unavailable():
+    """
+    Record that the replica could not be reached (e.g. while filling its pool at warmup), so
+    that reads use the primary until the replica is checked again.
+    """
+    logger.warning('Read replica is unreachable, reading from the primary')
+    with _replica_lock:
+        _replica_state.update(checked_at=time.monotonic(), available=False)
+
+
+def _sticky_path(user_id):
+    """
+    Return the file of a user in DB_REPLICA_STICKY_DIR, or None if it isn't configured.
+    """
+    directory = current_app.config['DB_REPLICA_STICKY_DIR']
+    return os.path.join(directory, str(user_id)) if directory else None
+
+
+def _pinned_until(user_id):
+    """
+    Return the time until which a user's reads use the primary (0 if they don't).
+    """
+    path = _sticky_path(user_id)
+    if path is None:
+        return _recent_writers.get(user_id, 0)
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0
+
+
+def _pin_user(user_id, until):
+    """
+    Keep a user's reads on the primary until the given time, in all the workers sharing
+    DB_REPLICA_STICKY_DIR, or in this process if it isn't configured.
+    """
+    path = _sticky_path(user_id)
+    if path is not None:
+        try:
+            with open(path, 'a', encoding='utf-8'):
+                pass
+            os.utime(path, (until, until))
+            return
+        except OSError:
+            logger.warning('Could not write %s, keeping the user on the primary in this worker only', path)
+
+    _recent_writers[user_id] = until
+    # Forget writers whose sticky window has passed so the map stays small
+    if len(_recent_writers) > 10000:
+        now = time.time()
+        for key in [key for key, value in list(_recent_writers.items()) if value <= now]:
+            _recent_writers.pop(key, None)
+
+
+def _reads_pinned_to_primary():
+    """
+    Check whether the current client or user wrote recently and must read from the primary.
+    """
+    now = time.time()
+    try:
+        pinned_until = float(request.cookies.get(STICKY_COOKIE, 0))
+    except ValueError:
+        pinned_until = 0
+    if pinned_until > now:
+        return True
+
+    user_id = get_jwt_identity() if g.get('_jwt_extended_jwt') else None
+    return user_id is not None and _pinned_until(user_id) > now
+
+
+class RoutingSession(Session):
+    """
+    Flask-SQLAlchemy session that sends the queries of read-only requests to the replica.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        """
+        Select the replica for reads of read-only requests, otherwise the usual engine.
+        """
+        if (
+            bind is None
+            and not self._flushing
+            and has_request_context()
+            and g.get('db_read_only')
+            and REPLICA_BIND in self._db.engines
+            and not _reads_pinned_to_primary()
+            and _replica_available(self._db)
+        ):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _record_write(session, flush_context):
+    """
+    Remember that the current request wrote to the primary.
+    """
+    if has_request_context():
+        g.db_wrote = True
+
+
+def _mark_read_only():
+    """
+    Mark GET/HEAD requests of the read blueprints as eligible for the replica.
+    """
+    g.db_read_only = request.method in ('GET', 'HEAD') and request.blueprint in READ_BLUEPRINTS
+
+
+def _pin_writer_to_primary(response):
+    """
+    After a request that successfully wrote to the database, keep the writer's reads on the
+    primary for a while so that they see their own changes despite replication lag.
+
+    Args:
+        response (Response): The response being returned to the client.
+
+    Returns:
+        Response: The response, with the sticky cookie set after a successful write.
+    """
+    if not g.get('db_wrote') or response.status_code >= 400:
+        return response
+
+    sticky_seconds = current_app.config['DB_REPLICA_STICKY_SECONDS']
+    until = time.time() + sticky_seconds
+    response.set_cookie(STICKY_COOKIE, f'{until:.3f}', max_age=sticky_seconds, httponly=True, samesite='Lax')
+
+    user_id = get_jwt_identity() if g.get('_jwt_extended_jwt') else None
+    if user_id is not None:
+        _pin_user(user_id, until)
+    return response
+
+
+def init_db_routing(app):
+    """
+    Register the request hooks that route reads to the replica when one is configured.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    app.config.setdefault('DB_REPLICA_STICKY_SECONDS', 10)
+    app.config.setdefault('DB_REPLICA_CHECK_SECONDS', 5)
+    app.config.setdefault('DB_REPLICA_STICKY_DIR', None)
+    if REPLICA_BIND not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return
+
+    if app.config['DB_REPLICA_STICKY_DIR']:
+        os.makedirs(app.config['DB_REPLICA_STICKY_DIR'], exist_ok=True)
+
+    app.before_request(_mark_read_only)
+    app.after_request(_pin_writer_to_primary)
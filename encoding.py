@@ -0,0 +1,110 @@
+"""
+This module defines how API responses and request bodies are encoded.
+
+Responses are JSON unless the client prefers MessagePack (Accept: application/msgpack), and
+request bodies may be sent as MessagePack with Content-Type: application/msgpack. Both formats
+carry the same data, produced and validated by the same marshmallow schemas.
+"""
+
+# Import statements
+import msgpack
+from flask import Request, request, has_request_context
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import BadRequest
+from tracing import span
+
+# Media type of MessagePack bodies, and the legacy alias still sent by some clients
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, 'application/x-msgpack')
+
+
+def preferred_format(accept_mimetypes):
+    """
+    Choose the response format from the client's Accept header. MessagePack is only used when
+    the client ranks it above JSON, so browsers and clients sending */* keep receiving JSON.
+
+    Args:
+        accept_mimetypes (MIMEAccept): The parsed Accept header of the request.
+
+    Returns:
+        str: 'msgpack' or 'json'.
+    """
+    best = accept_mimetypes.best_match(('application/json', *MSGPACK_MIMETYPES))
+    return 'msgpack' if best in MSGPACK_MIMETYPES else 'json'
+
+
+def response_format():
+    """
+    Return the response format negotiated for the current request ('json' outside a request).
+    """
+    if not has_request_context():
+        return 'json'
+    return preferred_format(request.accept_mimetypes)
+
+
+def packb(data, default):
+    """
+    Encode data as MessagePack.
+
+    Args:
+        data: The data to encode.
+        default (callable): Converts objects MessagePack can't encode (e.g. dates) to ones it can.
+
+    Returns:
+        bytes: The MessagePack body.
+    """
+    return msgpack.packb(data, default=default, use_bin_type=True)
+
+
+class APIJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider that encodes responses as JSON or MessagePack, as negotiated with the client,
+    and records response encoding as a span of the request trace.
+    """
+    def response(self, *args, **kwargs):
+        """
+        Serialize the given data to JSON or MessagePack and wrap it in a response object.
+
+        Returns:
+            Response: The JSON or MessagePack response.
+        """
+        response_type = response_format()
+        with span('response.encode', **{'response.format': response_type}):
+            if response_type == 'json':
+                response = super().response(*args, **kwargs)
+            else:
+                data = self._prepare_response_obj(args, kwargs)
+                response = self._app.response_class(packb(data, self.default), mimetype=MSGPACK_MIMETYPE)
+
+        # Caches between the client and the API must not mix up the two formats
+        if has_request_context():
+            response.vary.add('Accept')
+        return response
+
+
+class APIRequest(Request):
+    """
+    Request class that also accepts MessagePack request bodies wherever JSON is expected.
+    """
+    def get_json(self, force=False, silent=False, cache=True):
+        """
+        Parse the body as MessagePack when the request has a MessagePack content type,
+        otherwise as JSON.
+
+        Returns:
+            The decoded data, or None if the body can't be decoded and silent is True.
+        """
+        if self.mimetype not in MSGPACK_MIMETYPES:
+            return super().get_json(force=force, silent=silent, cache=cache)
+
+        if cache and getattr(self, '_cached_msgpack', None) is not None:
+            return self._cached_msgpack
+        try:
+            data = msgpack.unpackb(self.get_data(cache=cache), raw=False)
+        except (ValueError, msgpack.UnpackException) as error:
+            if silent:
+                return None
+            raise BadRequest('Failed to decode MessagePack object') from error
+        if cache:
+            self._cached_msgpack = data
+        return data
@@ -0,0 +1,76 @@
+"""
+This module publishes a data_changed signal after each committed transaction, listing the
+tables it wrote and the recipes it touched, so that caches and in-memory indexes derived from
+the database can be invalidated or updated without polling.
+
+Receivers connect with data_changed.connect(receiver) and are called as
+receiver(sender, tables=frozenset, recipe_ids=frozenset) after the commit, where sender is
+the Flask application (or None outside an application context).
+"""
+
+# Import statements
+from blinker import Namespace
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from db_routing import RoutingSession
+
+# Signals of the application
+signals = Namespace()
+
+# Sent after a transaction that wrote to the database is committed
+data_changed = signals.signal('data-changed')
+
+# Key of the pending changes of the current transaction in Session.info
+_PENDING_KEY = 'data_changed'
+
+
+def mark_changed(session, tables, recipe_ids=()):
+    """
+    Record changes that the session events can't see, e.g. bulk UPDATE or INSERT ... SELECT
+    statements, so that they are included in the data_changed signal sent after the commit.
+
+    Args:
+        session (Session): The session running the transaction.
+        tables (iterable): The names of the tables written.
+        recipe_ids (iterable): The IDs of the recipes affected.
+    """
+    pending = session.info.setdefault(_PENDING_KEY, {'tables': set(), 'recipe_ids': set()})
+    pending['tables'].update(tables)
+    pending['recipe_ids'].update(recipe_id for recipe_id in recipe_ids if recipe_id is not None)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _collect_changes(session, flush_context):
+    """
+    Collect the tables and recipe IDs written by the flush.
+    """
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        table = getattr(obj, '__tablename__', None)
+        if table:
+            # Recipes, ingredients and instructions all carry the ID of the recipe they belong to
+            mark_changed(session, (table,), (getattr(obj, 'recipe_id', None),))
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _send_changes(session):
+    """
+    Send the data_changed signal for the committed changes.
+    """
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending or not pending['tables']:
+        return
+    sender = current_app._get_current_object() if has_app_context() else None  # pylint: disable=protected-access
+    data_changed.send(sender, tables=frozenset(pending['tables']), recipe_ids=frozenset(pending['recipe_ids']))
+
+
+@event.listens_for(RoutingSession, 'after_soft_rollback')
+def _discard_changes(session, previous_transaction):
+    """
+    Forget the changes of a transaction that was rolled back. Changes recorded before a
+    rolled back savepoint are kept, since the enclosing transaction may still commit them.
+    """
+    if previous_transaction.nested:
+        return
+    session.info.pop(_PENDING_KEY, None)
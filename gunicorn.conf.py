@@ -0,0 +1,58 @@
+"""
+Gunicorn configuration for the Flask Recipe API.
+
+The application is preloaded once in the master process (see create_app in app.py) so that
+imported code, compiled ORM mappers and warmed caches are shared copy-on-write by the workers.
+Each forked worker then drops the database connections inherited from the master and opens
+its own pool before it starts accepting requests.
+"""
+
+# Import statements
+from os import environ
+
+# Build the application once in the master process and fork the workers from it
+preload_app = environ.get("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+# Number of worker processes and the worker class (see the load-test harness to size these)
+workers = int(environ.get("WEB_CONCURRENCY", 2))
+worker_class = environ.get("GUNICORN_WORKER_CLASS", "sync")
+threads = int(environ.get("GUNICORN_THREADS", 1))
+
+
+def on_starting(server):
+    """
+    Clear the metrics snapshots of previous runs, so that /metrics only sums the counters of
+    this server's workers.
+    """
+    if environ.get("METRICS_DIR"):
+        from metrics import clear_directory
+        clear_directory(environ["METRICS_DIR"])
+
+
+def when_ready(server):
+    """
+    Warm the preloaded application in the master process, without opening database
+    connections, so that the warmed state is inherited by every worker.
+    """
+    if server.cfg.preload_app:
+        from init import warmup
+        warmup(server.app.wsgi(), connections=False)
+
+
+def post_fork(server, worker):
+    """
+    Discard the database connections a worker inherited from the master process.
+    Sharing a connection's socket between processes corrupts the connection.
+    """
+    if server.cfg.preload_app:
+        from init import dispose_engines
+        dispose_engines(server.app.wsgi())
+
+
+def post_worker_init(worker):
+    """
+    Open the worker's connection pool before it serves requests. Without preloading, the
+    worker also runs the warmup hooks itself since it did not inherit a warmed application.
+    """
+    from init import warmup
+    warmup(worker.wsgi, hooks=not worker.cfg.preload_app)
@@ -0,0 +1,186 @@
+"""
+This module keeps an in-memory inverted index from normalized ingredient names to the public
+recipes that use them, to answer "what can I cook with these ingredients" searches without
+joining the ingredients table for every request.
+
+The index is built when a worker starts (as a warmup hook) and updated incrementally: after
+a commit touches recipes or ingredients, the affected recipes are re-read on the next search.
+Writes made by other workers are picked up by a full rebuild once the index is older than
+INGREDIENT_INDEX_MAX_AGE seconds.
+"""
+
+# Import statements
+import threading
+import time
+from collections import Counter
+from flask import current_app
+from init import db, register_warmup, warmup_hooks
+from events import data_changed
+from models.recipe import Recipe
+from models.ingredient import Ingredient, check_ingredient_names, normalize_ingredient_name
+
+# Tables whose changes affect the index
+INDEXED_TABLES = {'recipes', 'ingredients'}
+
+# The index: ingredient name -> IDs of the public recipes using it, and recipe ID -> its ingredient names
+_index = {'postings': {}, 'recipes': {}, 'built_at': None}
+
+# Recipes changed since the index was last updated, and whether the whole index must be rebuilt
+_pending = {'recipe_ids': set(), 'rebuild': False}
+
+_lock = threading.Lock()
+
+
+def _read_ingredients(recipe_ids=None):
+    """
+    Read the normalized ingredient names of the public recipes, or of the given recipes only.
+
+    Returns:
+        dict: Recipe ID -> frozenset of its normalized ingredient names. Recipes without
+            ingredients are included with an empty set.
+    """
+    stmt = (
+        db.select(Recipe.recipe_id, Ingredient.name)
+        .outerjoin(Ingredient, Ingredient.recipe_id == Recipe.recipe_id)
+        .where(Recipe.is_public.is_(True))
+    )
+    if recipe_ids is not None:
+        stmt = stmt.where(Recipe.recipe_id.in_(recipe_ids))
+
+    recipes = {}
+    for recipe_id, name in db.session.execute(stmt):
+        names = recipes.setdefault(recipe_id, set())
+        if name and name.strip():
+            names.add(normalize_ingredient_name(name))
+    return {recipe_id: frozenset(names) for recipe_id, names in recipes.items()}
+
+
+def build_index(app=None):
+    """
+    Build the whole index from the database. Registered as a warmup hook, so it runs in an
+    application context before the worker serves requests.
+
+    Args:
+        app (Flask): The Flask application (unused; part of the warmup hook signature).
+    """
+    recipes = _read_ingredients()
+    postings = {}
+    for recipe_id, names in recipes.items():
+        for name in names:
+            postings.setdefault(name, set()).add(recipe_id)
+
+    with _lock:
+        _index.update(postings=postings, recipes=recipes, built_at=time.monotonic())
+
+
+def _update_recipes(recipe_ids):
+    """
+    Re-read the given recipes and replace their entries in the index. Recipes that were
+    deleted or made private are removed.
+    """
+    current = _read_ingredients(recipe_ids)
+    with _lock:
+        postings, recipes = _index['postings'], _index['recipes']
+        for recipe_id in recipe_ids:
+            for name in recipes.pop(recipe_id, ()):
+                postings[name].discard(recipe_id)
+                if not postings[name]:
+                    del postings[name]
+            if recipe_id in current:
+                recipes[recipe_id] = current[recipe_id]
+                for name in current[recipe_id]:
+                    postings.setdefault(name, set()).add(recipe_id)
+
+
+def refresh_index():
+    """
+    Bring the index up to date before a search: build it if it was never built or is too old
+    to include the writes of other workers, otherwise apply the changes committed in this worker.
+    """
+    max_age = current_app.config['INGREDIENT_INDEX_MAX_AGE']
+    with _lock:
+        rebuild = (
+            _pending['rebuild']
+            or _index['built_at'] is None
+            or time.monotonic() - _index['built_at'] > max_age
+        )
+        recipe_ids = _pending['recipe_ids']
+        _pending.update(recipe_ids=set(), rebuild=False)
+
+    if rebuild:
+        build_index()
+    elif recipe_ids:
+        _update_recipes(recipe_ids)
+
+
+def _record_changes(app, tables, recipe_ids=frozenset(), **_):
+    """
+    Remember which recipes changed, so that the next search re-reads them. The database
+    can't be queried here, because the signal is sent while the session finishes its commit.
+    """
+    if not tables & INDEXED_TABLES:
+        return
+    with _lock:
+        if recipe_ids:
+            _pending['recipe_ids'].update(recipe_ids)
+        else:
+            _pending['rebuild'] = True
+
+
+def search(pantry, min_coverage=0.0, limit=20):
+    """
+    Rank the public recipes by the fraction of their ingredients found in the pantry.
+
+    Args:
+        pantry (iterable): The names of the available ingredients.
+        min_coverage (float): The minimum fraction of a recipe's ingredients that must be available.
+        limit (int): The maximum number of results.
+
+    Returns:
+        list of dict: For each recipe, its ID, its coverage, and its matched and missing ingredients,
+            best coverage first, then most matched ingredients.
+    """
+    refresh_index()
+    pantry = {normalize_ingredient_name(name) for name in pantry if name and name.strip()}
+
+    with _lock:
+        postings, recipes = _index['postings'], _index['recipes']
+        # Count, for each recipe, how many of the pantry ingredients it uses
+        matches = Counter()
+        for name in pantry:
+            matches.update(postings.get(name, ()))
+
+        results = []
+        for recipe_id, matched in matches.items():
+            names = recipes[recipe_id]
+            coverage = matched / len(names)
+            if coverage >= min_coverage:
+                results.append((recipe_id, coverage, matched, names))
+
+    results.sort(key=lambda result: (-result[1], -result[2], result[0]))
+    return [
+        {
+            'recipe_id': recipe_id,
+            'coverage': round(coverage, 4),
+            'matched': sorted(names & pantry),
+            'missing': sorted(names - pantry),
+        }
+        for recipe_id, coverage, _, names in results[:limit]
+    ]
+
+
+def init_ingredient_index(app):
+    """
+    Configure the ingredient index, build it before each worker serves requests and keep it
+    up to date with the changes committed in this worker.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    app.config.setdefault('INGREDIENT_INDEX_MAX_AGE', 300)
+    # Check the database schema before the index (and anything else) reads the ingredients
+    if check_ingredient_names not in warmup_hooks:
+        register_warmup(check_ingredient_names)
+    if build_index not in warmup_hooks:
+        register_warmup(build_index)
+    data_changed.connect(_record_changes)
@@ -1,15 +1,25 @@
 """
-This module initializes a Flask application with various extensions and configuration settings.
+This module creates the Flask extensions and provides the functions that configure them
+for an application created by the application factory in app.py.
+
+The extensions are created without an application and bound later with init_app, so that
+importing the models and blueprints doesn't build an application or connect to the database.
 """
 
 # Import statements
 from os import environ
-from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import DeclarativeBase, configure_mappers
 from flask_marshmallow import Marshmallow
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
+from instrumentation import init_instrumentation
+from metrics import init_metrics
+from slow_queries import init_slow_query_log
+from tracing import init_tracing
+from db_routing import REPLICA_BIND, RoutingSession, engine_options, init_db_routing, mark_replica_unavailable
+from cache import init_response_cache
 
 # Create a base class for all SQLAlchemy models
 class Base(DeclarativeBase):
@@ -18,25 +28,204 @@ class Base(DeclarativeBase):
     """
     pass
 
-# Initialize Flask application by creating an instance of Flask class
-app = Flask(__name__)
+# Create SQLAlchemy, routing the queries of read-only requests to a replica when configured
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
+
+# Creating an instance of Marshmallow class
+ma = Marshmallow()
+
+# Create the Bcrypt extension for password hashing in Flask
+bcrypt = Bcrypt()
+
+# Create the JWTManager extension
+jwt = JWTManager()
+
+# Functions run by warmup() before a worker starts serving requests
+warmup_hooks = []
+
+
+def load_config(app):
+    """
+    Load the application configuration from environment variables.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    # Set JWT_SECRET_KEY from environment variable JWT_KEY
+    app.config['JWT_SECRET_KEY'] = environ.get("JWT_KEY")
+
+    # Set the database URI from the environment variable
+    app.config["SQLALCHEMY_DATABASE_URI"] = environ.get("DB_URI")
+
+    # Configure the connection pool and statement timeout of the database engines
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+        environ.get("DB_URI"),
+        pool_size=int(environ.get("DB_POOL_SIZE", 5)),
+        max_overflow=int(environ.get("DB_MAX_OVERFLOW", 10)),
+        pool_recycle=int(environ.get("DB_POOL_RECYCLE", 1800)),
+        pool_timeout=int(environ.get("DB_POOL_TIMEOUT", 30)),
+        pool_pre_ping=environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+        statement_timeout_ms=environ.get("DB_STATEMENT_TIMEOUT_MS")
+    )
+
+    # Route reads of GET requests to a read replica if one is configured
+    if environ.get("DB_REPLICA_URI"):
+        app.config['SQLALCHEMY_BINDS'] = {'replica': environ.get("DB_REPLICA_URI")}
+    app.config['DB_REPLICA_STICKY_SECONDS'] = int(environ.get("DB_REPLICA_STICKY_SECONDS", 10))
+    # Directory shared by the workers that remembers which users just wrote (per process if not set)
+    app.config['DB_REPLICA_STICKY_DIR'] = environ.get("DB_REPLICA_STICKY_DIR")
 
-# Set JWT_SECRET_KEY from environment variable JWT_KEY
-app.config['JWT_SECRET_KEY'] = environ.get("JWT_KEY")
+    # Number of times the same statement shape may run in one request before it is reported as an N+1 query
+    app.config['SQL_REPEAT_THRESHOLD'] = int(environ.get("SQL_REPEAT_THRESHOLD", 10))
 
-# Set the database URI from the environment variable
-app.config["SQLALCHEMY_DATABASE_URI"] = environ.get("DB_URI")
+    # Directory shared by gunicorn workers to aggregate metrics (per-process metrics if not set)
+    app.config['METRICS_DIR'] = environ.get("METRICS_DIR")
 
-# Initialize SQLAlchemy with the Flask application
-db = SQLAlchemy(model_class=Base)
-db.init_app(app)
+    # Statements slower than this many milliseconds are written to the slow query log (empty to disable)
+    slow_query_ms = environ.get("SLOW_QUERY_MS", "500")
+    app.config['SLOW_QUERY_MS'] = float(slow_query_ms) if slow_query_ms else None
+    app.config['SLOW_QUERY_LOG'] = environ.get("SLOW_QUERY_LOG", "slow_queries.log")
 
-# Creating an instance of Marshmallow class and passing in the flask app
-ma = Marshmallow(app)
+    # Directory where request profiles are saved, and the fraction of requests profiled at random
+    app.config['PROFILE_DIR'] = environ.get("PROFILE_DIR", "profiles")
+    app.config['PROFILE_SAMPLE_RATE'] = float(environ.get("PROFILE_SAMPLE_RATE", 0))
+
+    # File where request traces are exported in OTLP/JSON format (tracing is disabled if not set)
+    app.config['TRACE_FILE'] = environ.get("TRACE_FILE")
+    app.config['TRACE_SAMPLE_RATE'] = float(environ.get("TRACE_SAMPLE_RATE", 1))
+
+    # Response compression: minimum body size in bytes and the level of each encoding
+    app.config['COMPRESS_MIN_SIZE'] = int(environ.get("COMPRESS_MIN_SIZE", 1024))
+    app.config['COMPRESS_GZIP_LEVEL'] = int(environ.get("COMPRESS_GZIP_LEVEL", 6))
+    app.config['COMPRESS_BROTLI_LEVEL'] = int(environ.get("COMPRESS_BROTLI_LEVEL", 4))
+    app.config['COMPRESS_ZSTD_LEVEL'] = int(environ.get("COMPRESS_ZSTD_LEVEL", 3))
+
+    # Seconds public responses are cached in each worker (0 to disable), and the file through
+    # which workers tell each other to drop their cached responses after a write
+    app.config['RESPONSE_CACHE_TTL'] = int(environ.get("RESPONSE_CACHE_TTL", 60))
+    app.config['RESPONSE_CACHE_VERSION_FILE'] = environ.get("RESPONSE_CACHE_VERSION_FILE")
+
+    # Maximum number of recipe IDs in one request to the batch endpoint
+    app.config['BATCH_MAX_IDS'] = int(environ.get("BATCH_MAX_IDS", 100))
+
+    # Seconds after which each worker rebuilds its ingredient index to include the writes of other workers
+    app.config['INGREDIENT_INDEX_MAX_AGE'] = int(environ.get("INGREDIENT_INDEX_MAX_AGE", 300))
+
+    # Memory-mapped file of the recipe signatures used by the similar recipe recommendations
+    app.config['SIMILARITY_FILE'] = environ.get("SIMILARITY_FILE", "similarity_index.u32")
+
+    # Maximum number of recipes changed by one bulk update request
+    app.config['BULK_RECIPES_MAX'] = int(environ.get("BULK_RECIPES_MAX", 1000))
+
+    # Maximum number of users created by one bulk registration request (kept small so that the
+    # bcrypt hashing ends well within the worker timeout), and the number of processes of each
+    # worker's pool hashing their passwords (1 to hash in the worker itself)
+    app.config['BULK_USERS_MAX'] = int(environ.get("BULK_USERS_MAX", 25))
+    app.config['BULK_USERS_WORKERS'] = int(environ.get("BULK_USERS_WORKERS", 2))
+
+    # Seconds after which each worker rebuilds its search completion index, and the maximum number of terms it holds
+    app.config['SUGGEST_INDEX_MAX_AGE'] = int(environ.get("SUGGEST_INDEX_MAX_AGE", 300))
+    app.config['SUGGEST_MAX_TERMS'] = int(environ.get("SUGGEST_MAX_TERMS", 200000))
+
+    # Seconds after which each worker recounts the recipe statistics to include the writes of other workers
+    app.config['STATS_MAX_AGE'] = int(environ.get("STATS_MAX_AGE", 60))
+
+
+def init_extensions(app):
+    """
+    Bind the extensions and the instrumentation to the application. No database
+    connection is opened here; engines connect lazily on first use.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    # Initialize SQLAlchemy with the Flask application
+    db.init_app(app)
+
+    # Send the queries of read-only requests to the replica, with primary fallback
+    init_db_routing(app)
+
+    # Record per-request traces when a trace file is configured
+    init_tracing(app)
+
+    # Count the queries and database time of each request and detect N+1 query patterns
+    init_instrumentation(app)
+
+    # Write slow statements with their query plans to a rotating log file
+    init_slow_query_log(app)
+
+    # Record request counts, latencies, database pool usage and cache hit ratios for /metrics
+    init_metrics(app, db)
+
+    # Cache the responses of public routes until the data they were built from changes
+    init_response_cache(app)
+
+    # Initialize Marshmallow, Bcrypt and JWTManager with the Flask application
+    ma.init_app(app)
+    bcrypt.init_app(app)
+    jwt.init_app(app)
+
+
+def register_warmup(hook):
+    """
+    Register a function to run before a worker starts serving requests, e.g. to fill a cache.
+
+    Args:
+        hook (callable): A function called with the application, inside an application context.
+
+    Returns:
+        callable: The hook, so that this function can be used as a decorator.
+    """
+    warmup_hooks.append(hook)
+    return hook
+
+
+def dispose_engines(app):
+    """
+    Drop the database connections inherited from a parent process without closing them,
+    so that a forked worker opens its own connections instead of sharing the parent's sockets.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def warmup(app, hooks=True, connections=True):
+    """
+    Prepare the application to serve requests: configure the ORM mappers, run the registered
+    warmup hooks and open the connections of the database pools.
+
+    Args:
+        app (Flask): The Flask application.
+        hooks (bool): Whether to run the registered warmup hooks.
+        connections (bool): Whether to open pool connections (only useful in the serving process).
+    """
+    # Resolve all model relationships up front instead of on the first request
+    configure_mappers()
 
-# Initialize Bcrypt extension for password hashing in Flask
-bcrypt = Bcrypt(app)
+    with app.app_context():
+        if hooks:
+            for hook in warmup_hooks:
+                hook(app)
 
-# Initialize JWTManager with the Flask application
-jwt = JWTManager(app)
+        if not connections:
+            return
 
+        # Check out (and return) enough connections to fill each pool. An unreachable replica
+        # doesn't stop the worker from starting, since reads then fall back to the primary.
+        for bind, engine in db.engines.items():
+            size = engine.pool.size() if hasattr(engine.pool, 'size') else 1
+            opened = []
+            try:
+                for _ in range(size):
+                    opened.append(engine.connect())
+            except SQLAlchemyError:
+                if bind != REPLICA_BIND:
+                    raise
+                mark_replica_unavailable()
+            finally:
+                for connection in opened:
+                    connection.close()
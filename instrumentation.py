@@ -0,0 +1,180 @@
+"""
+This module instruments SQLAlchemy engine events to count the queries and database time
+spent by each request, and to detect N+1 query patterns such as hidden lazy-loads.
+"""
+
+# Import statements
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from flask import g, request, has_request_context, has_app_context, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from slow_queries import record_slow_query
+
+logger = logging.getLogger(__name__)
+
+# Regular expressions used to reduce a SQL statement to its shape
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|:\w+|\?")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_POSTCOMPILE = re.compile(r"\(__\[POSTCOMPILE_\w+\]\)")
+_WHITESPACE = re.compile(r"\s+")
+
+# Aggregated per-route statistics, keyed by endpoint name
+_route_stats = {}
+_route_stats_lock = threading.Lock()
+
+
+class RepeatedQueryError(Exception):
+    """
+    Raised in test mode when the same statement shape is executed more times in a single
+    request than the configured threshold allows, which usually indicates an N+1 query.
+    """
+
+
+def normalize_statement(statement):
+    """
+    Reduce a SQL statement to its shape by replacing literals, bound parameters and
+    IN lists with placeholders, so that statements differing only in values compare equal.
+
+    Args:
+        statement (str): The SQL statement.
+
+    Returns:
+        str: The normalized statement.
+    """
+    shape = _STRING_LITERAL.sub('?', statement)
+    shape = _POSTCOMPILE.sub('(?)', shape)
+    shape = _PLACEHOLDER.sub('?', shape)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _IN_LIST.sub('IN (?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+def route_stats():
+    """
+    Return a snapshot of the aggregated per-route SQL statistics.
+
+    Returns:
+        dict: A mapping of endpoint name to a dictionary with the number of requests,
+            the total number of queries and the total database time in seconds.
+    """
+    with _route_stats_lock:
+        return {endpoint: dict(stats) for endpoint, stats in _route_stats.items()}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """
+    Remember when the statement started so that its duration can be measured.
+    """
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """
+    Add the statement to the per-request counters and check for repeated statement shapes.
+    """
+    elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+
+    # Record statements slower than the configured threshold in the slow query log
+    if has_app_context():
+        threshold_ms = current_app.config.get('SLOW_QUERY_MS')
+        if threshold_ms is not None and elapsed * 1000 >= threshold_ms:
+            record_slow_query(conn, statement, parameters, elapsed, normalize_statement(statement), executemany)
+
+    # Only statements executed while handling a request are attributed
+    if not has_request_context() or 'sql_queries' not in g:
+        return
+
+    g.sql_queries += 1
+    g.sql_time += elapsed
+
+    # Count how often this statement shape has been executed during the request
+    shape = normalize_statement(statement)
+    g.sql_shapes[shape] += 1
+    threshold = current_app.config['SQL_REPEAT_THRESHOLD']
+    if g.sql_shapes[shape] == threshold + 1:
+        message = (f'Statement executed more than {threshold} times in {request.method} '
+                   f'{request.path} (possible N+1 query): {shape}')
+        # Raise instead of logging when configured to, or by default while testing
+        raise_on_repeat = current_app.config['SQL_RAISE_ON_REPEAT']
+        if raise_on_repeat is None:
+            raise_on_repeat = current_app.testing
+        if raise_on_repeat:
+            raise RepeatedQueryError(message)
+        logger.warning(message)
+
+
+def _handle_error(exception_context):
+    """
+    Discard the start time of a statement that failed, since after_cursor_execute won't run.
+    """
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_start_time'):
+        conn.info['query_start_time'].pop()
+
+
+def _start_request_counters():
+    """
+    Reset the SQL counters at the start of each request.
+    """
+    g.sql_queries = 0
+    g.sql_time = 0.0
+    g.sql_shapes = Counter()
+    g.request_started = time.perf_counter()
+
+
+def _finish_request_counters(response):
+    """
+    Expose the SQL counters of the request as a Server-Timing header and add them
+    to the per-route statistics.
+
+    Args:
+        response (Response): The response being returned to the client.
+
+    Returns:
+        Response: The response, with the Server-Timing header added.
+    """
+    if 'sql_queries' not in g:
+        return response
+
+    total_ms = (time.perf_counter() - g.request_started) * 1000
+    db_ms = g.sql_time * 1000
+    if current_app.config['SERVER_TIMING']:
+        response.headers.add(
+            'Server-Timing', f'db;dur={db_ms:.2f};desc="{g.sql_queries} queries", app;dur={total_ms:.2f}'
+        )
+
+    endpoint = request.endpoint or '<unmatched>'
+    with _route_stats_lock:
+        stats = _route_stats.setdefault(endpoint, {'requests': 0, 'queries': 0, 'db_time': 0.0})
+        stats['requests'] += 1
+        stats['queries'] += g.sql_queries
+        stats['db_time'] += g.sql_time
+
+    return response
+
+
+def init_instrumentation(app):
+    """
+    Register the SQLAlchemy engine event listeners and the request hooks with the application.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    app.config.setdefault('SQL_REPEAT_THRESHOLD', 10)
+    app.config.setdefault('SQL_RAISE_ON_REPEAT', None)
+    app.config.setdefault('SERVER_TIMING', True)
+
+    # Listen on the Engine class so that every engine (including binds) is instrumented
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    app.before_request(_start_request_counters)
+    app.after_request(_finish_request_counters)
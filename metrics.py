@@ -0,0 +1,514 @@
+"""
+This module collects runtime metrics (request counts, latency histograms, in-flight requests,
+database pool usage and cache hit ratios) and renders them in the Prometheus text format.
+
+Counters are kept in per-thread dictionaries, so recording a metric never takes a lock.
+When METRICS_DIR is set, every process periodically writes a snapshot of its counters to
+that directory and the /metrics endpoint sums the snapshots of all gunicorn workers. The
+counters of workers that exited are folded into an archive file, so that totals never go
+backwards and a new process reusing the PID of an exited one doesn't overwrite its counts.
+The directory is cleared when gunicorn starts (see gunicorn.conf.py).
+"""
+
+# Import statements
+import atexit
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import g, request, current_app
+
+# Upper bounds (in seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Metric families exported by the /metrics endpoint: name -> (type, help)
+METRIC_FAMILIES = {
+    'http_requests_total': ('counter', 'Total HTTP requests by route, method and status code.'),
+    'http_request_duration_seconds': ('histogram', 'HTTP request latency by route and method.'),
+    'http_requests_in_flight': ('gauge', 'HTTP requests currently being handled.'),
+    'db_queries_total': ('counter', 'SQL statements executed while handling requests, by route.'),
+    'db_query_duration_seconds_total': ('counter', 'Time spent executing SQL statements, by route.'),
+    'db_pool_checked_out': ('gauge', 'Database connections currently checked out of the pool.'),
+    'db_pool_overflow': ('gauge', 'Database connections currently open beyond the pool size.'),
+    'db_pool_size': ('gauge', 'Configured size of the database connection pool.'),
+    'cache_requests_total': ('counter', 'Cache lookups by cache name and result (hit or miss).'),
+    'cache_hit_ratio': ('gauge', 'Fraction of cache lookups that were hits, by cache name.'),
+    'cache_evictions_total': ('counter', 'Cache entries evicted to respect the size limit, by cache name.'),
+}
+
+# Metric families that describe the current state of a process rather than accumulate
+GAUGES = {'http_requests_in_flight', 'db_pool_checked_out', 'db_pool_overflow', 'db_pool_size'}
+
+# Per-thread counter dictionaries; the list is only locked when a new thread registers
+_local = threading.local()
+_thread_counters = []
+_registry_lock = threading.Lock()
+
+# Callbacks that return gauge samples (such as the database pool) when a snapshot is taken
+_collectors = []
+
+_last_flush = 0.0
+
+# PID of the process that owns the snapshot file written by flush(); a forked child must first
+# archive a snapshot left under its PID by an exited process
+_owner = {'pid': None}
+
+# File of the counters of exited processes, and the lock file serializing the archiving
+ARCHIVE_FILE = 'metrics_archive.json'
+LOCK_FILE = '.metrics.lock'
+
+
+def _counters():
+    """
+    Return the counter dictionary of the current thread, creating it on first use.
+    """
+    counters = getattr(_local, 'counters', None)
+    if counters is None:
+        counters = _local.counters = {}
+        with _registry_lock:
+            _thread_counters.append(counters)
+    return counters
+
+
+def inc(name, labels=(), value=1):
+    """
+    Increment a metric of the current process without taking a lock.
+
+    Args:
+        name (str): The metric name.
+        labels (tuple): The label (name, value) pairs of the sample.
+        value (float): The amount to add (may be negative for gauges).
+    """
+    counters = _counters()
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+
+def observe(name, labels, value, buckets=LATENCY_BUCKETS):
+    """
+    Record an observation in a histogram. Only the bucket the value falls in is incremented;
+    the cumulative bucket counts are computed when the metrics are rendered.
+
+    Args:
+        name (str): The histogram name.
+        labels (tuple): The label (name, value) pairs of the sample.
+        value (float): The observed value.
+        buckets (tuple): The upper bounds of the histogram buckets.
+    """
+    index = bisect_left(buckets, value)
+    upper = str(buckets[index]) if index < len(buckets) else '+Inf'
+    inc(f'{name}_bucket', labels + (('le', upper),))
+    inc(f'{name}_sum', labels, value)
+    inc(f'{name}_count', labels)
+
+
+def record_cache(cache, hit):
+    """
+    Record the result of a cache lookup so that hit ratios can be reported.
+
+    Args:
+        cache (str): The name of the cache.
+        hit (bool): True if the lookup was a hit, False if it was a miss.
+    """
+    inc('cache_requests_total', (('cache', cache), ('result', 'hit' if hit else 'miss')))
+
+
+def register_collector(collector):
+    """
+    Register a callback that returns gauge samples when a metrics snapshot is taken.
+
+    Args:
+        collector (callable): A function returning a list of (name, labels, value) tuples.
+    """
+    _collectors.append(collector)
+
+
+def snapshot():
+    """
+    Sum the per-thread counters of this process and add the collected gauges.
+
+    Returns:
+        dict: A mapping of (name, labels) to the value of the sample.
+    """
+    with _registry_lock:
+        thread_counters = list(_thread_counters)
+
+    totals = {}
+    for counters in thread_counters:
+        # dict.copy() runs without releasing the GIL, so it is safe against concurrent updates
+        for key, value in counters.copy().items():
+            totals[key] = totals.get(key, 0) + value
+
+    for collector in _collectors:
+        for name, labels, value in collector():
+            totals[(name, labels)] = value
+
+    return totals
+
+
+def _family(name):
+    """
+    Return the metric family a sample name belongs to (histogram samples have suffixes).
+    """
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in METRIC_FAMILIES:
+            return name[:-len(suffix)]
+    return name
+
+
+def _pid_alive(pid):
+    """
+    Check whether a process with the given ID is still running.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@contextmanager
+def _directory_lock(directory):
+    """
+    Hold an exclusive lock on the shared metrics directory, across processes.
+    """
+    with open(os.path.join(directory, LOCK_FILE), 'a', encoding='utf-8') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _read_samples(path):
+    """
+    Read the samples of a snapshot file, or None if it is missing or unreadable.
+    """
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_samples(path, samples):
+    """
+    Replace a snapshot file atomically, so that readers never see a partial file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.metrics_')
+    with os.fdopen(fd, 'w', encoding='utf-8') as file:
+        json.dump(samples, file)
+    os.replace(tmp_path, path)
+
+
+def _archive(directory, filenames):
+    """
+    Add the counters of the snapshots of exited processes to the archive file and remove the
+    snapshots. Their gauges are dropped. Must be called with the directory lock held.
+    """
+    filenames = [filename for filename in filenames if os.path.exists(os.path.join(directory, filename))]
+    if not filenames:
+        return
+
+    archive_path = os.path.join(directory, ARCHIVE_FILE)
+    totals = {}
+    for path in [archive_path] + [os.path.join(directory, filename) for filename in filenames]:
+        for name, labels, value in _read_samples(path) or []:
+            if name in GAUGES:
+                continue
+            key = (name, tuple(tuple(label) for label in labels))
+            totals[key] = totals.get(key, 0) + value
+
+    _write_samples(archive_path, [[name, list(labels), value] for (name, labels), value in totals.items()])
+    for filename in filenames:
+        os.remove(os.path.join(directory, filename))
+
+
+def _snapshot_pid(filename):
+    """
+    Return the PID of the process that wrote a snapshot file, or None if the file isn't one.
+    """
+    if not (filename.startswith('metrics_') and filename.endswith('.json')):
+        return None
+    try:
+        return int(filename[len('metrics_'):-len('.json')])
+    except ValueError:
+        return None
+
+
+def clear_directory(directory):
+    """
+    Remove the snapshots and the archive of previous runs from the shared metrics directory.
+
+    Args:
+        directory (str): The shared metrics directory.
+    """
+    if not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        if _snapshot_pid(filename) is not None or filename == ARCHIVE_FILE or filename.startswith('.metrics_'):
+            os.remove(os.path.join(directory, filename))
+
+
+def flush(directory):
+    """
+    Write the snapshot of this process to the shared metrics directory, replacing the
+    previous snapshot atomically so that readers never see a partial file.
+
+    Args:
+        directory (str): The shared metrics directory.
+    """
+    global _last_flush
+    _last_flush = time.monotonic()
+    filename = f'metrics_{os.getpid()}.json'
+    if _owner['pid'] != os.getpid():
+        # A snapshot under this PID was left by an exited process that had the same PID
+        with _directory_lock(directory):
+            _archive(directory, [filename])
+        _owner['pid'] = os.getpid()
+
+    samples = [[name, list(labels), value] for (name, labels), value in snapshot().items()]
+    _write_samples(os.path.join(directory, filename), samples)
+
+
+def aggregate(directory):
+    """
+    Sum the snapshots of all processes that wrote to the shared metrics directory, after
+    folding the snapshots of exited workers into the archive. Counters of exited workers are
+    kept so that totals never go backwards, while their gauges (in-flight requests, pool
+    usage) are dropped.
+
+    Args:
+        directory (str): The shared metrics directory.
+
+    Returns:
+        dict: A mapping of (name, labels) to the aggregated value of the sample.
+    """
+    # Snapshot files named after a PID; other files (the archive, stray files) are skipped
+    snapshots = {filename: _snapshot_pid(filename) for filename in os.listdir(directory)}
+    snapshots = {filename: pid for filename, pid in snapshots.items() if pid is not None}
+
+    exited = [filename for filename, pid in snapshots.items() if not _pid_alive(pid)]
+    if exited:
+        with _directory_lock(directory):
+            _archive(directory, exited)
+
+    totals = {}
+    for filename in [ARCHIVE_FILE] + [filename for filename in snapshots if filename not in exited]:
+        for name, labels, value in _read_samples(os.path.join(directory, filename)) or []:
+            key = (name, tuple(tuple(label) for label in labels))
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def _format_labels(labels):
+    """
+    Format label pairs as a Prometheus label set.
+    """
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _bucket_order(upper):
+    """
+    Sort key for histogram bucket upper bounds, placing +Inf last.
+    """
+    return float('inf') if upper == '+Inf' else float(upper)
+
+
+def render(totals):
+    """
+    Render samples in the Prometheus text exposition format.
+
+    Args:
+        totals (dict): A mapping of (name, labels) to sample values.
+
+    Returns:
+        str: The metrics in Prometheus text format.
+    """
+    # Derive cache hit ratios from the hit and miss counters
+    lookups = {}
+    for (name, labels), value in totals.items():
+        if name == 'cache_requests_total':
+            labels = dict(labels)
+            hits, total = lookups.get(labels['cache'], (0, 0))
+            lookups[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0), total + value)
+    for cache, (hits, total) in lookups.items():
+        totals[('cache_hit_ratio', (('cache', cache),))] = hits / total if total else 0.0
+
+    families = {}
+    for (name, labels), value in totals.items():
+        families.setdefault(_family(name), []).append((name, labels, value))
+
+    lines = []
+    for family in sorted(families):
+        metric_type, help_text = METRIC_FAMILIES.get(family, ('untyped', ''))
+        lines.append(f'# HELP {family} {help_text}')
+        lines.append(f'# TYPE {family} {metric_type}')
+        samples = families[family]
+
+        if metric_type == 'histogram':
+            lines.extend(_render_histogram(family, samples))
+            continue
+
+        for name, labels, value in sorted(samples, key=lambda sample: sample[1]):
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def _render_histogram(family, samples):
+    """
+    Render the samples of one histogram family with cumulative bucket counts.
+    """
+    series = {}
+    for name, labels, value in samples:
+        if name.endswith('_bucket'):
+            base = tuple(label for label in labels if label[0] != 'le')
+            upper = dict(labels)['le']
+            series.setdefault(base, {'buckets': {}, 'sum': 0, 'count': 0})['buckets'][upper] = value
+        else:
+            field = 'sum' if name.endswith('_sum') else 'count'
+            series.setdefault(labels, {'buckets': {}, 'sum': 0, 'count': 0})[field] = value
+
+    lines = []
+    for labels in sorted(series):
+        data = series[labels]
+        cumulative = 0
+        uppers = {str(upper) for upper in LATENCY_BUCKETS} | set(data['buckets']) | {'+Inf'}
+        for upper in sorted(uppers, key=_bucket_order):
+            cumulative += data['buckets'].get(upper, 0)
+            lines.append(f'{family}_bucket{_format_labels(labels + (("le", upper),))} {cumulative}')
+        lines.append(f'{family}_sum{_format_labels(labels)} {data["sum"]}')
+        lines.append(f'{family}_count{_format_labels(labels)} {data["count"]}')
+    return lines
+
+
+def collect():
+    """
+    Return the metrics to expose: the aggregate of all workers when a shared metrics
+    directory is configured, otherwise the snapshot of this process.
+
+    Returns:
+        dict: A mapping of (name, labels) to sample values.
+    """
+    directory = current_app.config['METRICS_DIR']
+    if not directory:
+        return snapshot()
+    flush(directory)
+    return aggregate(directory)
+
+
+def _request_labels():
+    """
+    Return the route labels of the current request. The URL rule (e.g. /recipes/<int:recipe_id>)
+    is used rather than the path to keep the number of label values bounded.
+    """
+    route = request.url_rule.rule if request.url_rule else '<unmatched>'
+    return (('blueprint', request.blueprint or ''), ('route', route), ('method', request.method))
+
+
+def _start_request_metrics():
+    """
+    Record the start of a request and count it as in flight.
+    """
+    g.metrics_started = time.perf_counter()
+    inc('http_requests_in_flight')
+
+
+def _finish_request_metrics(response):
+    """
+    Record the status code, latency and database usage of the finished request.
+
+    Args:
+        response (Response): The response being returned to the client.
+
+    Returns:
+        Response: The unchanged response.
+    """
+    if 'metrics_started' not in g:
+        return response
+
+    labels = _request_labels()
+    inc('http_requests_total', labels + (('status', str(response.status_code)),))
+    observe('http_request_duration_seconds', labels, time.perf_counter() - g.metrics_started)
+    if 'sql_queries' in g:
+        inc('db_queries_total', labels, g.sql_queries)
+        inc('db_query_duration_seconds_total', labels, g.sql_time)
+    return response
+
+
+def _end_request_metrics(_):
+    """
+    Remove the request from the in-flight gauge, even if it raised an exception, and
+    periodically write this worker's snapshot to the shared metrics directory.
+    """
+    if g.pop('metrics_started', None) is None:
+        return
+    inc('http_requests_in_flight', value=-1)
+
+    directory = current_app.config['METRICS_DIR']
+    if directory and time.monotonic() - _last_flush >= current_app.config['METRICS_FLUSH_INTERVAL']:
+        flush(directory)
+
+
+def _reset_after_fork():
+    """
+    Discard counters inherited from the parent process (e.g. the gunicorn master).
+    """
+    global _local, _last_flush
+    _local = threading.local()
+    _thread_counters.clear()
+    _last_flush = 0.0
+
+
+def init_metrics(app, db):
+    """
+    Register the request hooks that record metrics and the database pool collector.
+
+    Args:
+        app (Flask): The Flask application.
+        db (SQLAlchemy): The Flask-SQLAlchemy extension, used to read pool statistics.
+    """
+    app.config.setdefault('METRICS_DIR', None)
+    app.config.setdefault('METRICS_FLUSH_INTERVAL', 5.0)
+
+    directory = app.config['METRICS_DIR']
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(flush, directory)
+
+    def pool_collector():
+        # Pool statistics are only available for queue-based pools (not e.g. SQLite's default pool)
+        samples = []
+        with app.app_context():
+            engines = {'default': db.engine, **{key: engine for key, engine in db.engines.items() if key}}
+        for bind, engine in engines.items():
+            pool = engine.pool
+            labels = (('bind', bind),)
+            if hasattr(pool, 'checkedout'):
+                samples.append(('db_pool_checked_out', labels, pool.checkedout()))
+            if hasattr(pool, 'overflow'):
+                samples.append(('db_pool_overflow', labels, max(pool.overflow(), 0)))
+            if hasattr(pool, 'size'):
+                samples.append(('db_pool_size', labels, pool.size()))
+        return samples
+
+    register_collector(pool_collector)
+    if not _collectors[:-1]:
+        os.register_at_fork(after_in_child=_reset_after_fork)
+
+    app.before_request(_start_request_metrics)
+    app.after_request(_finish_request_metrics)
+    app.teardown_request(_end_request_metrics)
@@ -15,12 +15,18 @@ class Category(db.Model):
     Attributes:
         category_id (int): The primary key for the category.
         cuisine_name (str): The name of the category, particularly the cuisine.
+        recipe_count (int): The number of recipes in the category, maintained on recipe writes.
+        public_recipe_count (int): The number of public recipes in the category, maintained on recipe writes.
     """
     __tablename__ = 'categories'
 
     category_id: Mapped[int] = mapped_column(primary_key=True)
     cuisine_name: Mapped[str] = mapped_column(String(100))
 
+    # Denormalized recipe counters, updated in the transaction of each recipe write (see models/recipe.py)
+    recipe_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    public_recipe_count: Mapped[int] = mapped_column(default=0, server_default="0")
+
     recipes: Mapped[List['Recipe']] = relationship(back_populates='category') # type: ignore
 
 class CategorySchema(ma.Schema):
@@ -31,4 +37,5 @@ class CategorySchema(ma.Schema):
         """
         Inner class that specifies the fields to include in the schema.
         """
-        fields = ('category_id', 'cuisine_name')
+        fields = ('category_id', 'cuisine_name', 'recipe_count', 'public_recipe_count')
+        dump_only = ('recipe_count', 'public_recipe_count')
@@ -3,10 +3,28 @@ This module defines SQLAlchemy models and Marshmallow schemas for handling Ingre
 """
 
 # Import statements
+import logging
 from typing import Optional
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, ForeignKey
+from sqlalchemy import String, ForeignKey, event, inspect
 from init import db, ma
+from db_routing import RoutingSession
+from models.ingredient_name import ingredient_name_ids
+
+logger = logging.getLogger(__name__)
+
+def normalize_ingredient_name(name):
+    """
+    Normalize an ingredient name for matching: lower-cased, trimmed and with single spaces,
+    so that "Chicken ", "chicken" and "CHICKEN" are the same ingredient.
+
+    Args:
+        name (str): The ingredient name as entered.
+
+    Returns:
+        str: The normalized name.
+    """
+    return ' '.join(name.split()).lower()
 
 class Ingredient(db.Model):
     """
@@ -14,8 +32,9 @@ class Ingredient(db.Model):
 
     Attributes:
         ingredient_id (int): The primary key for the ingredient.
-        name (str): The name of the ingredient.
+        name (str): The name of the ingredient, as entered by the author.
         quantity (str): The quantity of the ingredient (optional).
+        ingredient_name_id (int): The foreign key of the normalized name in the ingredient_names table.
     """
     __tablename__ = 'ingredients'
 
@@ -29,6 +48,52 @@ class Ingredient(db.Model):
     # Establish a relationship between the Recipe and Ingredients models
     recipe: Mapped['Recipe'] = relationship(back_populates='ingredients') # type: ignore
 
+    # Reference the normalized name in the ingredient name dictionary, set automatically on flush
+    ingredient_name_id: Mapped[Optional[int]] = mapped_column(ForeignKey('ingredient_names.ingredient_name_id'), index=True)
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _assign_ingredient_names(session, flush_context, instances):
+    """
+    Point new and renamed ingredients to their normalized name in the ingredient name
+    dictionary, adding the names that aren't in the dictionary yet.
+    """
+    ingredients = [
+        obj for obj in (*session.new, *session.dirty)
+        if isinstance(obj, Ingredient) and obj.name
+        and (obj in session.new or inspect(obj).attrs.name.history.has_changes())
+    ]
+    if not ingredients:
+        return
+
+    ids = ingredient_name_ids(session, {normalize_ingredient_name(ingredient.name) for ingredient in ingredients})
+    for ingredient in ingredients:
+        ingredient.ingredient_name_id = ids[normalize_ingredient_name(ingredient.name)]
+
+def check_ingredient_names(app=None):
+    """
+    Check that the database has been upgraded to the ingredient name dictionary. Registered as
+    a warmup hook, so that a worker doesn't start serving requests that would fail on every
+    ingredient.
+
+    Args:
+        app (Flask): The Flask application (unused; part of the warmup hook signature).
+
+    Raises:
+        RuntimeError: If the ingredients.ingredient_name_id column is missing.
+    """
+    columns = {column['name'] for column in inspect(db.engine).get_columns('ingredients')}
+    if 'ingredient_name_id' not in columns:
+        raise RuntimeError(
+            'The ingredients table has no ingredient_name_id column. '
+            'Upgrade the database with `flask db backfill-ingredient-names` before starting the application.'
+        )
+
+    # Ingredients not backfilled yet are still found, by name, but more slowly
+    stmt = db.select(Ingredient.ingredient_id).where(Ingredient.ingredient_name_id.is_(None), Ingredient.name.is_not(None)).limit(1)
+    if db.session.scalar(stmt) is not None:
+        logger.warning('Some ingredients have no ingredient_name_id; run `flask db backfill-ingredient-names` '
+                       'so that ingredient searches use the ingredient name dictionary')
+
 class IngredientSchema(ma.Schema):
     """
     Marshmallow schema for serializing and deserializing Ingredient objects.
@@ -0,0 +1,57 @@
+"""
+This module defines the SQLAlchemy model of the ingredient name dictionary, which holds each
+distinct normalized ingredient name once so that ingredients can be matched by integer ID.
+"""
+
+# Import statements
+from sqlalchemy import String
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Mapped, mapped_column
+from init import db
+
+class IngredientName(db.Model):
+    """
+    IngredientName model representing the ingredient_names table in the database.
+
+    Attributes:
+        ingredient_name_id (int): The primary key for the ingredient name.
+        name (str): The normalized (lower-cased, trimmed) ingredient name, unique.
+    """
+    __tablename__ = 'ingredient_names'
+
+    ingredient_name_id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(String(200), unique=True)
+
+def ingredient_name_ids(session, names):
+    """
+    Return the dictionary IDs of the given normalized names, adding the names that are missing.
+
+    Missing names are inserted with ON CONFLICT DO NOTHING, so concurrent requests adding the
+    same new name don't fail on the unique constraint.
+
+    Args:
+        session (Session): The session running the transaction.
+        names (iterable): The normalized ingredient names.
+
+    Returns:
+        dict: Normalized name -> ingredient_name_id.
+    """
+    names = set(names)
+    if not names:
+        return {}
+
+    stmt = db.select(IngredientName.name, IngredientName.ingredient_name_id).where(IngredientName.name.in_(names))
+    ids = dict(session.execute(stmt).all())
+
+    missing = names - ids.keys()
+    if missing:
+        dialect = session.get_bind(IngredientName).dialect.name
+        insert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}.get(dialect)
+        rows = [{'name': name} for name in sorted(missing)]
+        if insert is not None:
+            session.execute(insert(IngredientName).on_conflict_do_nothing(index_elements=['name']), rows)
+        else:
+            session.execute(db.insert(IngredientName), rows)
+        stmt = db.select(IngredientName.name, IngredientName.ingredient_name_id).where(IngredientName.name.in_(missing))
+        ids.update(session.execute(stmt).all())
+    return ids
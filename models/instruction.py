@@ -5,7 +5,7 @@ This module defines SQLAlchemy models and Marshmallow schemas for handling Instr
 # Import statements
 from typing import Optional
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import Text, ForeignKey
+from sqlalchemy import Text, ForeignKey, Index
 from init import db, ma
 
 class Instruction(db.Model):
@@ -29,6 +29,9 @@ class Instruction(db.Model):
     # Establish a relationship between the Recipe and Ingredients models
     recipe: Mapped['Recipe'] = relationship(back_populates='instructions') # type: ignore
 
+# The instructions of a recipe are loaded and renumbered in the order of their steps
+Index('ix_instructions_recipe_id_step_number', Instruction.recipe_id, Instruction.step_number)
+
 class InstructionSchema(ma.Schema):
     """
     Marshmallow schema for serializing and deserializing Instruction objects.
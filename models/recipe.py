@@ -3,12 +3,18 @@ This module defines SQLAlchemy models and Marshmallow schemas for handling Recip
 """
 
 # Import statements
+from collections import Counter
 from datetime import date
 from typing import Optional, List
-from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Boolean, Text, ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column, relationship, selectinload
+from sqlalchemy import String, Boolean, Text, ForeignKey, event, inspect, true
 from marshmallow import fields
 from init import db, ma
+from tracing import span
+from db_routing import RoutingSession
+from events import mark_changed
+from models.user import User
+from models.category import Category
 
 class Recipe(db.Model):
     """
@@ -29,23 +35,147 @@ class Recipe(db.Model):
     recipe_id: Mapped[int] = mapped_column(primary_key=True)
     title: Mapped[str] = mapped_column(String(200), unique=True)
     description: Mapped[Optional[str]] = mapped_column(Text())
-    is_public: Mapped[bool] = mapped_column(Boolean, server_default="true")
+    # Columns counted by the recipe counters of users and categories keep their previous value
+    # when changed (active_history), so that the counters can be moved from the old to the new one
+    is_public: Mapped[bool] = mapped_column(Boolean, server_default=true(), active_history=True)
     preparation_time: Mapped[Optional[int]]
     date_created: Mapped[date]
 
     # Set up a relationship and map the user_id column as a foreign key to the users table
-    user_id: Mapped[int] = mapped_column(ForeignKey('users.user_id'))
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.user_id'), active_history=True)
     # Establish a relationship between the Recipe and User models
     user: Mapped['User'] = relationship(back_populates='recipes') # type: ignore
 
     # Set up a relationship and map the category_id column as a foreign key to the categories table
-    category_id: Mapped[Optional[int]] = mapped_column(ForeignKey('categories.category_id'))
+    category_id: Mapped[Optional[int]] = mapped_column(ForeignKey('categories.category_id'), active_history=True)
     # Establish a relationship between the Recipe and Category models
     category: Mapped['Category'] = relationship(back_populates='recipes') # type: ignore
 
     # Define a one-to-many relationship with ingredient and instructions tables
     ingredients: Mapped[List['Ingredient']] = relationship(back_populates='recipe', cascade="all, delete-orphan") # type: ignore
-    instructions: Mapped[List['Instruction']] = relationship(back_populates='recipe', cascade="all, delete-orphan") # type: ignore
+    # Instructions are listed in the order of their steps (the instruction ID breaks ties between equal step numbers)
+    instructions: Mapped[List['Instruction']] = relationship(back_populates='recipe', cascade="all, delete-orphan", order_by='[Instruction.step_number, Instruction.instruction_id]') # type: ignore
+
+def recipe_load_options():
+    """
+    Return the loader options that fetch the relationships serialized by RecipeSchema with one
+    extra query per relationship for all the recipes loaded, instead of one per recipe.
+
+    Returns:
+        tuple: The options to pass to select(Recipe).options().
+    """
+    return (
+        selectinload(Recipe.user),
+        selectinload(Recipe.category),
+        selectinload(Recipe.ingredients),
+        selectinload(Recipe.instructions),
+    )
+
+# Recipe columns that determine which user and category counters include a recipe
+COUNTED_COLUMNS = ('user_id', 'category_id', 'is_public')
+
+# Key of the counted values of the recipes changed by the current flush in UOWTransaction.attributes
+_COUNTED_KEY = 'recipe_counts'
+
+def count_recipe(deltas, user_id, category_id, is_public, delta):
+    """
+    Add (delta=1) or remove (delta=-1) a recipe to the recipe counters of its author and category.
+
+    Args:
+        deltas (Counter): The pending changes, (model, primary key, counter column) -> delta.
+        user_id (int): The ID of the author of the recipe.
+        category_id (int): The ID of the category of the recipe, or None.
+        is_public (bool): Whether the recipe is public; None stands for the server default (public).
+        delta (int): 1 to count the recipe, -1 to uncount it.
+    """
+    for model, key in ((User, user_id), (Category, category_id)):
+        if key is None:
+            continue
+        deltas[(model, key, 'recipe_count')] += delta
+        if is_public is not False:
+            deltas[(model, key, 'public_recipe_count')] += delta
+
+def apply_recipe_counts(session, deltas):
+    """
+    Apply pending changes to the recipe counters of users and categories in the current
+    transaction. Each counter is incremented in place (col = col + delta), so concurrent
+    transactions never overwrite each other's counts.
+
+    Args:
+        session (Session): The session running the transaction.
+        deltas (Counter): The changes, (model, primary key, counter column) -> delta.
+    """
+    rows = {}
+    for (model, key, column), delta in deltas.items():
+        if delta:
+            rows.setdefault((model, key), {})[column] = delta
+
+    for (model, key), changes in rows.items():
+        table = model.__table__
+        primary_key = table.primary_key.columns.values()[0]
+        session.execute(
+            db.update(table)
+            .where(primary_key == key)
+            .values({column: table.c[column] + delta for column, delta in changes.items()})
+        )
+    if rows:
+        mark_changed(session, {model.__tablename__ for model, _ in rows})
+
+def check_recipe_counts(app=None):
+    """
+    Check that the database has the recipe counters of users and categories. Registered as a
+    warmup hook, so that a worker doesn't start serving requests that would fail on every
+    recipe write.
+
+    Args:
+        app (Flask): The Flask application (unused; part of the warmup hook signature).
+
+    Raises:
+        RuntimeError: If the users or categories table has no recipe counters.
+    """
+    inspector = inspect(db.engine)
+    for model in (User, Category):
+        columns = {column['name'] for column in inspector.get_columns(model.__tablename__)}
+        if not {'recipe_count', 'public_recipe_count'} <= columns:
+            raise RuntimeError(
+                f'The {model.__tablename__} table has no recipe counters. '
+                'Upgrade the database with `flask db recount` before starting the application.'
+            )
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _capture_counted_values(session, flush_context, instances):
+    """
+    Record the counted values the changed and deleted recipes have in the database before the flush.
+    """
+    counted = flush_context.attributes.setdefault(_COUNTED_KEY, {})
+    for obj in (*session.dirty, *session.deleted):
+        if not isinstance(obj, Recipe):
+            continue
+        state = inspect(obj)
+        values = []
+        for column in COUNTED_COLUMNS:
+            history = state.attrs[column].history
+            # The previous value of a changed column, else the (possibly unloaded) current one
+            values.append(history.deleted[0] if history.deleted else getattr(obj, column))
+        counted[obj] = tuple(values)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _update_recipe_counts(session, flush_context):
+    """
+    Update the recipe counters of the users and categories of the recipes inserted, changed or
+    deleted by the flush, in the same transaction. The update runs after the flush so that the
+    users and categories inserted by the same flush exist.
+    """
+    counted = flush_context.attributes.get(_COUNTED_KEY, {})
+    deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, Recipe):
+            count_recipe(deltas, obj.user_id, obj.category_id, obj.is_public, 1)
+    for obj, previous in counted.items():
+        count_recipe(deltas, *previous, -1)
+        if obj not in session.deleted:
+            count_recipe(deltas, *(getattr(obj, column) for column in COUNTED_COLUMNS), 1)
+    apply_recipe_counts(session, deltas)
 
 class RecipeSchema(ma.Schema):
     """
@@ -63,11 +193,27 @@ class RecipeSchema(ma.Schema):
         ingredients (list): The list of ingredients for the recipe.
         intructions (list): The list of intructions for the recipe.
     """
-    user = fields.Nested('UserSchema', exclude=['password'])
-    category = fields.Nested('CategorySchema')
+    # The recipe counters are left to /users and /categories, so that a recipe doesn't change
+    # (nor its ETag) whenever its author or category gets another recipe
+    user = fields.Nested('UserSchema', exclude=['password', 'recipe_count', 'public_recipe_count'])
+    category = fields.Nested('CategorySchema', exclude=['recipe_count', 'public_recipe_count'])
     ingredients = fields.Nested('IngredientSchema', many=True)
     instructions = fields.Nested('InstructionSchema', many=True)
 
+    def dump(self, obj, *, many=None):
+        """
+        Serialize recipes, recording the serialization as a span of the request trace.
+        """
+        with span('RecipeSchema.dump'):
+            return super().dump(obj, many=many)
+
+    def load(self, data, *, many=None, partial=None, unknown=None):
+        """
+        Deserialize and validate recipe data, recording it as a span of the request trace.
+        """
+        with span('RecipeSchema.load'):
+            return super().load(data, many=many, partial=partial, unknown=unknown)
+
     class Meta:
         """
         Inner class that specifies the fields to include in the schema.
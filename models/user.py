@@ -5,7 +5,7 @@ This module defines SQLAlchemy models and Marshmallow schemas for handling User
 # Import statements
 from typing import List
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Boolean
+from sqlalchemy import String, Boolean, Index, func, false
 from marshmallow import fields
 from marshmallow.validate import Length
 from init import db, ma
@@ -20,6 +20,8 @@ class User(db.Model):
         password (str): The hashed password for the user.
         name (str): The name of the user, doesn't need to be unique.
         is_admin (bool): A flag indicating whether the user has admin privileges (default is false).
+        recipe_count (int): The number of recipes of the user, maintained on recipe writes.
+        public_recipe_count (int): The number of public recipes of the user, maintained on recipe writes.
     """
     __tablename__ = 'users'
 
@@ -27,10 +29,19 @@ class User(db.Model):
     email: Mapped[str] = mapped_column(String(200), unique=True)
     password: Mapped[str] = mapped_column(String(200))
     name: Mapped[str] = mapped_column(String(100))
-    is_admin: Mapped[bool] = mapped_column(Boolean, server_default="false")
+    is_admin: Mapped[bool] = mapped_column(Boolean, server_default=false())
+
+    # Denormalized recipe counters, updated in the transaction of each recipe write (see models/recipe.py)
+    recipe_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    public_recipe_count: Mapped[int] = mapped_column(default=0, server_default="0")
 
     recipes: Mapped[List['Recipe']] = relationship(back_populates='user') # type: ignore
 
+# Case-insensitive prefix searches of the user listing filter on lower(email) and lower(name).
+# text_pattern_ops lets PostgreSQL use these indexes for LIKE 'prefix%' whatever the collation.
+Index('ix_users_lower_email', func.lower(User.email).label('lower_email'), postgresql_ops={'lower_email': 'text_pattern_ops'})
+Index('ix_users_lower_name', func.lower(User.name).label('lower_name'), postgresql_ops={'lower_name': 'text_pattern_ops'})
+
 class UserSchema(ma.Schema):
     """
     Marshmallow schema for serializing and deserializing User objects.
@@ -41,6 +52,8 @@ class UserSchema(ma.Schema):
         password (str): The hashed password of the user.
         name (str): The name of the user.
         is_admin (bool): Indicates whether the user has admin privileges.
+        recipe_count (int): The number of recipes of the user.
+        public_recipe_count (int): The number of public recipes of the user.
     """
     email = fields.Email(required=True)
     password = fields.String(validate=Length(min=8, error='Password must be at least 8 characters long'), required=True)
@@ -49,4 +62,5 @@ class UserSchema(ma.Schema):
         """
         Inner class that specifies the fields to include in the schema.
         """
-        fields = ('user_id', 'email', 'password', 'name', 'is_admin')
+        fields = ('user_id', 'email', 'password', 'name', 'is_admin', 'recipe_count', 'public_recipe_count')
+        dump_only = ('recipe_count', 'public_recipe_count')
@@ -0,0 +1,186 @@
+"""
+This module provides an on-demand request profiler. A request is profiled when an admin sends
+the X-Profile header, or at random according to PROFILE_SAMPLE_RATE. The profile is saved to
+PROFILE_DIR together with a summary of the time spent in JWT verification, SQL, marshmallow
+dump and JSON encoding, and can be retrieved through the admin blueprint.
+"""
+
+# Import statements
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+from flask import g, request, current_app
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from auth import current_user_is_admin
+from encoding import APIJSONProvider
+
+# Header that requests profiling of a single request (admin only)
+PROFILE_HEADER = 'X-Profile'
+
+# Functions whose cumulative time is reported for each phase: phase -> (file suffix, function name)
+PHASES = {
+    'jwt_verify': ('flask_jwt_extended/view_decorators.py', 'verify_jwt_in_request'),
+    'marshmallow_dump': ('marshmallow/schema.py', 'dump'),
+    # The file of this application's encoding module, as recorded by the profiler, so that
+    # functions named response in other modules called encoding.py aren't counted
+    'json_encoding': (APIJSONProvider.response.__code__.co_filename.replace(os.sep, '/'), 'response'),
+}
+
+# Profile IDs are generated by this module; anything else is rejected when reading profiles
+PROFILE_ID_PATTERN = re.compile(r'^[0-9]{8}T[0-9]{6}_[\w.]+_[0-9a-f]{8}$')
+
+
+def _requested_by_admin():
+    """
+    Check whether the current request carries a valid JWT of an admin user.
+    """
+    try:
+        verify_jwt_in_request(optional=True)
+    except Exception:  # pylint: disable=broad-except
+        return False
+    return get_jwt_identity() is not None and bool(current_user_is_admin())
+
+
+def _should_profile():
+    """
+    Decide whether the current request should be profiled.
+    """
+    if request.headers.get(PROFILE_HEADER):
+        return _requested_by_admin()
+    rate = current_app.config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+
+def _phase_times(stats):
+    """
+    Sum the cumulative time of the functions that mark each phase of the request.
+
+    Args:
+        stats (pstats.Stats): The collected profile statistics.
+
+    Returns:
+        dict: A mapping of phase name to time in milliseconds.
+    """
+    phases = {phase: 0.0 for phase in PHASES}
+    for (filename, _, function), (_, _, _, cumulative, _) in stats.stats.items():
+        for phase, (suffix, name) in PHASES.items():
+            if function == name and filename.replace(os.sep, '/').endswith(suffix):
+                phases[phase] += cumulative * 1000
+    return {phase: round(value, 3) for phase, value in phases.items()}
+
+
+def _start_profile():
+    """
+    Start profiling the current request if it was requested or sampled.
+    """
+    if not _should_profile():
+        return
+    g.profiler = cProfile.Profile()
+    g.profile_started = time.perf_counter()
+    g.profiler.enable()
+
+
+def _finish_profile(response):
+    """
+    Stop the profiler, save the profile and its summary, and return the profile ID in a header.
+
+    Args:
+        response (Response): The response being returned to the client.
+
+    Returns:
+        Response: The response, with the X-Profile-Id header added if the request was profiled.
+    """
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    total_ms = (time.perf_counter() - g.profile_started) * 1000
+
+    now = datetime.now(timezone.utc)
+    profile_id = f"{now:%Y%m%dT%H%M%S}_{request.endpoint or 'unmatched'}_{uuid.uuid4().hex[:8]}"
+    directory = current_app.config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    profiler.dump_stats(os.path.join(directory, f'{profile_id}.prof'))
+
+    # Keep the top functions by cumulative time as text for quick inspection
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(40)
+
+    summary = {
+        'profile_id': profile_id,
+        'created': now.isoformat(),
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'total_ms': round(total_ms, 3),
+        # SQL time comes from the engine event instrumentation and overlaps the other phases
+        # when statements run inside them (e.g. lazy-loads during marshmallow dump)
+        'phases_ms': {'sql': round(g.get('sql_time', 0.0) * 1000, 3), **_phase_times(stats)},
+        'sql_queries': g.get('sql_queries'),
+        'top_functions': stream.getvalue(),
+    }
+    with open(os.path.join(directory, f'{profile_id}.json'), 'w', encoding='utf-8') as file:
+        json.dump(summary, file, indent=2)
+
+    response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+def profile_path(profile_id, extension):
+    """
+    Return the path of a saved profile file, or None if the ID is invalid or unknown.
+
+    Args:
+        profile_id (str): The ID of the profile.
+        extension (str): Either "json" for the summary or "prof" for the raw cProfile data.
+
+    Returns:
+        str: The absolute path of the file, or None.
+    """
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    path = os.path.abspath(os.path.join(current_app.config['PROFILE_DIR'], f'{profile_id}.{extension}'))
+    return path if os.path.isfile(path) else None
+
+
+def list_profiles():
+    """
+    Return the summaries of the saved profiles, newest first, without the function listings.
+
+    Returns:
+        list of dict: The profile summaries.
+    """
+    directory = current_app.config['PROFILE_DIR']
+    if not os.path.isdir(directory):
+        return []
+    summaries = []
+    for filename in sorted(os.listdir(directory), reverse=True):
+        if filename.endswith('.json'):
+            with open(os.path.join(directory, filename), encoding='utf-8') as file:
+                summary = json.load(file)
+            summary.pop('top_functions', None)
+            summaries.append(summary)
+    return summaries
+
+
+def init_profiling(app):
+    """
+    Register the request hooks of the on-demand profiler.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    app.config.setdefault('PROFILE_DIR', 'profiles')
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
@@ -0,0 +1,209 @@
+"""
+This module creates many users at once, for onboarding an organisation with
+`flask users import` or the POST /users/bulk endpoint.
+
+Registering users one by one spends most of its time in bcrypt, which is deliberately slow
+and single-threaded. Here the records are validated with UserSchema first, the emails that
+already exist are left out, the remaining passwords are hashed in parallel by a pool of
+processes, and the users are inserted in batches, one transaction per batch.
+
+`flask users import` hashes with one process per core. Web requests share a small pool of
+processes (see hashing_pool) and are limited to a few users each, so that a request ends well
+within the worker timeout.
+Emails taken between the check and the insert are caught by the unique constraint
+(ON CONFLICT DO NOTHING) and reported as duplicates rather than failing the batch.
+"""
+
+# Import statements
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from multiprocessing import get_context
+from marshmallow.exceptions import ValidationError
+from sqlalchemy.dialects import postgresql, sqlite
+from init import db, bcrypt
+from events import mark_changed
+from models.user import User, UserSchema
+
+# Below this number of passwords, hashing them in the calling process is faster than starting a pool
+MIN_PARALLEL_HASHES = 4
+
+# Pool of processes hashing the passwords of web requests, created on first use
+_hashing_pool = {'executor': None}
+_hashing_lock = threading.Lock()
+
+
+def validate_users(records):
+    """
+    Validate user records with UserSchema, as POST /users/register does.
+
+    Args:
+        records (iterable): The user records (dicts with email, password, name and optionally is_admin).
+
+    Returns:
+        tuple: The valid users (list of dicts) and the invalid records (list of dicts with the
+            index of the record and its validation errors). Records repeating the email of an
+            earlier record are invalid.
+    """
+    schema = UserSchema(only=['email', 'password', 'name', 'is_admin'])
+    valid, invalid, emails = [], [], set()
+    for index, record in enumerate(records):
+        try:
+            if not isinstance(record, dict):
+                raise ValidationError({'_schema': ['Invalid input type.']})
+            user = schema.load(record, unknown='exclude')
+            if not user.get('name'):
+                raise ValidationError({'name': ['Missing data for required field.']})
+            if not isinstance(user.get('is_admin', False), bool):
+                raise ValidationError({'is_admin': ['Not a valid boolean.']})
+            if user['email'] in emails:
+                raise ValidationError({'email': ['Duplicate email in the imported users.']})
+        except ValidationError as err:
+            invalid.append({'index': index, 'email': record.get('email') if isinstance(record, dict) else None, 'errors': err.messages})
+            continue
+        emails.add(user['email'])
+        valid.append({'email': user['email'], 'password': user['password'], 'name': user['name'], 'is_admin': user.get('is_admin', False)})
+    return valid, invalid
+
+
+def hash_passwords(passwords, executor=None, chunksize=1):
+    """
+    Hash passwords with bcrypt, as POST /users/register does.
+
+    Args:
+        passwords (list): The plain text passwords.
+        executor (ProcessPoolExecutor): The pool of processes hashing the passwords, or None
+            to hash them in the calling process.
+        chunksize (int): The number of passwords sent to a process at a time.
+
+    Returns:
+        list: The password hashes, in the order of the passwords.
+    """
+    if executor is None:
+        return [bcrypt.generate_password_hash(password).decode('utf-8') for password in passwords]
+
+    return [password_hash.decode('utf-8') for password_hash in executor.map(bcrypt.generate_password_hash, passwords, chunksize=chunksize)]
+
+
+def hashing_pool(workers):
+    """
+    Return the pool of processes hashing the passwords of the bulk registration requests,
+    shared by all the requests of this process and created on first use.
+
+    The processes are started by a forkserver rather than forked from the web worker, so they
+    don't inherit its database connections and threads, and there are never more than
+    `workers` of them, whatever the number of concurrent requests.
+
+    Args:
+        workers (int): The number of processes of the pool.
+
+    Returns:
+        ProcessPoolExecutor: The pool, or None to hash in the calling process (workers <= 1).
+    """
+    if workers <= 1:
+        return None
+    with _hashing_lock:
+        if _hashing_pool['executor'] is None:
+            _hashing_pool['executor'] = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('forkserver'))
+        return _hashing_pool['executor']
+
+
+def discard_hashing_pool():
+    """
+    Shut down the pool of processes hashing the passwords of web requests, e.g. after one of
+    its processes died, so that the next request starts a new one.
+    """
+    with _hashing_lock:
+        executor, _hashing_pool['executor'] = _hashing_pool['executor'], None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _existing_emails(emails):
+    """
+    Return the emails, among the given ones, that already belong to a user.
+    """
+    existing = set()
+    emails = list(emails)
+    for start in range(0, len(emails), 1000):
+        stmt = db.select(User.email).where(User.email.in_(emails[start:start + 1000]))
+        existing.update(db.session.scalars(stmt))
+    return existing
+
+
+def _insert_batch(rows):
+    """
+    Insert a batch of users and commit it, skipping the emails that already exist.
+
+    Returns:
+        set: The emails of the users inserted.
+    """
+    dialect = db.session.get_bind(User).dialect.name
+    insert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}.get(dialect)
+    if insert is not None:
+        stmt = insert(User).on_conflict_do_nothing(index_elements=['email']).returning(User.email)
+        inserted = set(db.session.scalars(stmt, rows))
+    else:
+        # Without ON CONFLICT, leave out the emails taken since they were checked
+        existing = _existing_emails(row['email'] for row in rows)
+        rows = [row for row in rows if row['email'] not in existing]
+        if rows:
+            db.session.execute(db.insert(User), rows)
+        inserted = {row['email'] for row in rows}
+
+    if inserted:
+        mark_changed(db.session, ('users',))
+    db.session.commit()
+    return inserted
+
+
+def import_users(records, batch_size=500, workers=None, progress=None, executor=None):
+    """
+    Validate, hash and insert many users.
+
+    Args:
+        records (iterable): The user records (dicts with email, password, name and optionally is_admin).
+        batch_size (int): The number of users inserted per transaction.
+        workers (int): The number of processes hashing passwords (defaults to the number of cores).
+        progress (callable): Called with the number of users processed after each batch (optional).
+        executor (ProcessPoolExecutor): A pool of `workers` processes to hash the passwords in,
+            instead of starting one for this import (optional).
+
+    Returns:
+        dict: The number of users created, the emails that already existed, and the invalid records.
+    """
+    valid, invalid = validate_users(records)
+
+    # Don't spend bcrypt time on the users that already exist
+    existing = _existing_emails(user['email'] for user in valid)
+    duplicates = [user['email'] for user in valid if user['email'] in existing]
+    users = [user for user in valid if user['email'] not in existing]
+
+    # Hash in a pool of processes (by default one per core, started for this import), unless
+    # there are too few passwords to gain from it
+    workers = max(1, min(workers or os.cpu_count() or 1, len(users)))
+    parallel = workers > 1 and len(users) >= MIN_PARALLEL_HASHES
+    # Send the passwords in chunks, a few per process and batch, to amortize the inter-process round trips
+    chunksize = max(1, min(batch_size, len(users)) // (workers * 4))
+
+    created = 0
+    if not parallel:
+        pool = nullcontext()
+    elif executor is not None:
+        pool = nullcontext(executor)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+
+    with pool as executor:
+        for start in range(0, len(users), batch_size):
+            batch = users[start:start + batch_size]
+            hashes = hash_passwords([user['password'] for user in batch], executor, chunksize)
+            rows = [dict(user, password=password_hash) for user, password_hash in zip(batch, hashes)]
+            inserted = _insert_batch(rows)
+            created += len(inserted)
+            duplicates.extend(row['email'] for row in rows if row['email'] not in inserted)
+            if progress:
+                progress(start + len(batch))
+
+    return {'created': created, 'duplicates': duplicates, 'invalid': invalid}
@@ -0,0 +1,308 @@
+"""
+This module keeps the aggregate statistics of the recipes served by /stats: the number of
+recipes per category, per author, per visibility and per creation day, and the distribution
+of their preparation times.
+
+The aggregates are counters built with one GROUP BY query each, when a worker starts (as a
+warmup hook) or when they are older than STATS_MAX_AGE seconds (to include the writes of other
+workers). Recipe writes committed in this worker are applied incrementally: the values a
+recipe had before the transaction are taken from the ORM attribute history when it is flushed,
+and after the commit the changed recipes are re-read on the next request, so each write moves
+the counters from the old values to the new ones instead of triggering a full scan. Writes
+whose previous values are unknown (bulk statements recorded with events.mark_changed that
+don't also call record_previous_values) trigger a rebuild instead.
+"""
+
+# Import statements
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from flask import current_app
+from sqlalchemy import event, inspect
+from init import db, register_warmup, warmup_hooks
+from db_routing import RoutingSession
+from events import data_changed
+from models.recipe import Recipe, check_recipe_counts
+from models.category import Category
+from models.user import User
+
+# Recipe columns the statistics are grouped by, in the order of the tuples describing a recipe
+GROUPED_COLUMNS = ('category_id', 'user_id', 'is_public', 'preparation_time', 'date_created')
+
+# Percentiles of the preparation time reported by /stats
+PERCENTILES = (50, 75, 90, 95, 99)
+
+# Key of the recipe values captured during the current transaction in Session.info
+_CAPTURED_KEY = 'recipe_stats'
+
+# Captured in place of the previous values of a recipe when they weren't loaded
+_UNKNOWN = object()
+
+# Number of recipes per value of each grouped column
+_counters = {column: Counter() for column in GROUPED_COLUMNS}
+_state = {'built_at': None}
+
+# Changes committed since the counters were last updated: the values the changed recipes had
+# when the counters were built (None for new recipes), the recipes to re-read, and whether
+# the counters must be rebuilt because previous values are unknown
+_pending = {'previous': {}, 'recipe_ids': set(), 'rebuild': False}
+
+_lock = threading.Lock()
+
+
+def _apply(values, delta):
+    """
+    Add (delta=1) or remove (delta=-1) a recipe, described by its grouped column values, to the counters.
+    """
+    for column, value in zip(GROUPED_COLUMNS, values):
+        counter = _counters[column]
+        counter[value] += delta
+        if counter[value] <= 0:
+            del counter[value]
+
+
+def build_stats(app=None):
+    """
+    Count the recipes per value of each grouped column with a GROUP BY query. Registered as a
+    warmup hook, so it runs in an application context before the worker serves requests.
+
+    Args:
+        app (Flask): The Flask application (unused; part of the warmup hook signature).
+    """
+    counters = {}
+    for column in GROUPED_COLUMNS:
+        attribute = getattr(Recipe, column)
+        stmt = db.select(attribute, db.func.count()).group_by(attribute)
+        counters[column] = Counter(dict(db.session.execute(stmt).all()))
+
+    with _lock:
+        for column, counter in counters.items():
+            _counters[column] = counter
+        _state['built_at'] = time.monotonic()
+
+
+def _update_recipes(recipe_ids, previous):
+    """
+    Move the changed recipes from their previous values to their current ones. Recipes that
+    were deleted are only removed.
+    """
+    columns = [getattr(Recipe, column) for column in GROUPED_COLUMNS]
+    stmt = db.select(Recipe.recipe_id, *columns).where(Recipe.recipe_id.in_(recipe_ids))
+    current = {row[0]: tuple(row[1:]) for row in db.session.execute(stmt)}
+
+    with _lock:
+        for recipe_id in recipe_ids:
+            if previous[recipe_id] is not None:
+                _apply(previous[recipe_id], -1)
+            if recipe_id in current:
+                _apply(current[recipe_id], 1)
+
+
+def refresh_stats():
+    """
+    Bring the counters up to date before they are read: rebuild them if they were never built,
+    are too old to include the writes of other workers or can't be updated incrementally,
+    otherwise apply the changes committed in this worker.
+    """
+    max_age = current_app.config['STATS_MAX_AGE']
+    with _lock:
+        recipe_ids, previous = _pending['recipe_ids'], _pending['previous']
+        rebuild = (
+            _pending['rebuild']
+            or _state['built_at'] is None
+            or time.monotonic() - _state['built_at'] > max_age
+            or not recipe_ids <= previous.keys()
+        )
+        _pending.update(previous={}, recipe_ids=set(), rebuild=False)
+
+    if rebuild:
+        build_stats()
+    elif recipe_ids:
+        _update_recipes(recipe_ids, previous)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _capture_previous_values(session, flush_context):
+    """
+    Record the values the recipes written by the flush had before the transaction. The
+    attribute history still holds the flushed changes at this point.
+    """
+    captured = session.info.setdefault(_CAPTURED_KEY, {})
+    for obj in session.new:
+        if isinstance(obj, Recipe):
+            captured.setdefault(obj.recipe_id, None)
+
+    for obj in (*session.dirty, *session.deleted):
+        if not isinstance(obj, Recipe) or obj.recipe_id in captured:
+            continue
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        state = inspect(obj)
+        values = []
+        for column in GROUPED_COLUMNS:
+            history = state.attrs[column].history
+            known = history.deleted or history.unchanged
+            if not known:
+                # The previous value was never loaded, so the counters must be rebuilt
+                captured[obj.recipe_id] = _UNKNOWN
+                break
+            values.append(known[0])
+        else:
+            captured[obj.recipe_id] = tuple(values)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _commit_previous_values(session):
+    """
+    Keep the previous values of the committed recipes until the counters are updated. The
+    values of a recipe changed again before the update are those it had when it was counted.
+    """
+    captured = session.info.pop(_CAPTURED_KEY, None)
+    if not captured:
+        return
+    with _lock:
+        for recipe_id, values in captured.items():
+            if values is _UNKNOWN:
+                _pending['rebuild'] = True
+            else:
+                _pending['previous'].setdefault(recipe_id, values)
+
+
+@event.listens_for(RoutingSession, 'after_soft_rollback')
+def _discard_previous_values(session, previous_transaction):
+    """
+    Forget the values captured by a transaction that was rolled back.
+    """
+    if not previous_transaction.nested:
+        session.info.pop(_CAPTURED_KEY, None)
+
+
+def record_previous_values(session, previous):
+    """
+    Record the values recipes written by a bulk statement (which the flush events can't see)
+    had before the transaction, so that the counters can still be updated incrementally.
+
+    Args:
+        session (Session): The session running the transaction.
+        previous (dict): Recipe ID -> values of GROUPED_COLUMNS before the statement, or None
+            for a recipe inserted by it.
+    """
+    captured = session.info.setdefault(_CAPTURED_KEY, {})
+    for recipe_id, values in previous.items():
+        captured.setdefault(recipe_id, values)
+
+
+def _record_changes(app, tables, recipe_ids=frozenset(), **_):
+    """
+    Remember which recipes changed, so that the next read of the statistics re-reads them.
+    The database can't be queried here, because the signal is sent while the session
+    finishes its commit.
+    """
+    if 'recipes' not in tables:
+        return
+    with _lock:
+        if recipe_ids:
+            _pending['recipe_ids'].update(recipe_ids)
+        else:
+            _pending['rebuild'] = True
+
+
+def _percentile(histogram, total, percentile):
+    """
+    Return the nearest-rank percentile of the values counted in a histogram.
+    """
+    rank = max(1, -(-percentile * total // 100))
+    seen = 0
+    for value in sorted(histogram):
+        seen += histogram[value]
+        if seen >= rank:
+            return value
+    return None
+
+
+def summary(top_users=20, days=30):
+    """
+    Summarize the recipe statistics.
+
+    Args:
+        top_users (int): The number of authors with the most recipes to list.
+        days (int): The number of days, up to today, of the creation rate.
+
+    Returns:
+        dict: The recipe counts per category, author, visibility and creation day, and the
+            average and percentiles of the preparation times.
+    """
+    refresh_stats()
+    with _lock:
+        counters = {column: Counter(counter) for column, counter in _counters.items()}
+
+    # Look up the names of the categories and of the listed authors
+    cuisines = dict(db.session.execute(db.select(Category.category_id, Category.cuisine_name)).all())
+    authors = counters['user_id'].most_common(top_users)
+    names = dict(db.session.execute(
+        db.select(User.user_id, User.name).where(User.user_id.in_([user_id for user_id, _ in authors]))
+    ).all())
+
+    # Preparation times, leaving out the recipes without one
+    times = counters['preparation_time']
+    times.pop(None, None)
+    timed = sum(times.values())
+
+    # Recipes created each day of the period, including the days without any
+    today = date.today()
+    per_day = [
+        {"date": day.isoformat(), "recipes": counters['date_created'][day]}
+        for day in (today - timedelta(days=offset) for offset in range(days - 1, -1, -1))
+    ]
+
+    return {
+        "total_recipes": counters['is_public'].total(),
+        "visibility": {
+            "public": counters['is_public'][True],
+            "private": counters['is_public'][False],
+        },
+        "recipes_per_category": [
+            {
+                "category_id": category_id,
+                "cuisine_name": cuisines.get(category_id, 'Uncategorized'),
+                "recipes": count,
+            }
+            for category_id, count in counters['category_id'].most_common()
+        ],
+        "recipes_per_user": [
+            {"user_id": user_id, "name": names.get(user_id), "recipes": count}
+            for user_id, count in authors
+        ],
+        "users_with_recipes": len(counters['user_id']),
+        "preparation_time": {
+            "recipes": timed,
+            "average": round(sum(value * count for value, count in times.items()) / timed, 1) if timed else None,
+            "min": min(times) if times else None,
+            "max": max(times) if times else None,
+            "percentiles": {f"p{p}": _percentile(times, timed, p) if timed else None for p in PERCENTILES},
+        },
+        "creation_rate": {
+            "days": days,
+            "recipes": sum(entry['recipes'] for entry in per_day),
+            "average_per_day": round(sum(entry['recipes'] for entry in per_day) / days, 2),
+            "per_day": per_day,
+        },
+    }
+
+
+def init_recipe_stats(app):
+    """
+    Configure the recipe statistics, build them before each worker serves requests and keep
+    them up to date with the changes committed in this worker.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    app.config.setdefault('STATS_MAX_AGE', 60)
+    # Check the database schema before the statistics (and anything else) read the counters
+    if check_recipe_counts not in warmup_hooks:
+        register_warmup(check_recipe_counts)
+    if build_stats not in warmup_hooks:
+        register_warmup(build_stats)
+    data_changed.connect(_record_changes)
@@ -0,0 +1,274 @@
+"""
+This module finds the public recipes most similar to a recipe, comparing their sets of
+ingredients and their cuisine.
+
+Each public recipe is summarized by a MinHash signature of its features (the IDs of its
+normalized ingredient names, see models/ingredient_name.py, and its category): the fraction of
+equal positions in two signatures estimates the Jaccard similarity of the two feature sets, so
+a recipe is compared with every other one in a single vectorized NumPy operation.
+
+The signatures are stored in a memory-mapped file (SIMILARITY_FILE), one row per recipe ID,
+so all workers share one copy through the page cache. The file is built when it is missing
+(as a warmup hook, or with `flask db similarity-index`) and each committed recipe write updates
+the rows of the recipes it touched in place, which every worker sees immediately.
+"""
+
+# Import statements
+import fcntl
+import logging
+import os
+import threading
+import numpy as np
+from flask import current_app
+from init import db, register_warmup, warmup_hooks
+from events import data_changed
+from models.recipe import Recipe
+from models.ingredient import Ingredient
+
+logger = logging.getLogger(__name__)
+
+# Number of hash functions in a signature; the estimate's standard error is about 1/sqrt(64) = 0.125
+SIGNATURE_SIZE = 64
+
+# Hash functions h(x) = (a * x + b) mod PRIME, drawn from a fixed seed so every process agrees
+PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240627)
+HASH_A = _rng.integers(1, PRIME, SIGNATURE_SIZE, dtype=np.int64)
+HASH_B = _rng.integers(0, PRIME, SIGNATURE_SIZE, dtype=np.int64)
+
+# Row 0 (recipe IDs start at 1) is a header identifying the file format
+MAGIC = 0x5349_4D31
+ROW_SIZE = SIGNATURE_SIZE + 1
+
+# Tables whose changes affect the signatures
+INDEXED_TABLES = {'recipes', 'ingredients'}
+
+# The current mapping of the file, remapped when another process replaces or grows the file
+_mapping = {'array': None, 'inode': None, 'size': None}
+_lock = threading.Lock()
+
+
+def _features(rows):
+    """
+    Group (recipe_id, category_id, ingredient_name_id) rows into the feature set of each recipe.
+    Ingredient names and categories are mapped to even and odd integers so that they never collide.
+
+    Returns:
+        dict: Recipe ID -> list of integer features.
+    """
+    features = {}
+    for recipe_id, category_id, ingredient_name_id in rows:
+        recipe_features = features.setdefault(recipe_id, set())
+        if ingredient_name_id is not None:
+            recipe_features.add(ingredient_name_id * 2)
+        if category_id is not None:
+            recipe_features.add(category_id * 2 + 1)
+    return {recipe_id: sorted(values) for recipe_id, values in features.items()}
+
+
+def _feature_rows(connection, recipe_ids=None, public_only=True):
+    """
+    Read the category and ingredient name IDs of the public recipes, or of the given recipes.
+    """
+    stmt = (
+        db.select(Recipe.recipe_id, Recipe.category_id, Ingredient.ingredient_name_id)
+        .outerjoin(Ingredient, Ingredient.recipe_id == Recipe.recipe_id)
+    )
+    if public_only:
+        stmt = stmt.where(Recipe.is_public.is_(True))
+    if recipe_ids is not None:
+        stmt = stmt.where(Recipe.recipe_id.in_(recipe_ids))
+    return connection.execute(stmt)
+
+
+def signature(features):
+    """
+    Compute the MinHash signature of a feature set.
+
+    Args:
+        features (list): The integer features of a recipe.
+
+    Returns:
+        ndarray: The signature, SIGNATURE_SIZE unsigned 32-bit integers.
+    """
+    if not features:
+        return np.full(SIGNATURE_SIZE, PRIME, dtype=np.uint32)
+    values = np.asarray(features, dtype=np.int64)
+    hashes = (HASH_A[:, None] * values[None, :] + HASH_B[:, None]) % PRIME
+    return hashes.min(axis=1).astype(np.uint32)
+
+
+def _signatures(features):
+    """
+    Compute the signatures of many recipes at once, in chunks to bound memory use.
+
+    Args:
+        features (dict): Recipe ID -> list of integer features.
+
+    Returns:
+        tuple: The recipe IDs (ndarray) and their signatures (ndarray of shape (n, SIGNATURE_SIZE)).
+    """
+    recipe_ids = np.fromiter(features, dtype=np.int64, count=len(features))
+    signatures = np.full((len(recipe_ids), SIGNATURE_SIZE), PRIME, dtype=np.uint32)
+    chunk = 4096
+    for start in range(0, len(recipe_ids), chunk):
+        ids = recipe_ids[start:start + chunk]
+        lengths = np.array([len(features[recipe_id]) for recipe_id in ids])
+        values = np.fromiter((value for recipe_id in ids for value in features[recipe_id]), dtype=np.int64, count=lengths.sum())
+        if not len(values):
+            continue
+        # Hash every feature of the chunk, then take the minimum over the features of each recipe
+        hashes = (HASH_A[:, None] * values[None, :] + HASH_B[:, None]) % PRIME
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        nonempty = lengths > 0
+        signatures[start:start + chunk][nonempty] = np.minimum.reduceat(hashes, offsets[nonempty], axis=1).T
+    return recipe_ids, signatures
+
+
+def build_index(app=None, force=False):
+    """
+    Build the signature file from the database, unless a valid one already exists. Registered
+    as a warmup hook, so it runs in an application context before the worker serves requests.
+
+    Args:
+        app (Flask): The Flask application (unused; part of the warmup hook signature).
+        force (bool): Whether to rebuild the file even if it already exists.
+    """
+    path = current_app.config['SIMILARITY_FILE']
+    if not force and _open(path) is not None:
+        return
+
+    with db.engine.connect() as connection:
+        features = _features(_feature_rows(connection))
+    recipe_ids, signatures = _signatures(features)
+
+    rows = int(recipe_ids.max()) + 1 if len(recipe_ids) else 1
+    array = np.zeros((max(rows, 1024), ROW_SIZE), dtype=np.uint32)
+    array[0, :2] = (MAGIC, SIGNATURE_SIZE)
+    array[recipe_ids, 0] = 1
+    array[recipe_ids, 1:] = signatures
+
+    # Write a new file and swap it in atomically; other workers remap it on their next lookup
+    temporary = f'{path}.{os.getpid()}.tmp'
+    array.tofile(temporary)
+    os.replace(temporary, path)
+    logger.info('Built similarity index of %d recipes in %s', len(recipe_ids), path)
+
+
+def _open(path):
+    """
+    Return the current mapping of the signature file, remapping it if another process replaced
+    or grew it. Returns None if the file is missing or was written with a different format.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    with _lock:
+        if _mapping['inode'] != stat.st_ino or _mapping['size'] != stat.st_size:
+            try:
+                array = np.memmap(path, dtype=np.uint32, mode='r+').reshape(-1, ROW_SIZE)
+            except ValueError:
+                # Empty or truncated file
+                return None
+            if array[0, 0] != MAGIC or array[0, 1] != SIGNATURE_SIZE:
+                return None
+            _mapping.update(array=array, inode=stat.st_ino, size=stat.st_size)
+        return _mapping['array']
+
+
+def _update_rows(recipe_ids):
+    """
+    Recompute the signatures of the given recipes and write them to the file in place.
+    Recipes that were deleted or made private are removed.
+    """
+    path = current_app.config['SIMILARITY_FILE']
+    if _open(path) is None:
+        return
+
+    # The session is finishing its commit, so read the committed rows with a separate connection
+    with db.engine.connect() as connection:
+        features = _features(_feature_rows(connection, recipe_ids))
+
+    with open(path, 'r+b') as file:
+        # Serialize writers of all processes, since growing the file must not lose their rows
+        fcntl.flock(file, fcntl.LOCK_EX)
+        array = _open(path)
+        needed = max(recipe_ids) + 1
+        if needed > len(array):
+            os.truncate(path, max(needed, len(array) * 2) * ROW_SIZE * 4)
+            array = _open(path)
+        for recipe_id in recipe_ids:
+            if recipe_id in features:
+                array[recipe_id, 1:] = signature(features[recipe_id])
+                array[recipe_id, 0] = 1
+            else:
+                array[recipe_id, 0] = 0
+        array.flush()
+
+
+def _on_data_changed(app, tables, recipe_ids=frozenset(), **_):
+    """
+    Update the signatures of the recipes written by a committed transaction.
+    """
+    if not tables & INDEXED_TABLES or app is None:
+        return
+    try:
+        if recipe_ids:
+            _update_rows(recipe_ids)
+        else:
+            build_index(force=True)
+    except Exception:  # pylint: disable=broad-except
+        # The write is already committed; a stale signature must not turn it into an error
+        logger.exception('Failed to update the similarity index')
+
+
+def similar(recipe_id, count):
+    """
+    Find the public recipes whose ingredients and cuisine are most similar to a recipe.
+
+    Args:
+        recipe_id (int): The ID of the recipe to compare (public or not).
+        count (int): The maximum number of recipes to return.
+
+    Returns:
+        list of tuple: (recipe ID, estimated Jaccard similarity) pairs, most similar first.
+            Recipes with no feature in common are left out.
+    """
+    path = current_app.config['SIMILARITY_FILE']
+    array = _open(path)
+    if array is None:
+        build_index()
+        array = _open(path)
+
+    # Compute the signature of the recipe from the database, so that private recipes work too
+    features = _features(_feature_rows(db.session, [recipe_id], public_only=False)).get(recipe_id, [])
+    if not features:
+        return []
+    target = signature(features)
+
+    present = np.flatnonzero(array[:, 0] == 1)
+    present = present[present != recipe_id]
+    if not len(present):
+        return []
+    scores = (array[present, 1:] == target).mean(axis=1)
+
+    # Select the best candidates without sorting all the recipes
+    top = np.argpartition(-scores, min(count, len(scores) - 1))[:count]
+    ranked = sorted(((int(present[i]), float(scores[i])) for i in top), key=lambda item: (-item[1], item[0]))
+    return [(candidate, score) for candidate, score in ranked if score > 0]
+
+
+def init_similarity(app):
+    """
+    Configure the similarity index, build it before the workers serve requests when it is
+    missing, and keep it up to date with the committed recipe writes.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    app.config.setdefault('SIMILARITY_FILE', 'similarity_index.u32')
+    if build_index not in warmup_hooks:
+        register_warmup(build_index)
+    data_changed.connect(_on_data_changed)
@@ -0,0 +1,192 @@
+"""
+This module records SQL statements that exceed the configured slow-query threshold, together
+with their redacted parameters, the originating route and a captured EXPLAIN plan, in
+rotating JSON-lines log files, one per process (the configured path suffixed with the process
+ID), so that gunicorn workers never rotate each other's files.
+"""
+
+# Import statements
+import glob
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from flask import request, has_request_context
+
+# Dedicated logger so slow queries are written to their own file
+logger = logging.getLogger('slow_queries')
+logger.propagate = False
+
+
+class ProcessRotatingFileHandler(RotatingFileHandler):
+    """
+    A RotatingFileHandler writing to a file of its own in each process, named after the
+    process ID. A handler created before the process forked (e.g. in the gunicorn master with
+    preload_app) switches to the file of the child process on its first record there.
+    """
+
+    def __init__(self, filename, **kwargs):
+        self.base_filename = filename
+        self.pid = os.getpid()
+        super().__init__(f'{filename}.{self.pid}', delay=True, **kwargs)
+
+    def emit(self, record):
+        """
+        Write a record to the file of the current process.
+        """
+        if os.getpid() != self.pid:
+            with self.lock:
+                if os.getpid() != self.pid:
+                    # Drop the parent's stream in this process without touching the parent's file
+                    if self.stream is not None:
+                        self.stream.close()
+                        self.stream = None
+                    self.pid = os.getpid()
+                    self.baseFilename = os.path.abspath(f'{self.base_filename}.{self.pid}')
+        super().emit(record)
+
+
+def redact_parameters(parameters):
+    """
+    Replace bound parameter values with their type names so that no user data
+    (emails, password hashes, free text) ends up in the log.
+
+    Args:
+        parameters (dict | tuple | list): The DBAPI parameters of the statement.
+
+    Returns:
+        dict | list: The parameters with every value replaced by a placeholder such as "<str>".
+    """
+    def placeholder(value):
+        return '<null>' if value is None else f'<{type(value).__name__}>'
+
+    if isinstance(parameters, dict):
+        return {key: placeholder(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [placeholder(value) for value in parameters]
+    return placeholder(parameters)
+
+
+def explain(conn, statement, parameters):
+    """
+    Capture the query plan of a SELECT statement without executing it.
+
+    The EXPLAIN runs on the raw DBAPI connection so that it does not trigger the engine
+    events again, and on PostgreSQL inside a savepoint so that a failure cannot abort
+    the transaction of the request.
+
+    Args:
+        conn (Connection): The SQLAlchemy connection that executed the statement.
+        statement (str): The SQL statement, as sent to the DBAPI.
+        parameters (dict | tuple): The DBAPI parameters of the statement.
+
+    Returns:
+        list: The lines of the query plan, or None if no plan could be captured.
+    """
+    if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+
+    dialect = conn.dialect.name
+    if dialect == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE off) '
+    elif dialect == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif dialect in ('mysql', 'mariadb'):
+        prefix = 'EXPLAIN '
+    else:
+        return None
+
+    cursor = conn.connection.cursor()
+    try:
+        if dialect == 'postgresql':
+            cursor.execute('SAVEPOINT slow_query_explain')
+        try:
+            cursor.execute(prefix + statement, parameters)
+            plan = [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+        except Exception:  # pylint: disable=broad-except
+            if dialect == 'postgresql':
+                cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            return None
+        if dialect == 'postgresql':
+            cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        return plan
+    finally:
+        cursor.close()
+
+
+def record_slow_query(conn, statement, parameters, elapsed, shape, executemany):
+    """
+    Write a slow statement to the slow query log.
+
+    Args:
+        conn (Connection): The SQLAlchemy connection that executed the statement.
+        statement (str): The SQL statement.
+        parameters (dict | tuple | list): The DBAPI parameters of the statement.
+        elapsed (float): The duration of the statement in seconds.
+        shape (str): The normalized statement shape, used to group statements in reports.
+        executemany (bool): Whether the statement was executed for many parameter sets.
+    """
+    if not logger.handlers:
+        return
+
+    entry = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'duration_ms': round(elapsed * 1000, 3),
+        'route': request.endpoint if has_request_context() else None,
+        'method': request.method if has_request_context() else None,
+        'path': request.path if has_request_context() else None,
+        'statement': statement,
+        'shape': shape,
+        'parameters': [redact_parameters(params) for params in parameters] if executemany else redact_parameters(parameters),
+        'plan': None if executemany else explain(conn, statement, parameters),
+    }
+    logger.warning(json.dumps(entry))
+
+
+def read_slow_queries(path):
+    """
+    Read the entries of the slow query logs of all processes, including their rotated backups.
+
+    Args:
+        path (str): The path of the slow query log, without the process ID suffix.
+
+    Returns:
+        list of dict: The logged slow statements, oldest first.
+    """
+    entries = []
+    for filename in glob.glob(f'{glob.escape(path)}*'):
+        with open(filename, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    entries.sort(key=lambda entry: entry.get('timestamp', ''))
+    return entries
+
+
+def init_slow_query_log(app):
+    """
+    Configure the rotating slow query log files of the application.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    app.config.setdefault('SLOW_QUERY_MS', 500)
+    app.config.setdefault('SLOW_QUERY_LOG', 'slow_queries.log')
+    app.config.setdefault('SLOW_QUERY_LOG_MAX_BYTES', 10 * 1024 * 1024)
+    app.config.setdefault('SLOW_QUERY_LOG_BACKUPS', 5)
+
+    if app.config['SLOW_QUERY_MS'] is None or logger.handlers:
+        return
+
+    handler = ProcessRotatingFileHandler(
+        app.config['SLOW_QUERY_LOG'],
+        maxBytes=app.config['SLOW_QUERY_LOG_MAX_BYTES'],
+        backupCount=app.config['SLOW_QUERY_LOG_BACKUPS'],
+        encoding='utf-8',
+    )
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.WARNING)
@@ -0,0 +1,322 @@
+"""
+This module exports the whole database to a snapshot file and imports it back, for backups
+and for moving data between databases (`flask db export` and `flask db import`).
+
+A snapshot is a gzip-compressed stream of MessagePack objects:
+
+    {"format": "recipe-api-snapshot", "version": 1, "created": ..., "tables": [names]}
+    {"table": name, "columns": [names]}      # then, for each chunk of rows of the table:
+    {"rows": n, "data": [[values of column 1], [values of column 2], ...]}
+    {"end": name, "rows": total}
+
+Rows are stored by column, a chunk at a time, so the values of a column (e.g. the small
+integers of a foreign key) sit next to each other and compress well, and neither side ever
+holds more than one chunk in memory. Dates are stored as day ordinals.
+
+Tables are written in dependency order with their primary keys, so an import restores the
+same IDs: on PostgreSQL the rows are loaded with COPY and the ID sequences are moved past the
+imported IDs; other databases use batched multi-row INSERTs. An import reads the file twice:
+once to validate it before anything is dropped, then to load it. On PostgreSQL the drop, create
+and load run in one transaction; SQLite's driver commits DDL on its own, so there only the
+validation guards the existing data.
+"""
+
+# Import statements
+import gzip
+import io
+import time
+from datetime import date
+import msgpack
+from sqlalchemy import Date, text
+from init import db
+from events import mark_changed
+
+SNAPSHOT_FORMAT = 'recipe-api-snapshot'
+SNAPSHOT_VERSION = 1
+
+
+def _encoders(table, columns):
+    """
+    Return the functions converting the values of each column to the snapshot representation
+    and back (dates as day ordinals, other values as they are).
+    """
+    encode, decode = [], []
+    for name in columns:
+        if isinstance(table.c[name].type, Date):
+            encode.append(lambda value: value.toordinal() if value is not None else None)
+            decode.append(lambda value: date.fromordinal(value) if value is not None else None)
+        else:
+            encode.append(None)
+            decode.append(None)
+    return encode, decode
+
+
+def export_snapshot(path, chunk_size=10000, level=6, progress=None):
+    """
+    Write every table of the database to a snapshot file.
+
+    The tables are read in a single transaction (REPEATABLE READ on PostgreSQL), so the
+    snapshot is consistent even while the application keeps writing, and with server-side
+    cursors, so memory use doesn't grow with the size of the tables.
+
+    Args:
+        path (str): The path of the snapshot file.
+        chunk_size (int): The number of rows per chunk.
+        level (int): The gzip compression level (1-9).
+        progress (callable): Called with the table name and its number of rows once it is written (optional).
+
+    Returns:
+        dict: Table name -> number of rows exported.
+    """
+    tables = db.metadata.sorted_tables
+    counts = {}
+    with db.engine.connect() as connection, gzip.open(path, 'wb', compresslevel=level) as file:
+        if connection.dialect.name == 'postgresql':
+            connection = connection.execution_options(isolation_level='REPEATABLE READ')
+        packer = msgpack.Packer(use_bin_type=True)
+        file.write(packer.pack({
+            'format': SNAPSHOT_FORMAT,
+            'version': SNAPSHOT_VERSION,
+            'created': date.today().isoformat(),
+            'tables': [table.name for table in tables],
+        }))
+
+        for table in tables:
+            columns = [column.name for column in table.columns]
+            encode, _ = _encoders(table, columns)
+            file.write(packer.pack({'table': table.name, 'columns': columns}))
+
+            total = 0
+            result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(
+                db.select(table).order_by(*table.primary_key.columns)
+            )
+            for rows in result.partitions():
+                # Transpose the chunk into one list of values per column
+                data = [list(values) for values in zip(*rows)]
+                for index, encoder in enumerate(encode):
+                    if encoder:
+                        data[index] = [encoder(value) for value in data[index]]
+                file.write(packer.pack({'rows': len(rows), 'data': data}))
+                total += len(rows)
+
+            file.write(packer.pack({'end': table.name, 'rows': total}))
+            counts[table.name] = total
+            if progress:
+                progress(table.name, total)
+    return counts
+
+
+def _copy_value(value):
+    """
+    Format a value for COPY ... FROM STDIN in PostgreSQL's text format.
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, str):
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    return str(value)
+
+
+def _copy_rows(connection, table, columns, data):
+    """
+    Load a chunk of rows into a PostgreSQL table with COPY.
+    """
+    buffer = io.StringIO()
+    for row in zip(*data):
+        buffer.write('\t'.join(_copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+
+    quote = connection.dialect.identifier_preparer.quote
+    statement = f"COPY {quote(table.name)} ({', '.join(quote(column) for column in columns)}) FROM STDIN"
+    with connection.connection.cursor() as cursor:
+        cursor.copy_expert(statement, buffer)
+
+
+def _reset_sequences(connection, tables):
+    """
+    Move the ID sequences of PostgreSQL tables past the imported IDs, so that new rows don't
+    collide with them.
+    """
+    for table in tables:
+        primary_key = list(table.primary_key.columns)
+        if len(primary_key) != 1 or not primary_key[0].autoincrement:
+            continue
+        column = primary_key[0].name
+        connection.execute(text(
+            f"SELECT setval(pg_get_serial_sequence(:table, :column), COALESCE(MAX({column}), 1), MAX({column}) IS NOT NULL) "
+            f"FROM {table.name}"
+        ), {'table': table.name, 'column': column})
+
+
+def _read_snapshot(path):
+    """
+    Open a snapshot file and read its header.
+
+    Returns:
+        tuple: The open gzip file, the MessagePack unpacker positioned after the header, and the header.
+
+    Raises:
+        ValueError: If the file isn't a snapshot of a supported version.
+    """
+    file = gzip.open(path, 'rb')
+    unpacker = msgpack.Unpacker(file, raw=False, max_buffer_size=0)
+    try:
+        header = next(unpacker, None)
+    except (OSError, EOFError, ValueError) as err:
+        file.close()
+        raise ValueError(f'{path} is not a snapshot file') from err
+    if not isinstance(header, dict) or header.get('format') != SNAPSHOT_FORMAT:
+        file.close()
+        raise ValueError(f'{path} is not a snapshot file')
+    if header.get('version') != SNAPSHOT_VERSION:
+        file.close()
+        raise ValueError(f"Unsupported snapshot version {header.get('version')}")
+    return file, unpacker, header
+
+
+def validate_snapshot(path):
+    """
+    Read a whole snapshot file and check its structure, without touching the database: the
+    tables exist in this application, every chunk has one list of values per column and as
+    many values as rows, and every table ends with its row count. Reading to the end also
+    verifies the gzip checksum.
+
+    Args:
+        path (str): The path of the snapshot file.
+
+    Returns:
+        dict: Table name -> number of rows in the snapshot.
+
+    Raises:
+        ValueError: If the file isn't a valid snapshot.
+    """
+    tables = {table.name for table in db.metadata.sorted_tables}
+    file, unpacker, header = _read_snapshot(path)
+    with file:
+        listed = header.get('tables')
+        if not isinstance(listed, list):
+            raise ValueError(f'{path} is corrupt: the header lists no tables')
+        unknown = set(listed) - tables
+        if unknown:
+            raise ValueError(f"Tables {', '.join(sorted(unknown))} of the snapshot don't exist in this application")
+
+        counts, table, columns = {}, None, None
+        try:
+            for item in unpacker:
+                if not isinstance(item, dict):
+                    raise ValueError('unexpected item')
+                if 'table' in item:
+                    table, columns = item['table'], item.get('columns')
+                    if table not in listed or table in counts or not isinstance(columns, list):
+                        raise ValueError(f'unexpected table {table}')
+                    counts[table] = 0
+                elif 'rows' in item and 'data' in item:
+                    data = item['data']
+                    if table is None or not isinstance(item['rows'], int) or not isinstance(data, list) \
+                            or len(data) != len(columns) \
+                            or any(not isinstance(values, list) or len(values) != item['rows'] for values in data):
+                        raise ValueError(f'malformed chunk in table {table}')
+                    counts[table] += item['rows']
+                elif 'end' in item:
+                    if item['end'] != table or item.get('rows') != counts[table]:
+                        raise ValueError(f'table {table} is truncated')
+                    table = None
+                else:
+                    raise ValueError('unexpected item')
+        except (OSError, EOFError, ValueError, msgpack.UnpackException) as err:
+            raise ValueError(f'{path} is corrupt: {err}') from err
+        if table is not None or set(counts) != set(listed):
+            raise ValueError(f'{path} is corrupt: the file ends before the last table')
+    return counts
+
+
+def import_snapshot(path, replace=False, progress=None):
+    """
+    Load a snapshot file into the database, preserving the IDs of the rows.
+
+    The whole file is validated first (see validate_snapshot), then the tables are dropped
+    (with replace), created and loaded on the same connection. On PostgreSQL this is a single
+    transaction, so a failure at any point leaves the database as it was.
+
+    Args:
+        path (str): The path of the snapshot file.
+        replace (bool): Whether to drop and recreate the tables first. Otherwise the tables are
+            created if they are missing and must be empty.
+        progress (callable): Called with the table name and its number of rows once it is loaded (optional).
+
+    Returns:
+        dict: Table name -> number of rows imported.
+
+    Raises:
+        ValueError: If the file isn't a valid snapshot, or a table to import into isn't empty.
+    """
+    # Check the whole file before touching the database
+    validate_snapshot(path)
+    tables = {table.name: table for table in db.metadata.sorted_tables}
+
+    connection = db.session.connection()
+    counts = {}
+    try:
+        if replace:
+            db.metadata.drop_all(bind=connection)
+        db.metadata.create_all(bind=connection)
+        if not replace:
+            for table in tables.values():
+                if connection.scalar(db.select(db.literal(1)).select_from(table).limit(1)):
+                    raise ValueError(f'Table {table.name} is not empty; use --replace to overwrite the database')
+
+        copy = connection.dialect.name == 'postgresql'
+        file, unpacker, _ = _read_snapshot(path)
+        with file:
+            table = columns = known = decode = None
+            for item in unpacker:
+                if 'table' in item:
+                    table = tables[item['table']]
+                    # Columns added since the export keep their defaults; removed ones are dropped
+                    columns = item['columns']
+                    known = [index for index, name in enumerate(columns) if name in table.c]
+                    columns = [columns[index] for index in known]
+                    _, decode = _encoders(table, columns)
+                    counts[table.name] = 0
+                elif 'rows' in item and 'data' in item:
+                    data = [item['data'][index] for index in known]
+                    for index, decoder in enumerate(decode):
+                        if decoder:
+                            data[index] = [decoder(value) for value in data[index]]
+                    if copy:
+                        _copy_rows(connection, table, columns, data)
+                    else:
+                        connection.execute(table.insert(), [dict(zip(columns, row)) for row in zip(*data)])
+                    counts[table.name] += item['rows']
+                elif 'end' in item and progress:
+                    progress(item['end'], counts.get(item['end'], 0))
+
+        if copy:
+            _reset_sequences(connection, tables.values())
+
+        # Tell the caches and indexes derived from the database that everything changed
+        mark_changed(db.session, counts.keys())
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+    return counts
+
+
+def throughput(counts, started):
+    """
+    Summarize the number of rows processed since a time.
+
+    Args:
+        counts (dict): Table name -> number of rows.
+        started (float): The start time, from time.perf_counter().
+
+    Returns:
+        tuple: The total number of rows, the elapsed seconds and the rows per second.
+    """
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    return total, elapsed, total / elapsed if elapsed else 0.0
@@ -0,0 +1,246 @@
+"""
+This module keeps an in-memory prefix index of the titles, ingredients and cuisines of the
+public recipes, to complete what users type in the search box without scanning the recipes
+table on every keystroke.
+
+The terms are kept in a sorted list, so the completions of a prefix are found with a binary
+search followed by a short scan; each term carries the number of public recipes using it,
+which ranks the completions and lets a term be removed when its last recipe goes. Titles are
+also indexed from each of their words, so "carb" completes to "Spaghetti Carbonara".
+
+Like the ingredient index (see ingredient_index.py), the index is built when a worker starts,
+updated incrementally with the recipes written in this worker, and rebuilt once it is older
+than SUGGEST_INDEX_MAX_AGE seconds to include the writes of other workers. At most
+SUGGEST_MAX_TERMS terms are kept, the most used ones when the index is built.
+"""
+
+# Import statements
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+from flask import current_app
+from init import db, register_warmup, warmup_hooks
+from events import data_changed
+from models.recipe import Recipe
+from models.category import Category
+from models.ingredient import Ingredient
+
+# Tables whose changes affect the index
+INDEXED_TABLES = {'recipes', 'ingredients'}
+
+# Kinds of terms, in the order they are listed when equally used
+TERM_KINDS = ('title', 'ingredient', 'cuisine')
+
+# Longest text kept for a term, to bound the memory used by long titles
+MAX_TERM_LENGTH = 100
+
+# Number of candidates examined per completion returned, before ranking them by use
+SCAN_FACTOR = 20
+
+# The index: the sorted terms, as (normalized text, kind, text) tuples, the number of public
+# recipes using each term, and the terms of each public recipe
+_index = {'terms': [], 'counts': Counter(), 'recipes': {}, 'built_at': None}
+
+# Recipes changed since the index was last updated, and whether the whole index must be rebuilt
+_pending = {'recipe_ids': set(), 'rebuild': False}
+
+_lock = threading.Lock()
+
+
+def normalize_term(text):
+    """
+    Normalize a text for prefix matching: lower-cased, trimmed and with single spaces.
+
+    Args:
+        text (str): The text as entered.
+
+    Returns:
+        str: The normalized text.
+    """
+    return ' '.join(text.split()).lower()
+
+
+def _terms(title, cuisine, ingredients):
+    """
+    Return the terms of a recipe: its title, indexed from each of its words, its cuisine and
+    its ingredients.
+
+    Returns:
+        frozenset: The (normalized text, kind, text) tuples of the recipe.
+    """
+    terms = set()
+    if title and title.strip():
+        text = ' '.join(title.split())[:MAX_TERM_LENGTH]
+        words = normalize_term(text).split(' ')
+        for start in range(len(words)):
+            terms.add((' '.join(words[start:]), 'title', text))
+    for kind, names in (('cuisine', (cuisine,)), ('ingredient', ingredients)):
+        for name in names:
+            if name and name.strip():
+                text = ' '.join(name.split())[:MAX_TERM_LENGTH]
+                terms.add((normalize_term(text), kind, text.lower() if kind == 'ingredient' else text))
+    return frozenset(terms)
+
+
+def _read_terms(recipe_ids=None):
+    """
+    Read the terms of the public recipes, or of the given recipes only.
+
+    Returns:
+        dict: Recipe ID -> frozenset of its terms.
+    """
+    recipe_stmt = (
+        db.select(Recipe.recipe_id, Recipe.title, Category.cuisine_name)
+        .outerjoin(Category, Category.category_id == Recipe.category_id)
+        .where(Recipe.is_public.is_(True))
+    )
+    ingredient_stmt = (
+        db.select(Ingredient.recipe_id, Ingredient.name)
+        .join(Recipe, Recipe.recipe_id == Ingredient.recipe_id)
+        .where(Recipe.is_public.is_(True))
+    )
+    if recipe_ids is not None:
+        recipe_stmt = recipe_stmt.where(Recipe.recipe_id.in_(recipe_ids))
+        ingredient_stmt = ingredient_stmt.where(Recipe.recipe_id.in_(recipe_ids))
+
+    ingredients = {}
+    for recipe_id, name in db.session.execute(ingredient_stmt):
+        ingredients.setdefault(recipe_id, []).append(name)
+    return {
+        recipe_id: _terms(title, cuisine, ingredients.get(recipe_id, ()))
+        for recipe_id, title, cuisine in db.session.execute(recipe_stmt)
+    }
+
+
+def build_index(app=None):
+    """
+    Build the whole index from the database. Registered as a warmup hook, so it runs in an
+    application context before the worker serves requests.
+
+    Args:
+        app (Flask): The Flask application (unused; part of the warmup hook signature).
+    """
+    recipes = _read_terms()
+    counts = Counter(term for terms in recipes.values() for term in terms)
+
+    # Keep the most used terms when there are too many
+    max_terms = current_app.config['SUGGEST_MAX_TERMS']
+    if len(counts) > max_terms:
+        counts = Counter(dict(counts.most_common(max_terms)))
+        recipes = {recipe_id: frozenset(term for term in terms if term in counts) for recipe_id, terms in recipes.items()}
+
+    with _lock:
+        _index.update(terms=sorted(counts), counts=counts, recipes=recipes, built_at=time.monotonic())
+
+
+def _update_recipes(recipe_ids):
+    """
+    Re-read the given recipes and replace their terms in the index. Recipes that were deleted
+    or made private are removed, and so are the terms no public recipe uses anymore.
+    """
+    current = _read_terms(recipe_ids)
+    max_terms = current_app.config['SUGGEST_MAX_TERMS']
+    with _lock:
+        terms, counts, recipes = _index['terms'], _index['counts'], _index['recipes']
+        for recipe_id in recipe_ids:
+            for term in recipes.pop(recipe_id, ()):
+                counts[term] -= 1
+                if counts[term] <= 0:
+                    del counts[term]
+                    del terms[bisect_left(terms, term)]
+            if recipe_id not in current:
+                continue
+            kept = []
+            for term in current[recipe_id]:
+                if term not in counts:
+                    # New terms are left out once the index is full, until the next rebuild
+                    if len(terms) >= max_terms:
+                        continue
+                    insort(terms, term)
+                counts[term] += 1
+                kept.append(term)
+            recipes[recipe_id] = frozenset(kept)
+
+
+def refresh_index():
+    """
+    Bring the index up to date before a lookup: build it if it was never built or is too old
+    to include the writes of other workers, otherwise apply the changes committed in this worker.
+    """
+    max_age = current_app.config['SUGGEST_INDEX_MAX_AGE']
+    with _lock:
+        rebuild = (
+            _pending['rebuild']
+            or _index['built_at'] is None
+            or time.monotonic() - _index['built_at'] > max_age
+        )
+        recipe_ids = _pending['recipe_ids']
+        _pending.update(recipe_ids=set(), rebuild=False)
+
+    if rebuild:
+        build_index()
+    elif recipe_ids:
+        _update_recipes(recipe_ids)
+
+
+def _record_changes(app, tables, recipe_ids=frozenset(), **_):
+    """
+    Remember which recipes changed, so that the next lookup re-reads them. The database
+    can't be queried here, because the signal is sent while the session finishes its commit.
+    """
+    if not tables & INDEXED_TABLES:
+        return
+    with _lock:
+        if recipe_ids:
+            _pending['recipe_ids'].update(recipe_ids)
+        else:
+            _pending['rebuild'] = True
+
+
+def suggest(prefix, limit=10):
+    """
+    Complete a prefix with the titles, ingredients and cuisines of the public recipes.
+
+    Args:
+        prefix (str): The text typed so far.
+        limit (int): The maximum number of completions.
+
+    Returns:
+        list of dict: The completions, each with its text, its kind ('title', 'ingredient' or
+            'cuisine') and the number of public recipes using it, most used first.
+    """
+    refresh_index()
+    prefix = normalize_term(prefix)
+    if not prefix:
+        return []
+
+    with _lock:
+        terms, counts = _index['terms'], _index['counts']
+        # Examine a bounded number of the terms starting with the prefix, in sorted order
+        candidates = {}
+        position = bisect_left(terms, (prefix,))
+        for term in terms[position:position + limit * SCAN_FACTOR]:
+            if not term[0].startswith(prefix):
+                break
+            # A title matched from several of its words is listed once
+            _, kind, text = term
+            candidates[(kind, text)] = max(candidates.get((kind, text), 0), counts[term])
+
+    ranked = sorted(candidates.items(), key=lambda item: (-item[1], TERM_KINDS.index(item[0][0]), item[0][1]))
+    return [{'text': text, 'type': kind, 'recipes': count} for (kind, text), count in ranked[:limit]]
+
+
+def init_suggest_index(app):
+    """
+    Configure the prefix index, build it before each worker serves requests and keep it up
+    to date with the changes committed in this worker.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    app.config.setdefault('SUGGEST_INDEX_MAX_AGE', 300)
+    app.config.setdefault('SUGGEST_MAX_TERMS', 200000)
+    if build_index not in warmup_hooks:
+        register_warmup(build_index)
+    data_changed.connect(_record_changes)
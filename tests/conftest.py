@@ -0,0 +1,72 @@
+"""
+Fixtures of the test suite.
+
+The tests run one application, like a worker, on a temporary SQLite database seeded once with
+`flask db create`. Before each test the database is restored from a snapshot of the seed data,
+which also tells the caches, indexes and statistics that every table changed.
+"""
+
+# Import statements
+import pytest
+from app import create_app
+from init import warmup
+from snapshot import export_snapshot, import_snapshot
+
+# Passwords of the users created by `flask db create`
+PASSWORDS = {
+    'admin@example.com': 'password_admin',
+    'user_1_@example.com': 'password_user1',
+    'user_2_@example.com': 'password_user2',
+}
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """
+    The application, on a seeded temporary database, with the files it writes kept in a
+    temporary directory.
+    """
+    directory = tmp_path_factory.mktemp('recipe-api')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv('DB_URI', f"sqlite:///{directory / 'recipes.db'}")
+        monkeypatch.setenv('JWT_KEY', 'test-secret')
+        monkeypatch.setenv('SLOW_QUERY_LOG', str(directory / 'slow_queries.log'))
+        monkeypatch.setenv('PROFILE_DIR', str(directory / 'profiles'))
+        monkeypatch.setenv('SIMILARITY_FILE', str(directory / 'similarity_index.u32'))
+        # Rebuild the statistics only when a test changes the data, so the incremental updates are tested
+        monkeypatch.setenv('STATS_MAX_AGE', '3600')
+        app = create_app()
+    app.testing = True
+
+    result = app.test_cli_runner().invoke(args=['db', 'create'])
+    assert result.exit_code == 0, result.output
+    app.config['SEED_SNAPSHOT'] = str(directory / 'seed.snapshot')
+    with app.app_context():
+        export_snapshot(app.config['SEED_SNAPSHOT'])
+    warmup(app, connections=False)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """
+    A test client, on a database holding the seed data.
+    """
+    with app.app_context():
+        import_snapshot(app.config['SEED_SNAPSHOT'], replace=True)
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """
+    Log in one of the seeded users.
+
+    Returns:
+        callable: Takes the email of the user and returns the Authorization header of its requests.
+    """
+    def login(email):
+        response = client.post('/users/login', json={'email': email, 'password': PASSWORDS[email]})
+        assert response.status_code == 200, response.json
+        return {'Authorization': f"Bearer {response.json['token']}"}
+    return login
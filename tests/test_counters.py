@@ -0,0 +1,97 @@
+"""
+Tests that the recipe counters of users and categories and the /stats aggregates, which are
+maintained incrementally on every write, match a full recount after each kind of write.
+"""
+
+# Import statements
+import pytest
+from init import db
+from models.recipe import Recipe
+from models.user import User
+from models.category import Category
+from recipe_stats import build_stats, summary
+
+ADMIN = 'admin@example.com'
+USER_1 = 'user_1_@example.com'
+USER_2 = 'user_2_@example.com'
+
+
+def assert_counts_match(app):
+    """
+    Check the recipe counters and the statistics against GROUP BY queries on the recipes table.
+    """
+    with app.app_context():
+        for model, key, foreign_key in ((User, User.user_id, Recipe.user_id), (Category, Category.category_id, Recipe.category_id)):
+            expected = {row[0]: (row[1], row[2]) for row in db.session.execute(
+                db.select(foreign_key, db.func.count(), db.func.count(db.case((Recipe.is_public.is_(True), 1))))
+                .where(foreign_key.is_not(None))
+                .group_by(foreign_key)
+            )}
+            counters = {row[0]: (row[1], row[2]) for row in db.session.execute(
+                db.select(key, model.recipe_count, model.public_recipe_count)
+            )}
+            assert counters == {row_key: expected.get(row_key, (0, 0)) for row_key in counters}
+
+        incremental = summary()
+        build_stats()
+        assert incremental == summary()
+
+
+def test_seed_counts(app, client):
+    assert_counts_match(app)
+
+
+def test_create(app, client, login):
+    headers = login(USER_1)
+    for title, is_public in (('Tostadas', True), ('Churros', False)):
+        response = client.post('/recipes/', json={
+            'title': title, 'is_public': is_public, 'preparation_time': 30, 'category': {'cuisine_name': 'Mexican'},
+        }, headers=headers)
+        assert response.status_code == 201
+    assert_counts_match(app)
+
+
+@pytest.mark.parametrize('changes', [
+    {'is_public': False},
+    {'category': {'cuisine_name': 'Italian'}},
+    {'category': {'cuisine_name': 'Japanese'}, 'is_public': False, 'preparation_time': 5},
+])
+def test_update(app, client, login, changes):
+    response = client.patch('/recipes/3', json=changes, headers=login(USER_1))
+    assert response.status_code == 200
+    assert_counts_match(app)
+
+
+def test_delete(app, client, login):
+    assert client.delete('/recipes/2', headers=login(USER_1)).status_code == 200
+    assert client.delete('/recipes/4', headers=login(ADMIN)).status_code == 200
+    assert_counts_match(app)
+
+
+@pytest.mark.parametrize('body', [{}, {'is_public': True}])
+def test_fork(app, client, login, body):
+    assert client.post('/recipes/1/fork', json=body, headers=login(USER_2)).status_code == 201
+    assert_counts_match(app)
+
+
+@pytest.mark.parametrize('email, body', [
+    (USER_2, {'ids': [4, 5], 'set': {'is_public': False}}),
+    (USER_2, {'filter': {'is_public': True}, 'set': {'category': {'cuisine_name': 'Thai'}}}),
+    (ADMIN, {'filter': {'cuisine_name': 'Italian'}, 'set': {'is_public': False, 'category': {'cuisine_name': 'Mexican'}}}),
+])
+def test_bulk_update(app, client, login, email, body):
+    response = client.patch('/recipes/bulk', json=body, headers=login(email))
+    assert response.status_code == 200
+    assert response.json['updated']
+    assert_counts_match(app)
+
+
+def test_writes_after_the_statistics_are_read(app, client, login):
+    # Read the statistics first, so the writes below are applied to built counters
+    assert_counts_match(app)
+    headers = login(USER_2)
+    assert client.patch('/recipes/4', json={'is_public': False}, headers=headers).status_code == 200
+    assert client.post('/recipes/4/fork', headers=headers).status_code == 201
+    assert client.patch('/recipes/bulk', json={'ids': [5], 'set': {'is_public': False}}, headers=headers).status_code == 200
+    assert client.delete('/recipes/5', headers=headers).status_code == 200
+    assert_counts_match(app)
@@ -0,0 +1,132 @@
+"""
+Tests of the recipe routes.
+"""
+
+# Import statements
+import pytest
+
+ADMIN = 'admin@example.com'
+USER_1 = 'user_1_@example.com'
+USER_2 = 'user_2_@example.com'
+
+
+def test_public_recipes_are_listed_by_id(client):
+    response = client.get('/recipes/public')
+    assert response.status_code == 200
+    assert [recipe['recipe_id'] for recipe in response.json] == [1, 3, 4, 5]
+    assert all(recipe['is_public'] for recipe in response.json)
+
+
+def test_recipes_leave_out_the_counters_of_their_user_and_category(client, login):
+    recipe = client.get('/recipes/3', headers=login(USER_1)).json
+    assert set(recipe['user']) == {'user_id', 'email', 'name', 'is_admin'}
+    assert set(recipe['category']) == {'category_id', 'cuisine_name'}
+
+
+@pytest.mark.parametrize('email, status', [(USER_1, 200), (USER_2, 403), (ADMIN, 200)])
+def test_private_recipe_is_only_returned_to_its_author_and_admins(client, login, email, status):
+    assert client.get('/recipes/2', headers=login(email)).status_code == status
+
+
+def test_batch_returns_recipes_with_errors(client, login):
+    response = client.post('/recipes/batch', json={'ids': [4, 2, 99, 4]}, headers=login(USER_2))
+    assert response.status_code == 200
+    assert list(response.json['recipes']) == ['4']
+    assert response.json['errors'] == {
+        '2': {'error': 'You are not authorized to access this resource', 'status': 403},
+        '99': {'error': 'Recipe not found.', 'status': 404},
+    }
+
+
+def test_batch_parses_the_query_string(client, login):
+    response = client.get('/recipes/batch?ids=3,1', headers=login(USER_1))
+    assert sorted(response.json['recipes']) == ['1', '3']
+
+
+@pytest.mark.parametrize('ids', [[1.5], ['3'], [True], 'abc', []])
+def test_batch_rejects_invalid_json_ids(client, login, ids):
+    assert client.post('/recipes/batch', json={'ids': ids}, headers=login(USER_1)).status_code == 400
+
+
+def test_filter_without_matches(client):
+    # The plain list keeps its 404; the paginated form returns an empty page
+    assert client.get('/recipes/public/filter?title=nothing').status_code == 404
+    response = client.get('/recipes/public/filter?title=nothing&page=1')
+    assert response.status_code == 200
+    assert response.json['recipes'] == [] and response.json['total'] == 0
+
+
+def test_create_recipe(client, login):
+    headers = login(USER_1)
+    response = client.post('/recipes/', json={
+        'title': 'Pancit',
+        'preparation_time': 40,
+        'category': {'cuisine_name': 'Filipino'},
+        'ingredients': [{'name': 'Noodles', 'quantity': '200g'}],
+        'instructions': [{'step_number': 1, 'task': 'Boil the noodles.'}],
+    }, headers=headers)
+    assert response.status_code == 201
+    recipe = client.get(f"/recipes/{response.json['recipe_id']}", headers=headers).json
+    assert recipe['is_public'] is True
+    assert recipe['category']['cuisine_name'] == 'Filipino'
+    assert [ingredient['name'] for ingredient in recipe['ingredients']] == ['Noodles']
+
+
+def test_only_the_author_updates_a_recipe(client, login):
+    assert client.patch('/recipes/3', json={'is_public': False}, headers=login(USER_2)).status_code == 403
+    response = client.patch('/recipes/3', json={'is_public': False}, headers=login(USER_1))
+    assert response.status_code == 200
+    assert response.json['is_public'] is False
+
+
+def test_delete_recipe(client, login):
+    headers = login(USER_1)
+    assert client.delete('/recipes/3', headers=headers).status_code == 200
+    assert client.get('/recipes/3', headers=headers).status_code == 404
+
+
+def test_fork_copies_the_recipe_as_a_private_recipe(client, login):
+    headers = login(USER_2)
+    source = client.get('/recipes/3', headers=login(ADMIN)).json
+    response = client.post('/recipes/3/fork', headers=headers)
+    assert response.status_code == 201
+    fork = response.json
+    assert fork['title'] == f"{source['title']} (fork)"
+    assert fork['is_public'] is False
+    assert fork['user']['user_id'] == 3
+    assert [ingredient['name'] for ingredient in fork['ingredients']] == [ingredient['name'] for ingredient in source['ingredients']]
+    assert client.post('/recipes/3/fork', headers=headers).json['title'] == f"{source['title']} (fork 2)"
+
+
+def test_fork_of_a_private_recipe_is_forbidden(client, login):
+    assert client.post('/recipes/2/fork', headers=login(USER_2)).status_code == 403
+
+
+def test_bulk_update_by_ids(client, login):
+    response = client.patch('/recipes/bulk', json={'ids': [4, 5], 'set': {'is_public': False}}, headers=login(USER_2))
+    assert response.status_code == 200
+    assert response.json == {'matched': 2, 'updated': 2, 'recipe_ids': [4, 5]}
+    assert [recipe['recipe_id'] for recipe in client.get('/recipes/public').json] == [1, 3]
+
+
+def test_bulk_update_requires_the_author(client, login):
+    response = client.patch('/recipes/bulk', json={'ids': [3, 4], 'set': {'is_public': False}}, headers=login(USER_2))
+    assert response.status_code == 403
+    assert response.json['recipe_ids'] == [3]
+
+
+def test_reorder_instructions(client, login):
+    headers = login(USER_1)
+    instructions = client.get('/recipes/3', headers=headers).json['instructions']
+    order = [instruction['instruction_id'] for instruction in reversed(instructions)]
+    response = client.post('/recipes/3/instructions/reorder', json={'order': order}, headers=headers)
+    assert response.status_code == 200
+    assert [instruction['instruction_id'] for instruction in response.json] == order
+    assert [instruction['step_number'] for instruction in response.json] == list(range(1, len(order) + 1))
+    assert [instruction['instruction_id'] for instruction in client.get('/recipes/3', headers=headers).json['instructions']] == order
+
+
+def test_random_public_recipe(client):
+    response = client.get('/recipes/public/random')
+    assert response.status_code == 200
+    assert response.json['recipe_id'] in (1, 3, 4, 5)
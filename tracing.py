@@ -0,0 +1,268 @@
+"""
+This module records per-request traces made of spans for JWT verification (see
+auth.jwt_required), SQL statements, schema load/dump, password hashing and response
+encoding. Trace IDs are taken from an incoming W3C traceparent header when present, and
+finished traces are appended to TRACE_FILE in the OpenTelemetry (OTLP/JSON) format, one
+export request per line.
+"""
+
+# Import statements
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, request, has_request_context, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from instrumentation import normalize_statement
+
+# Incoming trace context header (https://www.w3.org/TR/trace-context/)
+TRACEPARENT_PATTERN = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+SERVICE_NAME = 'flask-recipe-api'
+
+_export_lock = threading.Lock()
+
+
+class Span:
+    """
+    A timed operation within a trace.
+
+    Attributes:
+        name (str): The name of the operation.
+        span_id (str): The 16 hex digit ID of the span.
+        parent_id (str): The ID of the parent span, or None for the root span.
+        kind (int): The OTLP span kind.
+        attributes (dict): Additional key/value information about the operation.
+    """
+    def __init__(self, name, parent_id, kind=SPAN_KIND_INTERNAL, attributes=None):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.status = STATUS_OK
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def to_otlp(self, trace_id):
+        """
+        Convert the span to its OTLP/JSON representation.
+        """
+        otlp = {
+            'traceId': trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or time.time_ns()),
+            'attributes': [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': self.status},
+        }
+        if self.parent_id:
+            otlp['parentSpanId'] = self.parent_id
+        return otlp
+
+
+def _otlp_attribute(key, value):
+    """
+    Convert a key/value pair to an OTLP attribute.
+    """
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+def _active_trace():
+    """
+    Return the trace of the current request, or None if the request is not traced.
+    """
+    if not has_request_context():
+        return None
+    return g.get('trace')
+
+
+def start_span(name, kind=SPAN_KIND_INTERNAL, **attributes):
+    """
+    Start a span as a child of the innermost open span of the current request.
+
+    Args:
+        name (str): The name of the operation.
+        kind (int): The OTLP span kind.
+        **attributes: Additional information recorded on the span.
+
+    Returns:
+        Span: The started span, or None if the current request is not traced.
+    """
+    trace = _active_trace()
+    if trace is None:
+        return None
+    stack = trace['stack']
+    new_span = Span(name, stack[-1].span_id if stack else trace['parent_id'], kind, attributes)
+    stack.append(new_span)
+    trace['spans'].append(new_span)
+    return new_span
+
+
+def end_span(finished, error=None):
+    """
+    End a span started with start_span.
+
+    Args:
+        finished (Span): The span to end (None is ignored).
+        error (Exception): The exception that ended the operation, if any.
+    """
+    if finished is None:
+        return
+    finished.end_ns = time.time_ns()
+    if error is not None:
+        finished.status = STATUS_ERROR
+        finished.attributes['exception.type'] = type(error).__name__
+    trace = _active_trace()
+    if trace is not None and finished in trace['stack']:
+        trace['stack'].remove(finished)
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Context manager that records the enclosed block as a span of the current request.
+    Does nothing when the request is not traced.
+
+    Args:
+        name (str): The name of the operation.
+        **attributes: Additional information recorded on the span.
+    """
+    started = start_span(name, **attributes)
+    try:
+        yield started
+    except Exception as err:
+        end_span(started, err)
+        raise
+    end_span(started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """
+    Start a span for the SQL statement. The statement shape is recorded rather than the
+    statement itself so that no literal values end up in the trace file.
+    """
+    if context is None:
+        return
+    context.trace_span = start_span(
+        'sql ' + statement.lstrip().split(None, 1)[0].upper(),
+        SPAN_KIND_CLIENT,
+        **{'db.system': conn.dialect.name, 'db.statement': normalize_statement(statement)}
+    )
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """
+    End the span of the SQL statement.
+    """
+    end_span(getattr(context, 'trace_span', None))
+
+
+def _handle_error(exception_context):
+    """
+    End the span of a SQL statement that failed.
+    """
+    context = exception_context.execution_context
+    end_span(getattr(context, 'trace_span', None), exception_context.original_exception)
+
+
+def _start_trace():
+    """
+    Start tracing the current request, continuing the trace of an incoming traceparent header.
+    """
+    match = TRACEPARENT_PATTERN.match(request.headers.get('traceparent', ''))
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        sampled = int(flags, 16) & 1
+    else:
+        trace_id, parent_id = os.urandom(16).hex(), None
+        sampled = random.random() < current_app.config['TRACE_SAMPLE_RATE']
+    if not sampled:
+        return
+
+    g.trace = {'trace_id': trace_id, 'parent_id': parent_id, 'spans': [], 'stack': []}
+    route = request.url_rule.rule if request.url_rule else request.path
+    g.trace_root = start_span(
+        f'{request.method} {route}',
+        SPAN_KIND_SERVER,
+        **{'http.method': request.method, 'http.route': route, 'http.target': request.path}
+    )
+
+
+def _add_trace_header(response):
+    """
+    Return the trace ID to the client and record the response status on the root span.
+    """
+    trace = g.get('trace')
+    if trace is not None:
+        response.headers['traceparent'] = f"00-{trace['trace_id']}-{g.trace_root.span_id}-01"
+        g.trace_root.attributes['http.status_code'] = response.status_code
+        if response.status_code >= 500:
+            g.trace_root.status = STATUS_ERROR
+    return response
+
+
+def _export_trace(error):
+    """
+    End the root span and append the finished trace to the trace file.
+    """
+    trace = g.pop('trace', None)
+    if trace is None:
+        return
+    end_span(g.pop('trace_root'), error)
+
+    export = {
+        'resourceSpans': [{
+            'resource': {'attributes': [_otlp_attribute('service.name', SERVICE_NAME),
+                                        _otlp_attribute('process.pid', os.getpid())]},
+            'scopeSpans': [{
+                'scope': {'name': __name__},
+                'spans': [finished.to_otlp(trace['trace_id']) for finished in trace['spans']],
+            }],
+        }]
+    }
+    line = json.dumps(export, separators=(',', ':'))
+    with _export_lock:
+        with open(current_app.config['TRACE_FILE'], 'a', encoding='utf-8') as file:
+            file.write(line + '\n')
+
+
+def init_tracing(app):
+    """
+    Enable request tracing when TRACE_FILE is configured.
+
+    Args:
+        app (Flask): The Flask application.
+    """
+    app.config.setdefault('TRACE_FILE', None)
+    app.config.setdefault('TRACE_SAMPLE_RATE', 1.0)
+    if not app.config['TRACE_FILE']:
+        return
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    app.before_request(_start_trace)
+    app.after_request(_add_trace_header)
+    app.teardown_request(_export_trace)